@@ -0,0 +1,454 @@
+"""Load test for the web app.
+
+Builds a throwaway copy of the databases filled with generated data, boots
+web_app against it and drives a weighted mix of traffic (login, patient list,
+stay entry through confirm_stay, item entry, shift entry, salary and company
+report) from many threads, optionally across several forked processes. Reports
+throughput, p50/p95/p99 latency, error and 'database is locked' counts per route.
+A write counts as an error when it answers with an error status or redirects
+with an error flash message, as the app does for writes that failed.
+
+    python loadtest.py --threads 8 --duration 30
+    python loadtest.py --processes 4 --threads 4 --patients 500 --json results.json
+"""
+import argparse
+import configparser
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# scenario name -> weight in the traffic mix
+TRAFFIC_MIX = {
+    'login': 5,
+    'patient_list': 20,
+    'stay_entry': 10,
+    'item_entry': 15,
+    'shift_entry': 15,
+    'salary': 10,
+    'company_report': 5,
+}
+
+# Flash messages the app shows when a form submission failed
+ERROR_FLASH_PREFIXES = ("Error", "Invalid", "Please", "Could not", "Failed")
+
+_request_outcome = threading.local()
+
+
+def track_lock_errors(app):
+    """Remember how many 'database is locked' errors each request hit, for the thread that sent it"""
+    from web_app.instrumentation import current_recorder
+
+    @app.after_request
+    def note_lock_errors(response):
+        recorder = current_recorder()
+        _request_outcome.lock_errors = recorder.lock_errors if recorder else 0
+        return response
+
+
+def prepare_workdir(workdir, config_path):
+    """Copy the config into a scratch directory and point the app at it"""
+    os.makedirs(os.path.join(workdir, 'Config'), exist_ok=True)
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if not config.has_section('WEB'):
+        config.add_section('WEB')
+    config.set('WEB', 'secret_key', 'loadtest')
+    if not config.has_section('DEBUG'):
+        config.add_section('DEBUG')
+    # Debug mode logs everyone in as admin; the load test logs in for real
+    config.set('DEBUG', 'debugmode', 'false')
+    if not config.has_section('METRICS'):
+        config.add_section('METRICS')
+    config.set('METRICS', 'enabled', 'true')
+    with open(os.path.join(workdir, 'Config', 'config.ini'), 'w') as f:
+        config.write(f)
+
+
+def generate_dataset(patients, doctors, nurses, days, seed):
+    """Fill the scratch databases with patients, staff, stays, items and shifts"""
+    from modules.utils import setup_database
+    from modules.auth import AuthModule
+
+    setup_database()
+    AuthModule()
+    rng = random.Random(seed)
+    start = datetime.now().date() - timedelta(days=days)
+
+    conn = sqlite3.connect("db/items.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM equipment")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("INSERT INTO equipment (name, daily_rental_price) VALUES (?, ?)",
+                           [("Ventilator", 300.0), ("Monitor", 80.0), ("Infusion Pump", 40.0), ("Oxygen Concentrator", 60.0)])
+        cursor.execute("SELECT id FROM care_levels")
+        care_level_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT id FROM equipment")
+        equipment_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany("INSERT OR IGNORE INTO care_level_equipment (care_level_id, equipment_id) VALUES (?, ?)",
+                           [(care_level_id, equipment_id) for care_level_id in care_level_ids
+                            for equipment_id in rng.sample(equipment_ids, 2)])
+    conn.commit()
+    cursor.execute("SELECT id, category, price FROM items")
+    items = cursor.fetchall()
+    cursor.execute("SELECT id FROM care_levels")
+    care_level_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+
+    conn = sqlite3.connect("db/interventions.db")
+    intervention_ids = [row[0] for row in conn.execute("SELECT id FROM interventions")]
+    conn.close()
+
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO patients (name, admission_date) VALUES (?, ?)",
+                       [(f"Patient {i}", start.strftime("%Y-%m-%d")) for i in range(1, patients + 1)])
+    patient_ids = [row[0] for row in cursor.execute("SELECT id FROM patients")]
+    stays = []
+    category_rows = defaultdict(list)
+    for patient_id in patient_ids:
+        for day in range(days):
+            date = (start + timedelta(days=day)).strftime("%Y-%m-%d")
+            stays.append((patient_id, date, rng.choice(care_level_ids)))
+            item_id, category, price = rng.choice(items)
+            quantity = rng.randint(1, 3)
+            category_rows[category].append((patient_id, date, item_id, quantity, price, quantity * price))
+    cursor.executemany("INSERT INTO patient_stays (patient_id, stay_date, care_level_id) VALUES (?, ?, ?)", stays)
+    for category, rows in category_rows.items():
+        cursor.executemany(f"INSERT INTO patient_{category} (patient_id, date, item_id, quantity, unit_price, line_total) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+    def shifts_for(staff_ids):
+        shifts = []
+        interventions = []
+        for staff_id in staff_ids:
+            for day in range(days):
+                if rng.random() < 0.6:
+                    arrival = datetime.combine(start + timedelta(days=day), datetime.min.time()) + timedelta(hours=rng.choice([0, 8, 16]))
+                    patient_id = rng.choice(patient_ids)
+                    shifts.append((staff_id, patient_id, arrival.strftime("%Y-%m-%d %H:%M:%S"),
+                                   (arrival + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")))
+                    if rng.random() < 0.2:
+                        interventions.append((staff_id, patient_id, arrival.strftime("%Y-%m-%d"), rng.choice(intervention_ids)))
+        return shifts, interventions
+
+    conn = sqlite3.connect("db/doctors.db")
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO doctors (name, hourly_rate) VALUES (?, ?)",
+                       [(f"Doctor {i}", rng.choice([90.0, 100.0, 120.0])) for i in range(1, doctors + 1)])
+    doctor_ids = [row[0] for row in cursor.execute("SELECT id FROM doctors")]
+    shifts, interventions = shifts_for(doctor_ids)
+    cursor.executemany("""
+        INSERT INTO doctor_shifts (doctor_id, patient_id, arrival_datetime, leave_datetime, arrival_ts, leave_ts)
+        VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?3) AS INTEGER), CAST(strftime('%s', ?4) AS INTEGER))
+    """, shifts)
+    cursor.executemany("INSERT INTO doctor_interventions (doctor_id, patient_id, date, intervention_id) VALUES (?, ?, ?, ?)", interventions)
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect("db/nurses.db")
+    cursor = conn.cursor()
+    levels = cursor.execute("SELECT id, level_name, hourly_rate FROM nurse_levels").fetchall()
+    nurse_rows = []
+    for i in range(1, nurses + 1):
+        level = rng.choice(levels)
+        nurse_rows.append((f"Nurse {i}", level[1], level[2]))
+    cursor.executemany("INSERT INTO nurses (name, level, hourly_rate) VALUES (?, ?, ?)", nurse_rows)
+    nurse_ids = [row[0] for row in cursor.execute("SELECT id FROM nurses")]
+    shifts, interventions = shifts_for(nurse_ids)
+    cursor.executemany("""
+        INSERT INTO nurse_shifts (nurse_id, patient_id, arrival_datetime, leave_datetime, arrival_ts, leave_ts)
+        VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?3) AS INTEGER), CAST(strftime('%s', ?4) AS INTEGER))
+    """, shifts)
+    cursor.executemany("INSERT INTO nurse_interventions (nurse_id, patient_id, date, intervention_id) VALUES (?, ?, ?, ?)", interventions)
+    conn.commit()
+    conn.close()
+
+    return {
+        'patient_ids': patient_ids,
+        'doctor_ids': doctor_ids,
+        'nurse_ids': nurse_ids,
+        'nurse_level_ids': [level[0] for level in levels],
+        'care_level_ids': care_level_ids,
+        'items': items,
+        'start': start,
+        'days': days,
+    }
+
+
+class VirtualUser:
+    """One simulated user driving the app through its own test client"""
+    def __init__(self, app, dataset, results, rng):
+        self.client = app.test_client()
+        self.dataset = dataset
+        self.results = results
+        self.rng = rng
+
+    def call(self, route, method, url, **kwargs):
+        _request_outcome.lock_errors = 0
+        start = time.perf_counter()
+        try:
+            response = self.client.open(url, method=method, **kwargs)
+            elapsed = time.perf_counter() - start
+            failed = response.status_code >= 400 or (response.status_code in (301, 302, 303) and self.flashed_error())
+        except Exception:
+            elapsed = time.perf_counter() - start
+            response = None
+            failed = True
+        self.results.record(route, elapsed, failed, _request_outcome.lock_errors > 0)
+        return response
+
+    def flashed_error(self):
+        """Pop the flash messages queued for the redirect target and tell whether one reports a failure"""
+        with self.client.session_transaction() as flask_session:
+            flashes = flask_session.pop('_flashes', [])
+        return any(message.startswith(ERROR_FLASH_PREFIXES) for _, message in flashes)
+
+    def random_date(self):
+        offset = self.rng.randrange(self.dataset['days'] + 30)
+        return self.dataset['start'] + timedelta(days=offset)
+
+    def login(self):
+        self.call('POST /login', 'POST', '/login', data={'username': 'admin', 'password': 'admin123'})
+
+    def patient_list(self):
+        self.call('GET /patients', 'GET', '/patients')
+
+    def stay_entry(self):
+        patient_id = self.rng.choice(self.dataset['patient_ids'])
+        self.call('POST /patients/<id>/stays', 'POST', f'/patients/{patient_id}/stays',
+                  data={'stay_date': self.random_date().strftime("%Y-%m-%d"),
+                        'care_level_id': self.rng.choice(self.dataset['care_level_ids'])})
+        self.call('GET /patients/confirm_stay', 'GET', '/patients/confirm_stay')
+        self.call('POST /patients/confirm_stay', 'POST', '/patients/confirm_stay')
+
+    def item_entry(self):
+        patient_id = self.rng.choice(self.dataset['patient_ids'])
+        item_id, category, _ = self.rng.choice(self.dataset['items'])
+        self.call('GET /patients/<id>/items/<category>', 'GET', f'/patients/{patient_id}/items/{category}')
+        self.call('POST /patients/<id>/items/<category>', 'POST', f'/patients/{patient_id}/items/{category}',
+                  data={'item_id': item_id, 'date': self.random_date().strftime("%Y-%m-%d"), 'quantity': self.rng.randint(1, 3)})
+
+    def shift_entry(self):
+        arrival = datetime.combine(self.random_date(), datetime.min.time()) + timedelta(hours=self.rng.randrange(24))
+        data = {
+            'patient_id': self.rng.choice(self.dataset['patient_ids']),
+            'arrival_datetime': arrival.strftime('%Y-%m-%dT%H:%M'),
+            'leave_datetime': (arrival + timedelta(hours=8)).strftime('%Y-%m-%dT%H:%M'),
+        }
+        if self.rng.random() < 0.5:
+            doctor_id = self.rng.choice(self.dataset['doctor_ids'])
+            self.call('POST /doctors/<id>/shifts/add', 'POST', f'/doctors/{doctor_id}/shifts/add', data=data)
+        else:
+            nurse_id = self.rng.choice(self.dataset['nurse_ids'])
+            data['nurse_level_id'] = self.rng.choice(self.dataset['nurse_level_ids'])
+            self.call('POST /nurses/<id>/shifts/add', 'POST', f'/nurses/{nurse_id}/shifts/add', data=data)
+
+    def salary(self):
+        end = self.random_date()
+        data = {'start_date': (end - timedelta(days=30)).strftime("%Y-%m-%d"), 'end_date': end.strftime("%Y-%m-%d")}
+        if self.rng.random() < 0.5:
+            doctor_id = self.rng.choice(self.dataset['doctor_ids'])
+            self.call('POST /doctors/<id>/salary', 'POST', f'/doctors/{doctor_id}/salary', data=data)
+        else:
+            nurse_id = self.rng.choice(self.dataset['nurse_ids'])
+            self.call('POST /nurses/<id>/salary', 'POST', f'/nurses/{nurse_id}/salary', data=data)
+
+    def company_report(self):
+        # A handful of month ranges, so some requests hit finished reports
+        start = self.dataset['start'] + timedelta(days=30 * self.rng.randrange(3))
+        data = {'from_date': start.strftime("%Y-%m-%d"), 'to_date': (start + timedelta(days=30)).strftime("%Y-%m-%d")}
+        response = self.call('POST /company', 'POST', '/company', data=data, headers={'Accept': 'application/json'})
+        if response is None or response.status_code != 202:
+            return
+        started = time.perf_counter()
+        job = response.get_json()
+        while job['status'] in ('queued', 'running'):
+            time.sleep(0.2)
+            response = self.call('GET /jobs/<id>', 'GET', f"/jobs/{job['id']}")
+            if response is None or response.status_code != 200:
+                return
+            job = response.get_json()
+        self.results.record('company report (queued to finished)', time.perf_counter() - started, job['status'] != 'done')
+
+
+class Results:
+    """Latencies and failures per route, shared by the threads of one process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.locked = defaultdict(int)
+
+    def record(self, route, elapsed, failed, locked=False):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if failed:
+                self.failures[route] += 1
+            if locked:
+                self.locked[route] += 1
+
+    def as_dict(self):
+        return {'latencies': dict(self.latencies), 'failures': dict(self.failures), 'locked': dict(self.locked)}
+
+
+def run_worker(app, dataset, threads, duration, seed, queue=None):
+    """Run `threads` virtual users against the app for `duration` seconds"""
+    from web_app.instrumentation import metrics
+
+    results = Results()
+    scenarios = list(TRAFFIC_MIX)
+    weights = [TRAFFIC_MIX[name] for name in scenarios]
+    deadline = time.perf_counter() + duration
+
+    def user_loop(index):
+        rng = random.Random(seed * 1000 + index)
+        user = VirtualUser(app, dataset, results, rng)
+        user.login()
+        while time.perf_counter() < deadline:
+            getattr(user, rng.choices(scenarios, weights)[0])()
+
+    workers = [threading.Thread(target=user_loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    outcome = results.as_dict()
+    outcome['lock_errors'] = {f"{method} {endpoint}": count for (method, endpoint), count in metrics.lock_errors.items() if count}
+    if queue is not None:
+        queue.put(outcome)
+    return outcome
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(outcomes, elapsed):
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    locked = defaultdict(int)
+    lock_errors = defaultdict(int)
+    for outcome in outcomes:
+        for route, values in outcome['latencies'].items():
+            latencies[route].extend(values)
+        for route, count in outcome['failures'].items():
+            failures[route] += count
+        for route, count in outcome['locked'].items():
+            locked[route] += count
+        for endpoint, count in outcome['lock_errors'].items():
+            lock_errors[endpoint] += count
+
+    routes = {}
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        routes[route] = {
+            'requests': len(values),
+            'throughput_rps': len(values) / elapsed,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'errors': failures[route],
+            'error_rate': failures[route] / len(values),
+            'locked': locked[route],
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'elapsed_s': elapsed,
+        'total_requests': total,
+        'throughput_rps': total / elapsed,
+        'routes': routes,
+        'lock_errors': dict(lock_errors),
+    }
+
+
+def print_summary(summary):
+    print(f"\n{'Route':<42}{'Reqs':>7}{'Req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Errors':>8}{'Locked':>8}")
+    print("-" * 104)
+    for route, stats in summary['routes'].items():
+        print(f"{route:<42}{stats['requests']:>7}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['errors']:>8}{stats['locked']:>8}")
+    print("-" * 104)
+    errors = sum(stats['errors'] for stats in summary['routes'].values())
+    locked = sum(stats['locked'] for stats in summary['routes'].values())
+    print(f"Total: {summary['total_requests']} requests in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.1f} req/s), {errors} error(s), {locked} hit a lock timeout")
+    print("\n'database is locked' errors by endpoint:")
+    if not summary['lock_errors']:
+        print("  none")
+    for endpoint, count in sorted(summary['lock_errors'].items()):
+        print(f"  {endpoint}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the web app against a generated dataset")
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--nurses', type=int, default=40)
+    parser.add_argument('--days', type=int, default=60, help="days of history to generate")
+    parser.add_argument('--threads', type=int, default=8, help="virtual users per process")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds of traffic")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help="scratch directory (default: a new temporary directory)")
+    parser.add_argument('--keep', action='store_true', help="keep the scratch directory afterwards")
+    parser.add_argument('--json', help="also write the summary to this file")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="icu_loadtest_"))
+    json_path = os.path.abspath(args.json) if args.json else None
+    prepare_workdir(workdir, os.path.join(PROJECT_DIR, 'Config', 'config.ini'))
+    os.chdir(workdir)
+    sys.path.insert(0, PROJECT_DIR)
+
+    # The web app and its modules resolve db/ relative to the working directory,
+    # so they are imported only after switching to the scratch copy
+    print(f"Generating dataset in {workdir} ...")
+    dataset = generate_dataset(args.patients, args.doctors, args.nurses, args.days, args.seed)
+    from web_app.app import create_app
+    app = create_app()
+    track_lock_errors(app)
+
+    print(f"Running {args.processes} process(es) x {args.threads} thread(s) for {args.duration:.0f}s ...")
+    started = time.perf_counter()
+    if args.processes == 1:
+        outcomes = [run_worker(app, dataset, args.threads, args.duration, args.seed)]
+    else:
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=run_worker, args=(app, dataset, args.threads, args.duration, args.seed + i, queue))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        outcomes = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(outcomes, elapsed)
+    print_summary(summary)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import queue
+import threading
+import traceback
+import tkinter as tk
+from tkinter import ttk
+
+class TaskCancelled(Exception):
+    """Raised inside a background task once the user has pressed Cancel"""
+
+class BackgroundTask:
+    """Run a long operation on a worker thread behind a cancellable Tk progress dialog.
+
+    work(progress) runs on the worker thread and must not touch Tk; the
+    database connections and files it opens belong to that thread.
+    progress(done, total, message=None) posts to a thread-safe queue and
+    raises TaskCancelled after the user cancels, so work stops at its next
+    progress call. The dialog drains the queue with after() every
+    poll_interval milliseconds, so the window keeps repainting, and
+    on_done(result) or on_error(error) run back on the Tk thread.
+    """
+
+    def __init__(self, parent, title, work, on_done, on_error=None, poll_interval=100):
+        self.parent = parent
+        self.title = title
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.poll_interval = poll_interval
+        self._messages = queue.Queue()
+        self._cancelled = threading.Event()
+        self._dialog = None
+
+    def start(self):
+        """Open the progress dialog and start the worker thread"""
+        self._dialog = tk.Toplevel(self.parent)
+        self._dialog.title(self.title)
+        self._dialog.transient(self.parent.winfo_toplevel())
+        self._dialog.resizable(False, False)
+        self._dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        frame = ttk.Frame(self._dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        self._message_var = tk.StringVar(value=f"{self.title}...")
+        ttk.Label(frame, textvariable=self._message_var, width=50).pack(fill=tk.X)
+        self._bar = ttk.Progressbar(frame, mode="indeterminate", maximum=100, length=320)
+        self._bar.pack(fill=tk.X, pady=10)
+        self._bar.start(10)
+        self._cancel_button = ttk.Button(frame, text="Cancel", command=self.cancel)
+        self._cancel_button.pack()
+        # Keep other windows from starting a second run while this one works
+        self._dialog.grab_set()
+
+        threading.Thread(target=self._run, name=f"task-{self.title}", daemon=True).start()
+        self._dialog.after(self.poll_interval, self._poll)
+        return self
+
+    def cancel(self):
+        """Ask the worker to stop at its next progress call"""
+        self._cancelled.set()
+        self._message_var.set("Cancelling...")
+        self._cancel_button.configure(state=tk.DISABLED)
+
+    def _progress(self, done, total, message=None):
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+        self._messages.put(("progress", done, total, message))
+
+    def _run(self):
+        try:
+            result = self.work(self._progress)
+        except TaskCancelled:
+            self._messages.put(("cancelled",))
+        except Exception as e:
+            print(f"Error in background task {self.title}: {e}")
+            traceback.print_exc()
+            self._messages.put(("error", e))
+        else:
+            self._messages.put(("done", result))
+
+    def _poll(self):
+        """Apply every queued message on the Tk thread, then poll again unless the task finished"""
+        try:
+            while True:
+                message = self._messages.get_nowait()
+                if message[0] == "progress":
+                    self._show_progress(*message[1:])
+                    continue
+                self._finish(message)
+                return
+        except queue.Empty:
+            pass
+        self._dialog.after(self.poll_interval, self._poll)
+
+    def _show_progress(self, done, total, message):
+        if total:
+            if str(self._bar.cget("mode")) != "determinate":
+                self._bar.stop()
+                self._bar.configure(mode="determinate")
+            self._bar["value"] = 100.0 * done / total
+        if message and not self._cancelled.is_set():
+            self._message_var.set(message)
+
+    def _finish(self, message):
+        self._bar.stop()
+        self._dialog.grab_release()
+        self._dialog.destroy()
+        if message[0] == "done":
+            self.on_done(message[1])
+        elif message[0] == "error" and self.on_error:
+            self.on_error(message[1])
+
+def run_in_background(parent, title, work, on_done, on_error=None):
+    """Start a BackgroundTask and return it"""
+    return BackgroundTask(parent, title, work, on_done, on_error).start()
@@ -0,0 +1,194 @@
+import configparser
+import sqlite3
+import threading
+import time
+from .utils import get_change_stamp
+
+CATEGORIES = ["labs", "drugs", "radiology", "consultations"]
+
+# (database, table) pairs the snapshot is built from; their table_versions
+# counters are bumped by triggers on every write
+CATALOG_SOURCES = [
+    ("items", "items"),
+    ("items", "care_levels"),
+    ("items", "equipment"),
+    ("items", "care_level_equipment"),
+    ("interventions", "interventions"),
+    ("nurses", "nurse_levels"),
+]
+
+
+class ReferenceCatalog:
+    """Process-wide in-memory copy of the reference data tables.
+
+    Items, care levels, equipment, care level equipment assignments,
+    interventions and nurse levels change rarely but are read on almost every
+    screen. The catalog loads them once, indexes them by id (and by category or
+    care level) and serves lookups from memory. At most once every
+    check_interval seconds a lookup reads the table_versions counters of
+    those tables and reloads when they moved, so an edit made by another
+    process or web worker is seen within that interval; every other lookup
+    does no I/O. Edits made in this process call invalidate() and are seen at
+    once. Every reload bumps `version`, which callers can use as a cache key
+    for anything derived from reference data.
+    """
+
+    def __init__(self, check_interval=None):
+        config = configparser.ConfigParser()
+        config.read('Config/config.ini')
+        if check_interval is None:
+            check_interval = config.getfloat('CATALOG', 'check_interval', fallback=1.0)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self.version = 0
+
+    def _read_stamp(self):
+        """Return the change counters of every reference table"""
+        return get_change_stamp(CATALOG_SOURCES)["versions"]
+
+    def _load(self):
+        """Read every reference table and build the lookup indexes"""
+        snapshot = {}
+
+        conn = sqlite3.connect("db/items.db")
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, category, name, price FROM items ORDER BY name")
+        items = cursor.fetchall()
+        cursor.execute("SELECT id, name, daily_rate, patients_per_nurse FROM care_levels ORDER BY name")
+        care_levels = cursor.fetchall()
+        cursor.execute("SELECT id, name, daily_rental_price FROM equipment ORDER BY name")
+        equipment = cursor.fetchall()
+        cursor.execute("SELECT care_level_id, equipment_id FROM care_level_equipment")
+        assignments = cursor.fetchall()
+        conn.close()
+
+        conn = sqlite3.connect("db/interventions.db")
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, bonus_amount FROM interventions ORDER BY name")
+        interventions = cursor.fetchall()
+        conn.close()
+
+        conn = sqlite3.connect("db/nurses.db")
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, level_name, hourly_rate FROM nurse_levels ORDER BY id")
+        nurse_levels = cursor.fetchall()
+        conn.close()
+
+        snapshot['items_by_id'] = {row[0]: row for row in items}
+        snapshot['items_by_category'] = {category: [] for category in CATEGORIES}
+        for item_id, category, name, price in items:
+            snapshot['items_by_category'].setdefault(category, []).append((item_id, name, price))
+
+        snapshot['care_levels'] = care_levels
+        snapshot['care_levels_by_id'] = {row[0]: row for row in care_levels}
+
+        snapshot['equipment'] = equipment
+        snapshot['equipment_by_id'] = {row[0]: row for row in equipment}
+
+        snapshot['equipment_by_care_level'] = {}
+        for care_level_id, equipment_id in assignments:
+            equip = snapshot['equipment_by_id'].get(equipment_id)
+            if equip:
+                snapshot['equipment_by_care_level'].setdefault(care_level_id, []).append((equip[1], equip[0]))
+
+        snapshot['interventions'] = interventions
+        snapshot['interventions_by_id'] = {row[0]: row for row in interventions}
+
+        snapshot['nurse_levels'] = nurse_levels
+        snapshot['nurse_levels_by_id'] = {row[0]: row for row in nurse_levels}
+
+        return snapshot
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.check_interval:
+                # Read the counters before the tables so a write landing
+                # in between triggers another reload rather than being missed
+                stamp = self._read_stamp()
+                if self._snapshot is None or stamp != self._stamp:
+                    self._snapshot = self._load()
+                    self._stamp = stamp
+                    self.version += 1
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def load(self):
+        """Load the snapshot now instead of on the first lookup"""
+        self._get()
+
+    def invalidate(self):
+        """Drop the cached snapshot so the next lookup reloads from disk.
+
+        Writes from other processes are detected through table_versions
+        within check_interval; this reloads at once in this process, so the
+        editor sees its own change on the next lookup.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def items(self, category):
+        """Return (id, name, price) rows for a category, ordered by name"""
+        return list(self._get()['items_by_category'].get(category, []))
+
+    def item(self, item_id):
+        """Return the (id, category, name, price) row for an item, or None"""
+        return self._get()['items_by_id'].get(int(item_id))
+
+    def item_price(self, item_id, default=0):
+        item = self.item(item_id)
+        return item[3] if item else default
+
+    def care_levels(self):
+        """Return (id, name, daily_rate, patients_per_nurse) rows ordered by name"""
+        return list(self._get()['care_levels'])
+
+    def care_level(self, care_level_id):
+        return self._get()['care_levels_by_id'].get(int(care_level_id))
+
+    def equipment(self):
+        """Return (id, name, daily_rental_price) rows ordered by name"""
+        return list(self._get()['equipment'])
+
+    def equipment_item(self, equipment_id):
+        return self._get()['equipment_by_id'].get(int(equipment_id))
+
+    def equipment_price(self, equipment_id, default=0):
+        equipment = self.equipment_item(equipment_id)
+        return equipment[2] if equipment else default
+
+    def care_level_equipment(self, care_level_id):
+        """Return (name, equipment_id) rows assigned to a care level"""
+        return list(self._get()['equipment_by_care_level'].get(int(care_level_id), []))
+
+    def interventions(self):
+        """Return (id, name, bonus_amount) rows ordered by name"""
+        return list(self._get()['interventions'])
+
+    def intervention(self, intervention_id):
+        return self._get()['interventions_by_id'].get(int(intervention_id))
+
+    def nurse_levels(self):
+        """Return (id, level_name, hourly_rate) rows"""
+        return list(self._get()['nurse_levels'])
+
+    def nurse_level(self, nurse_level_id):
+        return self._get()['nurse_levels_by_id'].get(int(nurse_level_id))
+
+
+_catalog = ReferenceCatalog()
+
+
+def get_catalog():
+    """Return the shared reference data catalog"""
+    return _catalog
+
+
+def invalidate_catalog():
+    """Invalidate the shared catalog after reference data has been edited"""
+    _catalog.invalidate()
@@ -0,0 +1,272 @@
+import argparse
+import configparser
+import heapq
+import math
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from ..utils import setup_database, shift_timestamp
+from .staffing import timestamp_label
+
+# Event kinds of the merged stream: (timestamp, kind, care_level_id, delta)
+OCCUPANCY, NURSES = 0, 1
+
+def shift_change_hours():
+    """Hours of the day at which nursing shifts change, e.g. [7, 19] for day and night shifts"""
+    config = configparser.ConfigParser()
+    config.read('Config/config.ini')
+    value = config.get('STAFFING', 'shift_change_hours', fallback="7,19")
+    return sorted(int(hour) for hour in value.split(",") if hour.strip())
+
+def load_care_level_ratios():
+    """Return {care_level_id: (name, patients_per_nurse)} for every care level"""
+    conn = sqlite3.connect("db/items.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, patients_per_nurse FROM care_levels")
+    ratios = {care_level_id: (name, patients_per_nurse) for care_level_id, name, patients_per_nurse in cursor.fetchall()}
+    conn.close()
+    return ratios
+
+def load_occupancy_events(from_date, to_date):
+    """Return the patients of each care level per day as sorted occupancy events.
+
+    A stay occupies its care level for the whole calendar day; patients are
+    counted once per day and care level, with one grouped query.
+    """
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ps.stay_date, ps.care_level_id, COUNT(DISTINCT ps.patient_id)
+        FROM patient_stays ps
+        JOIN patients p ON ps.patient_id = p.id
+        WHERE ps.stay_date BETWEEN ? AND ?
+        GROUP BY ps.stay_date, ps.care_level_id
+    """, (from_date, to_date))
+    events = []
+    for stay_date, care_level_id, patients in cursor.fetchall():
+        day_start = shift_timestamp(datetime.strptime(stay_date, "%Y-%m-%d"))
+        events.append((day_start, OCCUPANCY, care_level_id, patients))
+        events.append((day_start + 86400, OCCUPANCY, care_level_id, -patients))
+    conn.close()
+    events.sort()
+    return events
+
+def load_nurse_coverage_events(from_date, to_date):
+    """Return the nurses on shift per care level as sorted (timestamp, NURSES, care_level_id, delta) events.
+
+    A nurse covers the care level of the patient their shift is for, as
+    recorded in patient_stays on each day: shifts are cut at midnight with
+    the nurse_shift_day_hours split, so a night shift follows its patient
+    into a new care level. Shift parts on days without a stay cover no care
+    level and are left out.
+    """
+    conn = sqlite3.connect("db/nurses.db")
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE 'db/patients.db' AS patients_db")
+    cursor.execute("""
+        SELECT MAX(sh.arrival_ts, CAST(strftime('%s', d.day) AS INTEGER)),
+               MIN(sh.leave_ts, CAST(strftime('%s', d.day) AS INTEGER) + 86400),
+               (SELECT ps.care_level_id FROM patients_db.patient_stays ps
+                WHERE ps.patient_id = d.patient_id AND ps.stay_date = d.day
+                ORDER BY ps.id DESC LIMIT 1)
+        FROM nurse_shift_day_hours d
+        JOIN nurse_shifts sh ON d.shift_id = sh.id
+        JOIN nurses n ON d.nurse_id = n.id
+        WHERE d.day BETWEEN ? AND ?
+    """, (from_date, to_date))
+    events = []
+    for start, end, care_level_id in cursor:
+        if care_level_id is None or end <= start:
+            continue
+        events.append((start, NURSES, care_level_id, 1))
+        events.append((end, NURSES, care_level_id, -1))
+    conn.close()
+    events.sort()
+    return events
+
+def required_nurses(patients, patients_per_nurse):
+    """Nurses needed for a care level's patients, rounding up"""
+    if patients > 0 and patients_per_nurse:
+        return math.ceil(patients / patients_per_nurse)
+    return 0
+
+def sweep_compliance(events, ratios, end_ts):
+    """Walk the merged occupancy and nurse events once and return each care level's intervals where nurses fall short.
+
+    Occupancy and nurses are tracked per care level, and a care level is
+    only covered by the nurses caring for its own patients. All events at one
+    instant are applied before the ratios are checked, so a handover or a
+    midnight change of occupancy does not create a zero-length breach. Each
+    breach interval records its care level and worst shortfall; the list is
+    ordered by start time.
+    """
+    occupancy = {}
+    nurses = {}
+    breaches = []
+    current = {}
+    for timestamp, group in groupby(events, key=itemgetter(0)):
+        if timestamp >= end_ts:
+            break
+        touched = set()
+        for _, kind, care_level_id, delta in group:
+            counts = nurses if kind == NURSES else occupancy
+            counts[care_level_id] = counts.get(care_level_id, 0) + delta
+            touched.add(care_level_id)
+
+        for care_level_id in sorted(touched):
+            patients = occupancy.get(care_level_id, 0)
+            on_shift = nurses.get(care_level_id, 0)
+            required = required_nurses(patients, ratios.get(care_level_id, (None, None))[1])
+            breach = current.get(care_level_id)
+            if required > on_shift:
+                if breach is None:
+                    breach = current[care_level_id] = {"care_level_id": care_level_id, "start": timestamp, "required": required,
+                                                       "nurses": on_shift, "shortfall": 0, "patients": 0}
+                    breaches.append(breach)
+                breach["required"] = max(breach["required"], required)
+                breach["nurses"] = min(breach["nurses"], on_shift)
+                breach["shortfall"] = max(breach["shortfall"], required - on_shift)
+                breach["patients"] = max(breach["patients"], patients)
+            elif breach is not None:
+                breach["end"] = timestamp
+                del current[care_level_id]
+    for breach in current.values():
+        breach["end"] = end_ts
+    return breaches
+
+def covered_seconds(intervals):
+    """Total length of the union of (start, end) intervals sorted by start"""
+    total = 0
+    covered_until = None
+    for start, end in intervals:
+        if covered_until is None or start > covered_until:
+            total += end - start
+            covered_until = end
+        elif end > covered_until:
+            total += end - covered_until
+            covered_until = end
+    return total
+
+def shift_windows(start_ts, end_ts, change_hours):
+    """Return the (start, end) shift windows covering start_ts..end_ts, split at the shift change hours"""
+    boundaries = {start_ts, end_ts}
+    day = start_ts - start_ts % 86400
+    while day < end_ts:
+        for hour in change_hours:
+            if start_ts < day + hour * 3600 < end_ts:
+                boundaries.add(day + hour * 3600)
+        day += 86400
+    boundaries = sorted(boundaries)
+    return list(zip(boundaries, boundaries[1:]))
+
+def summarize_windows(breaches, windows):
+    """Total the breach time and worst shortfall of each shift window, walking both sorted lists once"""
+    summaries = []
+    index = 0
+    for window_start, window_end in windows:
+        while index < len(breaches) and breaches[index]["end"] <= window_start:
+            index += 1
+        seconds = 0
+        shortfall = 0
+        position = index
+        while position < len(breaches) and breaches[position]["start"] < window_end:
+            breach = breaches[position]
+            seconds += min(breach["end"], window_end) - max(breach["start"], window_start)
+            shortfall = max(shortfall, breach["shortfall"])
+            position += 1
+        if seconds:
+            summaries.append({
+                "start": window_start,
+                "end": window_end,
+                "label": f"{timestamp_label(window_start)} - {timestamp_label(window_end, '%H:%M')}",
+                "breach_hours": seconds / 3600,
+                "share": seconds / (window_end - window_start),
+                "shortfall": shortfall,
+            })
+    return summaries
+
+def ratio_compliance_report(from_date, to_date):
+    """Nurse-to-patient ratio breaches per care level for a date range.
+
+    Occupancy per care level comes from patient_stays, nurse coverage per
+    care level from nurse_shifts and their patients' stays; both are read
+    with one query each, turned into sorted event streams and merged into a
+    single sweep. Returns the breach intervals, the shift windows (split at
+    [STAFFING] shift_change_hours) in which each care level has breaches,
+    totals per care level, and the share of the period in which every care
+    level was compliant.
+    """
+    start_ts = shift_timestamp(datetime.strptime(from_date, "%Y-%m-%d"))
+    end_ts = shift_timestamp(datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1))
+
+    ratios = load_care_level_ratios()
+    events = heapq.merge(load_occupancy_events(from_date, to_date), load_nurse_coverage_events(from_date, to_date))
+
+    breaches = sweep_compliance(events, ratios, end_ts)
+    for breach in breaches:
+        breach["care_level"] = ratios.get(breach["care_level_id"], ("Unknown", None))[0]
+        breach["label"] = f"{timestamp_label(breach['start'])} - {timestamp_label(breach['end'])}"
+        breach["hours"] = (breach["end"] - breach["start"]) / 3600
+
+    windows = shift_windows(start_ts, end_ts, shift_change_hours())
+    total_hours = (end_ts - start_ts) / 3600
+    levels = []
+    window_summaries = []
+    for care_level_id, (name, patients_per_nurse) in sorted(ratios.items(), key=lambda item: item[1][0]):
+        level_breaches = [breach for breach in breaches if breach["care_level_id"] == care_level_id]
+        if not patients_per_nurse and not level_breaches:
+            continue
+        for window in summarize_windows(level_breaches, windows):
+            window["care_level"] = name
+            window_summaries.append(window)
+        breach_hours = sum(breach["hours"] for breach in level_breaches)
+        levels.append({
+            "care_level": name,
+            "patients_per_nurse": patients_per_nurse,
+            "breaches": len(level_breaches),
+            "breach_hours": breach_hours,
+            "compliance": 1 - breach_hours / total_hours if total_hours else 1.0,
+        })
+    window_summaries.sort(key=lambda window: (window["start"], window["care_level"]))
+
+    breach_hours = covered_seconds((breach["start"], breach["end"]) for breach in breaches) / 3600
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "ratios": sorted((name, patients_per_nurse) for name, patients_per_nurse in ratios.values() if patients_per_nurse),
+        "levels": levels,
+        "breaches": breaches,
+        "windows": window_summaries,
+        "breach_hours": breach_hours,
+        "compliance": 1 - breach_hours / total_hours if total_hours else 1.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="List the periods where the nurses caring for each care level fall below its ratio")
+    parser.add_argument('--from', dest='from_date', required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='to_date', required=True, help="last day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    setup_database()
+    started = time.perf_counter()
+    report = ratio_compliance_report(args.from_date, args.to_date)
+    elapsed = time.perf_counter() - started
+
+    for level in report["levels"]:
+        ratio = f"1:{level['patients_per_nurse']:g}" if level["patients_per_nurse"] else "no ratio"
+        print(f"{level['care_level']:20} {ratio:8} {level['breaches']:4} breach(es) {level['breach_hours']:8.2f} h  "
+              f"{level['compliance']:6.1%} compliant")
+    print()
+    for window in report["windows"]:
+        print(f"{window['label']:28} {window['care_level']:20} {window['breach_hours']:6.2f} h short, up to {window['shortfall']} nurse(s)")
+    print()
+    for breach in report["breaches"]:
+        print(f"{breach['label']:36} {breach['care_level']:20} {breach['nurses']:3} on shift, "
+              f"{breach['required']:3} required for {breach['patients']} patient(s)")
+    print(f"\n{len(report['breaches'])} breach(es), {report['breach_hours']:.2f} h with at least one care level short, "
+          f"{report['compliance']:.1%} of the period compliant (swept in {elapsed:.3f}s)")
+
+if __name__ == '__main__':
+    main()
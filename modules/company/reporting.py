@@ -1,144 +1,74 @@
 import sqlite3
-from datetime import datetime
+import openpyxl
+from ..jobs import register_job_handler
+from ..staff_costs import STAFF_TYPES, period_costs
 
 class ReportingHandler:
     def __init__(self, debug_mode=False):
         self.debug_mode = debug_mode
 
-    def calculate_doctor_costs(self, from_date, to_date):
-        """Calculate total doctor costs"""
+    def calculate_staff_costs(self, staff_type, from_date, to_date, progress_callback=None):
+        """Calculate the cost of every doctor or nurse with one grouped query for shifts and one for bonuses"""
         if self.debug_mode:
-            print("\n--- Calculating Doctor Costs ---")
-        conn = sqlite3.connect("db/doctors.db")
+            print(f"\n--- Calculating {staff_type.capitalize()} Costs ---")
+        conn = sqlite3.connect(f"db/{staff_type}s.db")
         cursor = conn.cursor()
         cursor.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
 
-        # Get all doctors
-        cursor.execute("SELECT id, name, hourly_rate FROM doctors")
-        doctors = cursor.fetchall()
+        shift_totals = period_costs(cursor, staff_type, f"{staff_type}_id", from_date, to_date)
 
-        total_cost = 0.0
-        doctor_details = []
+        cursor.execute(f"""
+            SELECT si.{staff_type}_id, SUM(i.bonus_amount)
+            FROM {staff_type}_interventions si
+            JOIN interventions_db.interventions i ON si.intervention_id = i.id
+            WHERE si.date BETWEEN ? AND ?
+            GROUP BY si.{staff_type}_id
+        """, (from_date, to_date))
+        bonuses = dict(cursor.fetchall())
 
-        for doctor in doctors:
-            doctor_id, name, hourly_rate = doctor
+        level_column = "level" if staff_type == "nurse" else "NULL"
+        cursor.execute(f"SELECT id, name, {level_column} FROM {staff_type}s")
+        staff = cursor.fetchall()
+        conn.close()
 
-            # Calculate total hours
-            cursor.execute("""
-                SELECT arrival_datetime, leave_datetime FROM doctor_shifts
-                WHERE doctor_id = ? AND
-                      date(arrival_datetime) BETWEEN ? AND ?
-            """, (doctor_id, from_date, to_date))
-
-            shifts = cursor.fetchall()
-            total_hours = 0.0
-            for shift in shifts:
-                arrival_datetime = datetime.strptime(shift[0], "%Y-%m-%d %H:%M:%S")
-                leave_datetime = datetime.strptime(shift[1], "%Y-%m-%d %H:%M:%S")
-                total_hours += (leave_datetime - arrival_datetime).total_seconds() / 3600
-
-            # Calculate total bonus
-            cursor.execute("""
-                SELECT SUM(i.bonus_amount)
-                FROM doctor_interventions di
-                JOIN interventions_db.interventions i ON di.intervention_id = i.id
-                WHERE di.doctor_id = ? AND di.date BETWEEN ? AND ?
-            """, (doctor_id, from_date, to_date))
+        total_cost = 0.0
+        staff_details = []
 
-            bonus_result = cursor.fetchone()[0]
-            total_bonus = bonus_result if bonus_result else 0.0
+        for index, (staff_id, name, level) in enumerate(staff):
+            if progress_callback:
+                progress_callback(index, len(staff))
 
-            # Calculate total cost
-            doctor_cost = (total_hours * hourly_rate) + total_bonus
-            total_cost += doctor_cost
+            shifts, total_hours, shift_cost = shift_totals.get(staff_id, (0, 0.0, 0.0))
+            total_bonus = bonuses.get(staff_id) or 0.0
+            cost = shift_cost + total_bonus
+            total_cost += cost
 
             if self.debug_mode:
-                print(f"  Doctor: {name}")
-                print(f"    - Total Hours: {total_hours:.2f} * ${hourly_rate}/hr = ${total_hours * hourly_rate:.2f}")
+                print(f"  {staff_type.capitalize()}: {name}" + (f" ({level})" if level else ""))
+                print(f"    - Total Hours: {total_hours:.2f} over {shifts} shifts = ${shift_cost:.2f}")
                 print(f"    - Total Bonus: ${total_bonus:.2f}")
-                print(f"    - Total Cost for {name}: ${doctor_cost:.2f}")
-
-            if doctor_cost > 0:
-                doctor_details.append({
-                    'name': name,
-                    'cost': doctor_cost
-                })
+                print(f"    - Total Cost for {name}: ${cost:.2f}")
 
-        conn.close()
+            if cost > 0:
+                detail = {'name': name, 'cost': cost}
+                if staff_type == "nurse":
+                    detail['level'] = level
+                staff_details.append(detail)
 
         return {
             'total': total_cost,
-            'details': doctor_details
+            'details': staff_details
         }
-    
-    def calculate_nurse_costs(self, from_date, to_date):
-        """Calculate total nurse costs"""
-        if self.debug_mode:
-            print("\n--- Calculating Nurse Costs ---")
-        conn = sqlite3.connect("db/nurses.db")
-        cursor = conn.cursor()
-        cursor.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
-
-        # Get all nurses
-        cursor.execute("SELECT id, name, level, hourly_rate FROM nurses")
-        nurses = cursor.fetchall()
-
-        total_cost = 0.0
-        nurse_details = []
-
-        for nurse in nurses:
-            nurse_id, name, level, hourly_rate = nurse
-
-            # Calculate total hours
-            cursor.execute("""
-                SELECT arrival_datetime, leave_datetime FROM nurse_shifts
-                WHERE nurse_id = ? AND
-                      date(arrival_datetime) BETWEEN ? AND ?
-            """, (nurse_id, from_date, to_date))
-
-            shifts = cursor.fetchall()
-            total_hours = 0.0
-            for shift in shifts:
-                arrival_datetime = datetime.strptime(shift[0], "%Y-%m-%d %H:%M:%S")
-                leave_datetime = datetime.strptime(shift[1], "%Y-%m-%d %H:%M:%S")
-                total_hours += (leave_datetime - arrival_datetime).total_seconds() / 3600
-
-            # Calculate total bonus
-            cursor.execute("""
-                SELECT SUM(i.bonus_amount)
-                FROM nurse_interventions ni
-                JOIN interventions_db.interventions i ON ni.intervention_id = i.id
-                WHERE ni.nurse_id = ? AND ni.date BETWEEN ? AND ?
-            """, (nurse_id, from_date, to_date))
-
-            bonus_result = cursor.fetchone()[0]
-            total_bonus = bonus_result if bonus_result else 0.0
-
-            # Calculate total cost
-            nurse_cost = (total_hours * hourly_rate) + total_bonus
-            total_cost += nurse_cost
 
-            if self.debug_mode:
-                print(f"  Nurse: {name} ({level})")
-                print(f"    - Total Hours: {total_hours:.2f} * ${hourly_rate}/hr = ${total_hours * hourly_rate:.2f}")
-                print(f"    - Total Bonus: ${total_bonus:.2f}")
-                print(f"    - Total Cost for {name}: ${nurse_cost:.2f}")
-
-            if nurse_cost > 0:
-                nurse_details.append({
-                    'name': name,
-                    'level': level,
-                    'cost': nurse_cost
-                })
+    def calculate_doctor_costs(self, from_date, to_date, progress_callback=None):
+        """Calculate total doctor costs"""
+        return self.calculate_staff_costs("doctor", from_date, to_date, progress_callback)
 
-        conn.close()
+    def calculate_nurse_costs(self, from_date, to_date, progress_callback=None):
+        """Calculate total nurse costs, each shift at the rate of the level it was worked at"""
+        return self.calculate_staff_costs("nurse", from_date, to_date, progress_callback)
 
-        return {
-            'total': total_cost,
-            'details': nurse_details
-        }
-    
-    def calculate_patient_revenues(self, from_date, to_date):
+    def calculate_patient_revenues(self, from_date, to_date, progress_callback=None):
         """Calculate total patient revenues and operational costs from patient services."""
         if self.debug_mode:
             print("\n--- Calculating Patient Revenues ---")
@@ -149,6 +79,12 @@ class ReportingHandler:
         cursor.execute("ATTACH DATABASE 'db/nurses.db' AS nurses_db")
         cursor.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
 
+        # Shift costs of every patient, one grouped query per staff type
+        shift_totals = {
+            staff_type: period_costs(cursor, staff_type, "patient_id", from_date, to_date, f"{staff_type}s_db")
+            for staff_type in STAFF_TYPES
+        }
+
         cursor.execute("SELECT id, name FROM patients")
         patients = cursor.fetchall()
 
@@ -156,7 +92,10 @@ class ReportingHandler:
         total_operational_cost = 0.0
         patient_details = []
 
-        for patient_id, name in patients:
+        for index, (patient_id, name) in enumerate(patients):
+            if progress_callback:
+                progress_callback(index, len(patients))
+
             # Stay costs
             cursor.execute("""
                 SELECT SUM(cl.daily_rate) FROM patient_stays ps
@@ -169,43 +108,21 @@ class ReportingHandler:
             item_revenue = 0.0
             for category in ["labs", "drugs", "radiology", "consultations"]:
                 cursor.execute(f"""
-                    SELECT SUM(i.price * p.quantity) FROM patient_{category} p
-                    JOIN items_db.items i ON p.item_id = i.id
-                    WHERE p.patient_id = ? AND p.date BETWEEN ? AND ?
+                    SELECT SUM(line_total) FROM patient_{category}
+                    WHERE patient_id = ? AND date BETWEEN ? AND ?
                 """, (patient_id, from_date, to_date))
                 item_revenue += cursor.fetchone()[0] or 0.0
 
-            # Equipment costs
-            equipment_revenue = 0.0
+            # Equipment costs, the days of each rental interval that fall in the period
             cursor.execute("""
-                SELECT start_date, end_date, daily_rental_price FROM patient_equipment
-                WHERE patient_id = ?
-            """, (patient_id,))
-            for start_date, end_date, daily_price in cursor.fetchall():
-                if not end_date:
-                    continue
-
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                end = datetime.strptime(end_date, "%Y-%m-%d")
-                
-                period_start = datetime.strptime(from_date, "%Y-%m-%d")
-                period_end = datetime.strptime(to_date, "%Y-%m-%d")
-
-                overlap_start = max(start, period_start)
-                overlap_end = min(end, period_end)
-
-                if overlap_start < overlap_end:
-                    days = (overlap_end - overlap_start).days
-                    equipment_revenue += days * daily_price
+                SELECT SUM((MIN(julianday(end_date), julianday(?)) - MAX(julianday(start_date), julianday(?))) * daily_rental_price)
+                FROM patient_equipment
+                WHERE patient_id = ? AND end_date IS NOT NULL AND end_date > ? AND start_date < ?
+            """, (to_date, from_date, patient_id, from_date, to_date))
+            equipment_revenue = cursor.fetchone()[0] or 0.0
 
             # Doctor costs for this patient
-            cursor.execute("""
-                SELECT SUM((julianday(ds.leave_datetime) - julianday(ds.arrival_datetime)) * 24 * d.hourly_rate)
-                FROM doctors_db.doctor_shifts ds
-                JOIN doctors_db.doctors d ON ds.doctor_id = d.id
-                WHERE ds.patient_id = ? AND date(ds.arrival_datetime) BETWEEN ? AND ?
-            """, (patient_id, from_date, to_date))
-            doctor_shift_cost = cursor.fetchone()[0] or 0.0
+            doctor_shift_cost = shift_totals["doctor"].get(patient_id, (0, 0.0, 0.0))[2]
 
             cursor.execute("""
                 SELECT SUM(i.bonus_amount)
@@ -217,13 +134,7 @@ class ReportingHandler:
             doctor_total_cost = doctor_shift_cost + doctor_bonus_cost
 
             # Nurse costs for this patient
-            cursor.execute("""
-                SELECT SUM((julianday(ns.leave_datetime) - julianday(ns.arrival_datetime)) * 24 * n.hourly_rate)
-                FROM nurses_db.nurse_shifts ns
-                JOIN nurses_db.nurses n ON ns.nurse_id = n.id
-                WHERE ns.patient_id = ? AND date(ns.arrival_datetime) BETWEEN ? AND ?
-            """, (patient_id, from_date, to_date))
-            nurse_shift_cost = cursor.fetchone()[0] or 0.0
+            nurse_shift_cost = shift_totals["nurse"].get(patient_id, (0, 0.0, 0.0))[2]
 
             cursor.execute("""
                 SELECT SUM(i.bonus_amount)
@@ -263,3 +174,81 @@ class ReportingHandler:
             'details': patient_details,
             'operational_cost': total_operational_cost
         }
+
+    def generate_report(self, from_date, to_date, progress_callback=None):
+        """Compute the full company report for a date range.
+
+        progress_callback, if given, is called with (done, total) where the
+        doctor, nurse and patient passes each account for a third of the work.
+        """
+        def stage(offset):
+            if not progress_callback:
+                return None
+            return lambda done, total: progress_callback(offset + (done / total if total else 1), 3)
+
+        doctor_costs = self.calculate_doctor_costs(from_date, to_date, stage(0))
+        nurse_costs = self.calculate_nurse_costs(from_date, to_date, stage(1))
+        patient_revenues = self.calculate_patient_revenues(from_date, to_date, stage(2))
+
+        total_patient_revenue = patient_revenues['total']
+        pass_through_costs = patient_revenues['operational_cost']
+        total_staff_cost = doctor_costs['total'] + nurse_costs['total']
+        total_operational_cost = total_staff_cost + pass_through_costs
+        net_profit = total_patient_revenue - total_operational_cost
+
+        return {
+            "from_date": from_date,
+            "to_date": to_date,
+            "total_patient_revenue": total_patient_revenue,
+            "total_staff_cost": total_staff_cost,
+            "pass_through_costs": pass_through_costs,
+            "total_operational_cost": total_operational_cost,
+            "net_profit": net_profit,
+            "doctor_details": doctor_costs['details'],
+            "nurse_details": nurse_costs['details'],
+            "patient_details": patient_revenues['details']
+        }
+
+    def export_report_workbook(self, report_data, filename):
+        """Write a generated report to an Excel workbook"""
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = "Company Report"
+
+        sheet.append(["Report Period", report_data['from_date'], report_data['to_date']])
+        sheet.append([])
+        sheet.append(["Total Patient Revenue", report_data['total_patient_revenue']])
+        sheet.append(["Total Staff Cost", report_data['total_staff_cost']])
+        sheet.append(["Pass-Through Costs", report_data['pass_through_costs']])
+        sheet.append(["Total Operational Cost", report_data['total_operational_cost']])
+        sheet.append(["Net Profit", report_data['net_profit']])
+
+        sheet.append([])
+        sheet.append(["Doctor", "Cost"])
+        for doctor in report_data['doctor_details']:
+            sheet.append([doctor['name'], doctor['cost']])
+
+        sheet.append([])
+        sheet.append(["Nurse", "Level", "Cost"])
+        for nurse in report_data['nurse_details']:
+            sheet.append([nurse['name'], nurse['level'], nurse['cost']])
+
+        sheet.append([])
+        sheet.append(["Patient", "Revenue"])
+        for patient in report_data['patient_details']:
+            sheet.append([patient['name'], patient['revenue']])
+
+        workbook.save(filename)
+
+def run_company_report_job(job):
+    """Job handler: compute a company report and save it as an Excel file"""
+    from_date = job.params['from_date']
+    to_date = job.params['to_date']
+    reporting_handler = ReportingHandler(debug_mode=job.queue.debug_mode)
+    report_data = reporting_handler.generate_report(from_date, to_date, job.update_progress)
+
+    filename = job.output_path(f"company_report_{from_date}_{to_date}.xlsx")
+    reporting_handler.export_report_workbook(report_data, filename)
+    return report_data, filename
+
+register_job_handler('company_report', run_company_report_job)
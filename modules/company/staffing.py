@@ -0,0 +1,186 @@
+import argparse
+import configparser
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from ..staff_costs import STAFF_TYPES
+from ..utils import setup_database, shift_timestamp
+
+BUCKETS = {"hour": 60, "day": 1440}
+EPOCH = datetime(1970, 1, 1)
+
+def timestamp_label(timestamp, fmt="%Y-%m-%d %H:%M"):
+    """Format a shift timestamp (Unix seconds of the local wall-clock time) for display"""
+    return (EPOCH + timedelta(seconds=timestamp)).strftime(fmt)
+
+def standard_weekly_hours():
+    """Contracted hours per week that utilization is measured against"""
+    config = configparser.ConfigParser()
+    config.read('Config/config.ini')
+    return config.getfloat('STAFFING', 'standard_weekly_hours', fallback=40.0)
+
+def load_shift_events(from_date, to_date, staff_types=STAFF_TYPES):
+    """Read the shifts overlapping from_date..to_date (inclusive) as sorted start/end events.
+
+    Returns (events, employees): events are (timestamp, delta, staff_type)
+    tuples clipped to the range, with ends sorted before starts at the same
+    instant so a handover is not counted twice; employees maps
+    (staff_type, id) to their name, shift count and hours within the range.
+    """
+    start_ts = shift_timestamp(datetime.strptime(from_date, "%Y-%m-%d"))
+    end_ts = shift_timestamp(datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1))
+
+    events = []
+    employees = {}
+    for staff_type in staff_types:
+        conn = sqlite3.connect(f"db/{staff_type}s.db")
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, name FROM {staff_type}s")
+        for staff_id, name in cursor.fetchall():
+            employees[(staff_type, staff_id)] = {"staff_type": staff_type, "id": staff_id, "name": name, "shifts": 0, "hours": 0.0}
+
+        cursor.execute(f"""
+            SELECT sh.{staff_type}_id, MAX(sh.arrival_ts, ?), MIN(sh.leave_ts, ?)
+            FROM {staff_type}_shifts sh
+            JOIN {staff_type}s s ON sh.{staff_type}_id = s.id
+            WHERE sh.leave_ts > ? AND sh.arrival_ts < ?
+        """, (start_ts, end_ts, start_ts, end_ts))
+        for staff_id, arrival, leave in cursor:
+            if leave <= arrival:
+                continue
+            events.append((arrival, 1, staff_type))
+            events.append((leave, -1, staff_type))
+            employee = employees[(staff_type, staff_id)]
+            employee["shifts"] += 1
+            employee["hours"] += (leave - arrival) / 3600
+        conn.close()
+
+    events.sort()
+    return events, employees
+
+def sweep_concurrency(events, start_ts, end_ts, bucket_seconds):
+    """Walk sorted start/end events once and return the headcount of every bucket.
+
+    Each bucket is a dict with its start timestamp and, per staff type, the
+    peak headcount and the average headcount (staff hours on the floor
+    divided by the bucket length). Runs in O(events + buckets).
+    """
+    counts = {staff_type: 0 for staff_type in STAFF_TYPES}
+    buckets = []
+    bucket_start = start_ts
+    last = start_ts
+    peak = dict(counts)
+    area = {staff_type: 0 for staff_type in STAFF_TYPES}
+
+    def close_bucket():
+        bucket_end = min(bucket_start + bucket_seconds, end_ts)
+        bucket = {"start": bucket_start}
+        for staff_type in STAFF_TYPES:
+            total = area[staff_type] + counts[staff_type] * (bucket_end - last)
+            bucket[f"{staff_type}_peak"] = peak[staff_type]
+            bucket[f"{staff_type}_average"] = total / (bucket_end - bucket_start)
+        buckets.append(bucket)
+        return bucket_end
+
+    for timestamp, delta, staff_type in events:
+        while timestamp >= bucket_start + bucket_seconds and bucket_start < end_ts:
+            last = bucket_start = close_bucket()
+            peak = dict(counts)
+            area = {key: 0 for key in area}
+        for key in area:
+            area[key] += counts[key] * (timestamp - last)
+        last = timestamp
+        counts[staff_type] += delta
+        peak[staff_type] = max(peak[staff_type], counts[staff_type])
+
+    while bucket_start < end_ts:
+        last = bucket_start = close_bucket()
+        peak = dict(counts)
+        area = {key: 0 for key in area}
+    return buckets
+
+def hour_profile(buckets):
+    """Average the buckets by time of day, e.g. the mean headcount at 08:00 over every day of the range"""
+    slots = {}
+    for bucket in buckets:
+        slot = slots.setdefault(bucket["start"] % 86400, {"count": 0, **{f"{t}_average": 0.0 for t in STAFF_TYPES},
+                                                            **{f"{t}_peak": 0 for t in STAFF_TYPES}})
+        slot["count"] += 1
+        for staff_type in STAFF_TYPES:
+            slot[f"{staff_type}_average"] += bucket[f"{staff_type}_average"]
+            slot[f"{staff_type}_peak"] = max(slot[f"{staff_type}_peak"], bucket[f"{staff_type}_peak"])
+
+    profile = []
+    for offset in sorted(slots):
+        slot = slots[offset]
+        row = {"time": f"{offset // 3600:02d}:{offset % 3600 // 60:02d}"}
+        for staff_type in STAFF_TYPES:
+            row[f"{staff_type}_average"] = slot[f"{staff_type}_average"] / slot["count"]
+            row[f"{staff_type}_peak"] = slot[f"{staff_type}_peak"]
+        profile.append(row)
+    return profile
+
+def staffing_report(from_date, to_date, bucket="hour", progress_callback=None):
+    """Concurrent doctor and nurse headcount and per-employee utilization for a date range.
+
+    The shifts are read with one query per staff type and turned into
+    start/end events that are sorted once and swept once, so there is no
+    query per bucket. Utilization is the employee's hours on shift within
+    the range divided by the standard weekly hours pro rata for its length.
+    progress_callback, if given, is called with (done, 2) after each step.
+    """
+    bucket_seconds = BUCKETS[bucket] * 60
+    start_ts = shift_timestamp(datetime.strptime(from_date, "%Y-%m-%d"))
+    end_ts = shift_timestamp(datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1))
+
+    events, employees = load_shift_events(from_date, to_date)
+    if progress_callback:
+        progress_callback(1, 2)
+    buckets = sweep_concurrency(events, start_ts, end_ts, bucket_seconds)
+    for item in buckets:
+        item["label"] = timestamp_label(item["start"], "%Y-%m-%d %H:%M" if bucket == "hour" else "%Y-%m-%d")
+
+    available_hours = standard_weekly_hours() * (end_ts - start_ts) / (7 * 86400)
+    utilization = []
+    for employee in sorted(employees.values(), key=lambda e: (e["staff_type"], e["name"])):
+        employee["available_hours"] = available_hours
+        employee["utilization"] = employee["hours"] / available_hours if available_hours else 0.0
+        utilization.append(employee)
+    if progress_callback:
+        progress_callback(2, 2)
+
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "bucket": bucket,
+        "buckets": buckets,
+        "profile": hour_profile(buckets) if bucket == "hour" else [],
+        "peak": {staff_type: max((b[f"{staff_type}_peak"] for b in buckets), default=0) for staff_type in STAFF_TYPES},
+        "utilization": utilization,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Show concurrent doctor and nurse headcount and staff utilization for a period")
+    parser.add_argument('--from', dest='from_date', required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='to_date', required=True, help="last day (YYYY-MM-DD)")
+    parser.add_argument('--bucket', choices=sorted(BUCKETS), default="hour")
+    args = parser.parse_args()
+
+    setup_database()
+    started = time.perf_counter()
+    report = staffing_report(args.from_date, args.to_date, args.bucket)
+    elapsed = time.perf_counter() - started
+
+    rows = report["profile"] or report["buckets"]
+    for row in rows:
+        label = row.get("time") or row["label"]
+        print(f"{label:16} doctors {row['doctor_average']:6.2f} (peak {row['doctor_peak']})  "
+              f"nurses {row['nurse_average']:6.2f} (peak {row['nurse_peak']})")
+    print()
+    for employee in report["utilization"]:
+        print(f"{employee['staff_type']:6} {employee['name']:20} {employee['shifts']:4} shifts {employee['hours']:8.2f} h  "
+              f"{employee['utilization']:6.1%}")
+    print(f"\nSwept {len(report['buckets'])} {args.bucket} buckets in {elapsed:.3f}s")
+
+if __name__ == '__main__':
+    main()
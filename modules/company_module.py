@@ -5,6 +5,8 @@ import configparser
 from tkcalendar import DateEntry
 from .utils import format_currency, show_error_message
 from .company.reporting import ReportingHandler
+from .company.staffing import staffing_report
+from .background import run_in_background
 
 class CompanyModule:
     def __init__(self, parent, setup_ui=True):
@@ -48,7 +50,8 @@ class CompanyModule:
         report_type_combo.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=(10, 2), padx=(5, 10))
         report_type_combo.set("Monthly")
         
-        # Generate button
+        # Generate buttons
+        ttk.Button(params_frame, text="Staffing", command=self.show_staffing).grid(row=1, column=2, sticky=tk.E, pady=(10, 2))
         ttk.Button(params_frame, text="Generate Report", command=self.generate_report).grid(row=1, column=3, sticky=tk.E, pady=(10, 2))
         
         # Results frame
@@ -97,73 +100,52 @@ class CompanyModule:
             print("Error: Please enter valid dates (YYYY-MM-DD)")
             return
         
+        def work(progress):
+            return self.reporting_handler.generate_report(
+                from_date, to_date, lambda done, total: progress(done, total, f"Calculating report... {100 * done / total:.0f}%"))
+
+        def on_error(e):
+            show_error_message("Error", f"Failed to generate report: {e}")
+
+        # The report runs on a worker thread so the window stays responsive on long ranges
+        run_in_background(self.parent, "Generating report", work,
+                          lambda report_data: self.show_report(report_data, report_type), on_error)
+
+    def show_report(self, report_data, report_type):
+        """Display a report computed by ReportingHandler.generate_report"""
+        if self.debug_mode:
+            print(f"Patient revenues calculated: Total={report_data['total_patient_revenue']}, Pass-through={report_data['pass_through_costs']}")
+            print(f"Total staff cost: {report_data['total_staff_cost']}")
+            print(f"Net profit: {report_data['net_profit']}")
+            print("--- Report Generation Complete ---")
+
         # Clear previous results
         self.results_text.delete(1.0, tk.END)
         
         # Generate report header
         report_header = f"""
 ICU MANAGEMENT SYSTEM - COMPANY REPORT
-Report Period: {from_date} to {to_date}
+Report Period: {report_data['from_date']} to {report_data['to_date']}
 Report Type: {report_type}
 Generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 
 """ + "="*80 + "\n\n"
         
         self.results_text.insert(tk.END, report_header)
-        
-        # Get patient revenues and pass-through costs
-        if self.debug_mode:
-            print("Calculating patient revenues...")
-        patient_revenues = self.reporting_handler.calculate_patient_revenues(from_date, to_date)
-        total_patient_revenue = patient_revenues['total']
-        pass_through_costs = patient_revenues['operational_cost']
-        if self.debug_mode:
-            print(f"Patient revenues calculated: Total={total_patient_revenue}, Pass-through={pass_through_costs}")
-            print("Patient details:", patient_revenues['details'])
-
-        # Get staff costs
-        if self.debug_mode:
-            print("Calculating doctor costs...")
-        doctor_costs = self.reporting_handler.calculate_doctor_costs(from_date, to_date)
-        if self.debug_mode:
-            print(f"Doctor costs calculated: Total={doctor_costs['total']}")
-            print("Doctor details:", doctor_costs['details'])
-            
-        if self.debug_mode:
-            print("Calculating nurse costs...")
-        nurse_costs = self.reporting_handler.calculate_nurse_costs(from_date, to_date)
-        if self.debug_mode:
-            print(f"Nurse costs calculated: Total={nurse_costs['total']}")
-            print("Nurse details:", nurse_costs['details'])
-            
-        total_staff_cost = doctor_costs['total'] + nurse_costs['total']
-        if self.debug_mode:
-            print(f"Total staff cost: {total_staff_cost}")
-
-        # Calculate total operational costs
-        total_operational_cost = total_staff_cost + pass_through_costs
-        if self.debug_mode:
-            print(f"Total operational cost: {total_operational_cost}")
-        
-        # Calculate net profit
-        net_profit = total_patient_revenue - total_operational_cost
-        if self.debug_mode:
-            print(f"Net profit: {net_profit}")
-            print("--- Report Generation Complete ---")
 
         # Display summary
         summary_text = f"""
 FINANCIAL SUMMARY
 =================
-Total Patient Revenue: {format_currency(total_patient_revenue)}
+Total Patient Revenue: {format_currency(report_data['total_patient_revenue'])}
 
 Operational Costs:
-  - Staff Costs: {format_currency(total_staff_cost)}
-  - Pass-Through Costs (Labs, Drugs, etc.): {format_currency(pass_through_costs)}
+  - Staff Costs: {format_currency(report_data['total_staff_cost'])}
+  - Pass-Through Costs (Labs, Drugs, etc.): {format_currency(report_data['pass_through_costs'])}
 -----------------
-Total Operational Costs: {format_currency(total_operational_cost)}
+Total Operational Costs: {format_currency(report_data['total_operational_cost'])}
 
-Net Profit/Loss: {format_currency(net_profit)}
+Net Profit/Loss: {format_currency(report_data['net_profit'])}
 
 """
         
@@ -171,17 +153,17 @@ Net Profit/Loss: {format_currency(net_profit)}
         
         # Display doctor details
         self.results_text.insert(tk.END, "\nDOCTORS\n" + "-"*40 + "\n")
-        for doctor in doctor_costs['details']:
+        for doctor in report_data['doctor_details']:
             self.results_text.insert(tk.END, f"{doctor['name']}: {format_currency(doctor['cost'])}\n")
         
         # Display nurse details
         self.results_text.insert(tk.END, "\nNURSES\n" + "-"*40 + "\n")
-        for nurse in nurse_costs['details']:
+        for nurse in report_data['nurse_details']:
             self.results_text.insert(tk.END, f"{nurse['name']} ({nurse['level']}): {format_currency(nurse['cost'])}\n")
         
         # Display patient details
         self.results_text.insert(tk.END, "\nPATIENTS\n" + "-"*40 + "\n")
-        for patient in patient_revenues['details']:
+        for patient in report_data['patient_details']:
             self.results_text.insert(tk.END, f"{patient['name']}: {format_currency(patient['revenue'])}\n")
     
     
@@ -208,3 +190,57 @@ Net Profit/Loss: {format_currency(net_profit)}
         except Exception as e:
             show_error_message("Export Error", f"Failed to export report: {e}")
             print(f"Export Error: Failed to export report: {e}")
+
+    def show_staffing(self):
+        """Chart the average doctor and nurse headcount by hour of day and list staff utilization"""
+        if self.from_date_entry.get_date() > self.to_date_entry.get_date():
+            show_error_message("Error", "From date cannot be after to date")
+            return
+        from_date = self.from_date_entry.get_date().strftime("%Y-%m-%d")
+        to_date = self.to_date_entry.get_date().strftime("%Y-%m-%d")
+
+        def work(progress):
+            return staffing_report(from_date, to_date, progress_callback=lambda done, total: progress(
+                done, total, "Sweeping shifts..." if done < total else "Drawing chart..."))
+
+        def on_error(e):
+            show_error_message("Error", f"Failed to compute staffing: {e}")
+
+        run_in_background(self.parent, "Computing staffing", work,
+                          lambda staffing: self.show_staffing_window(staffing, from_date, to_date), on_error)
+
+    def show_staffing_window(self, staffing, from_date, to_date):
+        """Display a report computed by staffing_report in its own window"""
+        window = tk.Toplevel(self.parent)
+        window.title(f"Staffing {from_date} to {to_date}")
+
+        ttk.Label(window, text=f"Average staff on the floor by hour of day (peak {staffing['peak']['doctor']} doctors, "
+                               f"{staffing['peak']['nurse']} nurses)").pack(padx=10, pady=(10, 0))
+        width, height, margin = 720, 240, 30
+        chart = tk.Canvas(window, width=width, height=height, background="white")
+        chart.pack(padx=10, pady=10)
+
+        profile = staffing['profile']
+        scale = max([row[f"{staff_type}_average"] for row in profile for staff_type in ("doctor", "nurse")] + [1])
+        slot_width = (width - 2 * margin) / max(len(profile), 1)
+        chart.create_line(margin, height - margin, width - margin, height - margin)
+        for index, row in enumerate(profile):
+            x = margin + index * slot_width
+            for offset, (staff_type, color) in enumerate([("doctor", "#1f77b4"), ("nurse", "#d62728")]):
+                bar_height = row[f"{staff_type}_average"] / scale * (height - 2 * margin)
+                left = x + 2 + offset * (slot_width - 4) / 2
+                chart.create_rectangle(left, height - margin - bar_height, left + (slot_width - 4) / 2, height - margin,
+                                       fill=color, outline="")
+            if index % 3 == 0:
+                chart.create_text(x + slot_width / 2, height - margin / 2, text=row['time'], font=("TkDefaultFont", 8))
+        chart.create_text(margin, margin / 2, text=f"max {scale:.2f}", anchor=tk.W, font=("TkDefaultFont", 8))
+        chart.create_text(width - margin, margin / 2, text="doctors", fill="#1f77b4", anchor=tk.E, font=("TkDefaultFont", 8))
+        chart.create_text(width - margin - 60, margin / 2, text="nurses", fill="#d62728", anchor=tk.E, font=("TkDefaultFont", 8))
+
+        utilization_text = tk.Text(window, height=12, wrap=tk.NONE)
+        utilization_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        utilization_text.insert(tk.END, "UTILIZATION\n" + "-" * 40 + "\n")
+        for employee in staffing['utilization']:
+            utilization_text.insert(tk.END, f"{employee['staff_type'].capitalize():7} {employee['name']:20} {employee['shifts']:4} shifts "
+                                            f"{employee['hours']:8.2f} h  {employee['utilization']:6.1%}\n")
+        utilization_text.configure(state=tk.DISABLED)
@@ -3,6 +3,7 @@ from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
 from ..utils import format_currency
+from ..patient.balances import adjust_changed_charges, attach_patients_db, remove_staff_charges, staff_shift_charges
 
 class DoctorCRUD:
     def __init__(self, doctor_module, auth_module):
@@ -71,11 +72,16 @@ class DoctorCRUD:
         conn = sqlite3.connect("db/doctors.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
+            cursor.execute("BEGIN IMMEDIATE")
+            before = staff_shift_charges(cursor, "doctor", doctor_id)
             cursor.execute("UPDATE doctors SET name = ?, hourly_rate = ? WHERE id = ?", (name, rate, doctor_id))
+            adjust_changed_charges(cursor, "doctor", before, staff_shift_charges(cursor, "doctor", doctor_id), "patients_db")
             conn.commit()
             self.auth_module.log_action(self.auth_module.current_user, "UPDATE_DOCTOR", f"Updated doctor: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error updating doctor: {e}")
             return False
         finally:
@@ -90,10 +96,13 @@ class DoctorCRUD:
             doctor = cursor.fetchone()
             if doctor:
                 doctor_name = doctor[0]
+                remove_staff_charges(cursor, "doctor", doctor_id)
+                # The staff row goes first: shifts in closed payroll months may only be deleted with their employee
+                cursor.execute("DELETE FROM doctors WHERE id = ?", (doctor_id,))
                 cursor.execute("DELETE FROM doctor_shifts WHERE doctor_id = ?", (doctor_id,))
                 cursor.execute("DELETE FROM doctor_interventions WHERE doctor_id = ?", (doctor_id,))
                 cursor.execute("DELETE FROM doctor_payments WHERE doctor_id = ?", (doctor_id,))
-                cursor.execute("DELETE FROM doctors WHERE id = ?", (doctor_id,))
+                cursor.execute("DELETE FROM doctor_roster_templates WHERE doctor_id = ?", (doctor_id,))
                 conn.commit()
                 self.auth_module.log_action(self.auth_module.current_user, "DELETE_DOCTOR", f"Deleted doctor: {doctor_name}")
                 return True
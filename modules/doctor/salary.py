@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import openpyxl
-from ..utils import format_currency, calculate_salary_details, show_error_message
+from ..utils import format_currency, show_error_message
+from ..payroll import salary_summary
+from ..background import run_in_background
 
 class SalaryHandler:
     def __init__(self, doctor_module):
@@ -26,7 +28,7 @@ class SalaryHandler:
         start_date_str = start_date.strftime('%Y-%m-%d')
         end_date_str = end_date.strftime('%Y-%m-%d')
 
-        salary_details = calculate_salary_details("doctor", self.doctor_module.current_doctor_id, start_date_str, end_date_str)
+        salary_details = salary_summary("doctor", self.doctor_module.current_doctor_id, start_date_str, end_date_str)
 
         if not salary_details:
             show_error_message("Error", "Could not calculate salary.")
@@ -64,41 +66,56 @@ Total Salary: {format_currency(salary_details['total_salary'])}
         start_date_str = start_date.strftime('%Y-%m-%d')
         end_date_str = end_date.strftime('%Y-%m-%d')
 
-        salary_details = calculate_salary_details("doctor", self.doctor_module.current_doctor_id, start_date_str, end_date_str)
+        staff_id = self.doctor_module.current_doctor_id
 
-        if not salary_details:
-            show_error_message("Error", "Could not export salary sheet.")
-            return
+        def work(progress):
+            progress(0, 0, "Calculating salary...")
+            salary_details = salary_summary("doctor", staff_id, start_date_str, end_date_str)
+            if not salary_details:
+                raise ValueError("Could not export salary sheet.")
+            return write_salary_sheet(salary_details, start_date_str, end_date_str, progress)
 
-        filename = f"{salary_details['name']}_salary_{start_date_str}_to_{end_date_str}.xlsx"
-
-        try:
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            sheet.title = "Salary Sheet"
-
-            sheet.append(["Doctor Salary Sheet"])
-            sheet.append([])
-            sheet.append(["Doctor Name:", salary_details['name']])
-            sheet.append(["Period:", f"{start_date_str} to {end_date_str}"])
-            sheet.append([])
-            sheet.append(["Total Hours:", f"{salary_details['total_hours']:.2f}"])
-            sheet.append(["Hourly Rate:", format_currency(salary_details['hourly_rate'])])
-            sheet.append(["Base Salary:", format_currency(salary_details['base_salary'])])
-            sheet.append(["Bonus from Interventions:", format_currency(salary_details['total_bonus'])])
-            sheet.append(["Total Salary:", format_currency(salary_details['total_salary'])])
-            sheet.append([])
-            sheet.append(["Shifts"])
-            sheet.append(["Arrival", "Leave", "Patient", "Hours"])
-            for shift in salary_details['shifts']:
-                sheet.append([shift['arrival'], shift['leave'], shift['patient'], shift['hours']])
-            sheet.append([])
-            sheet.append(["Interventions"])
-            sheet.append(["Date", "Intervention", "Patient", "Bonus"])
-            for intervention in salary_details['interventions']:
-                sheet.append([intervention['date'], intervention['name'], intervention['patient'], format_currency(intervention['bonus'])])
-
-            workbook.save(filename)
-            messagebox.showinfo("Export Success", f"Salary sheet exported to {filename}")
-        except Exception as e:
+        def on_error(e):
             show_error_message("Export Error", f"Failed to export salary sheet: {e}")
+
+        run_in_background(self.parent, "Exporting salary sheet", work,
+                          lambda filename: messagebox.showinfo("Export Success", f"Salary sheet exported to {filename}"), on_error)
+
+def write_salary_sheet(salary_details, start_date_str, end_date_str, progress=None):
+    """Write a doctor's salary details to an Excel salary sheet and return its filename"""
+    filename = f"{salary_details['name']}_salary_{start_date_str}_to_{end_date_str}.xlsx"
+    rows = len(salary_details['shifts']) + len(salary_details['interventions'])
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Salary Sheet"
+
+    sheet.append(["Doctor Salary Sheet"])
+    sheet.append([])
+    sheet.append(["Doctor Name:", salary_details['name']])
+    sheet.append(["Period:", f"{start_date_str} to {end_date_str}"])
+    sheet.append([])
+    sheet.append(["Total Hours:", f"{salary_details['total_hours']:.2f}"])
+    sheet.append(["Hourly Rate:", format_currency(salary_details['hourly_rate'])])
+    sheet.append(["Base Salary:", format_currency(salary_details['base_salary'])])
+    sheet.append(["Bonus from Interventions:", format_currency(salary_details['total_bonus'])])
+    sheet.append(["Total Salary:", format_currency(salary_details['total_salary'])])
+    sheet.append([])
+    sheet.append(["Shifts"])
+    sheet.append(["Arrival", "Leave", "Patient", "Hours"])
+    for index, shift in enumerate(salary_details['shifts']):
+        sheet.append([shift['arrival'], shift['leave'], shift['patient'], shift['hours']])
+        if progress and index % 100 == 0:
+            progress(index, rows, "Writing shifts...")
+    sheet.append([])
+    sheet.append(["Interventions"])
+    sheet.append(["Date", "Intervention", "Patient", "Bonus"])
+    for index, intervention in enumerate(salary_details['interventions'], len(salary_details['shifts'])):
+        sheet.append([intervention['date'], intervention['name'], intervention['patient'], format_currency(intervention['bonus'])])
+        if progress and index % 100 == 0:
+            progress(index, rows, "Writing interventions...")
+
+    if progress:
+        progress(rows, rows, "Saving workbook...")
+    workbook.save(filename)
+    return filename
@@ -3,7 +3,8 @@ from tkinter import ttk, messagebox
 import sqlite3
 from datetime import datetime
 from ..utils import show_error_message
-from ..utils import calculate_hours
+from ..utils import calculate_hours, find_overlapping_shift, shift_timestamp
+from ..patient.balances import adjust_balance, attach_patients_db, shift_charge
 
 class ShiftsHandler:
     def __init__(self, doctor_module):
@@ -14,23 +15,9 @@ class ShiftsHandler:
         """Check for overlapping shifts with a 20-minute tolerance."""
         conn = sqlite3.connect("db/doctors.db")
         cursor = conn.cursor()
-        cursor.execute("SELECT arrival_datetime, leave_datetime FROM doctor_shifts WHERE doctor_id = ?", (doctor_id,))
-        existing_shifts = cursor.fetchall()
+        overlapping = find_overlapping_shift(cursor, "doctor", doctor_id, arrival_datetime, leave_datetime)
         conn.close()
-
-        for existing_arrival_str, existing_leave_str in existing_shifts:
-            existing_arrival = datetime.strptime(existing_arrival_str, "%Y-%m-%d %H:%M:%S")
-            existing_leave = datetime.strptime(existing_leave_str, "%Y-%m-%d %H:%M:%S")
-
-            overlap_start = max(arrival_datetime, existing_arrival)
-            overlap_end = min(leave_datetime, existing_leave)
-
-            if overlap_start < overlap_end:
-                overlap_duration = overlap_end - overlap_start
-                if overlap_duration.total_seconds() / 60 > 20:
-                    return True  # Overlap is more than 20 minutes
-        
-        return False # No overlap or overlap is within tolerance
+        return overlapping is not None
 
     def get_shifts_for_doctor(self, doctor_id):
         """Fetch all shifts for a specific doctor."""
@@ -52,16 +39,22 @@ class ShiftsHandler:
 
     def add_shift(self, doctor_id, patient_id, arrival_datetime, leave_datetime):
         """Add a new shift for a doctor"""
-        if self.check_shift_overlap(doctor_id, arrival_datetime, leave_datetime):
-            return False
-
         conn = sqlite3.connect("db/doctors.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
+            # The overlap check and the insert share one write transaction, so
+            # concurrent requests cannot book the same hours twice
+            cursor.execute("BEGIN IMMEDIATE")
+            if find_overlapping_shift(cursor, "doctor", doctor_id, arrival_datetime, leave_datetime):
+                conn.rollback()
+                return False
             cursor.execute("""
-                INSERT INTO doctor_shifts (doctor_id, patient_id, arrival_datetime, leave_datetime)
-                VALUES (?, ?, ?, ?)
-            """, (doctor_id, patient_id, arrival_datetime, leave_datetime))
+                INSERT INTO doctor_shifts (doctor_id, patient_id, arrival_datetime, leave_datetime, arrival_ts, leave_ts)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (doctor_id, patient_id, arrival_datetime, leave_datetime,
+                  shift_timestamp(arrival_datetime), shift_timestamp(leave_datetime)))
+            adjust_balance(cursor, patient_id, "doctor", shift_charge(cursor, "doctor", cursor.lastrowid), "patients_db")
             conn.commit()
             self.doctor_module.auth_module.log_action(self.doctor_module.auth_module.current_user, "ADD_SHIFT", f"Added shift for doctor ID {doctor_id}")
             return True
@@ -76,9 +69,12 @@ class ShiftsHandler:
         conn = sqlite3.connect("db/doctors.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT doctor_id FROM doctor_shifts WHERE id = ?", (shift_id,))
-            doctor_id = cursor.fetchone()[0]
+            attach_patients_db(cursor)
+            cursor.execute("SELECT doctor_id, patient_id FROM doctor_shifts WHERE id = ?", (shift_id,))
+            doctor_id, patient_id = cursor.fetchone()
+            charge = shift_charge(cursor, "doctor", shift_id)
             cursor.execute("DELETE FROM doctor_shifts WHERE id = ?", (shift_id,))
+            adjust_balance(cursor, patient_id, "doctor", -charge, "patients_db")
             conn.commit()
             self.doctor_module.auth_module.log_action(self.doctor_module.auth_module.current_user, "REMOVE_SHIFT", f"Removed shift for doctor ID {doctor_id}")
             return True
@@ -0,0 +1,268 @@
+import sqlite3
+import os
+import json
+import uuid
+import threading
+import traceback
+import configparser
+from datetime import datetime, timedelta
+
+# kind -> callable(job) returning (result, result_path)
+JOB_HANDLERS = {}
+
+def register_job_handler(kind, handler):
+    """Register the function that runs jobs of the given kind"""
+    JOB_HANDLERS[kind] = handler
+
+class Job:
+    """A claimed job, handed to its handler while it runs"""
+    def __init__(self, queue, job_id, kind, params):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self._last_progress = None
+
+    def update_progress(self, done, total, message=None):
+        """Record progress as done/total; writes are throttled to whole percents"""
+        progress = round(100.0 * done / total) if total else 100
+        if progress == self._last_progress and message is None:
+            return
+        self._last_progress = progress
+        self.queue.update(self.id, progress=progress, message=message)
+
+    def output_path(self, filename):
+        """Return a path for a result file in this job's export directory"""
+        job_dir = os.path.join(self.queue.export_dir, "jobs", self.id)
+        os.makedirs(job_dir, exist_ok=True)
+        return os.path.join(job_dir, filename)
+
+class JobQueue:
+    """Persistent job queue backed by db/jobs.db and a local pool of worker threads.
+
+    Jobs are rows in the jobs table. Any process that has started workers
+    claims queued rows with an IMMEDIATE transaction, so several web processes
+    can share the same table without an external broker. Worker threads start
+    lazily on first use so they are created after a pre-forking server forks.
+
+    A running job's heartbeat_at is refreshed every heartbeat_interval seconds
+    while its worker is alive. A job whose heartbeat is older than stale_after
+    seconds belonged to a worker that died or a process that restarted: it is
+    ignored by find_active and marked failed by the next claim.
+    """
+    def __init__(self, db_path="db/jobs.db", workers=None):
+        config = configparser.ConfigParser()
+        config.read('Config/config.ini')
+        self.db_path = db_path
+        self.workers = workers or config.getint('JOBS', 'workers', fallback=2)
+        self.poll_interval = config.getfloat('JOBS', 'poll_interval', fallback=2.0)
+        self.heartbeat_interval = config.getfloat('JOBS', 'heartbeat_interval', fallback=10.0)
+        self.stale_after = config.getfloat('JOBS', 'stale_after', fallback=120.0)
+        self.export_dir = config.get('EXPORT', 'default_export_dir', fallback='exports')
+        self.debug_mode = config.getboolean('DEBUG', 'debugmode', fallback=False)
+        self._threads = []
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self.setup_database()
+
+    def setup_database(self):
+        """Create the jobs table if it does not exist"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT,
+                cache_key TEXT,
+                status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+                progress REAL DEFAULT 0,
+                message TEXT,
+                result TEXT,
+                result_path TEXT,
+                error TEXT,
+                created_by TEXT,
+                created_at TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                heartbeat_at TIMESTAMP
+            )
+        ''')
+        cursor.execute("PRAGMA table_info(jobs)")
+        if 'heartbeat_at' not in [info[1] for info in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_cache_key ON jobs (kind, cache_key, status)")
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def start(self):
+        """Start the worker threads for this process if they are not running"""
+        with self._start_lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, params, created_by=None, cache_key=None):
+        """Queue a job and return its id"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, params, cache_key, status, created_by, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(params), cache_key, created_by, now)
+        )
+        conn.commit()
+        conn.close()
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+
+    def find_finished(self, kind, cache_key):
+        """Return the most recent finished job of a kind with the given cache key"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND cache_key = ? AND status = 'done' ORDER BY finished_at DESC LIMIT 1",
+            (kind, cache_key)
+        ).fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+
+    def find_active(self, kind, cache_key):
+        """Return a queued or running job of a kind with the given cache key, skipping running jobs gone stale"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("""
+            SELECT * FROM jobs
+            WHERE kind = ? AND cache_key = ?
+              AND (status = 'queued' OR (status = 'running' AND heartbeat_at >= ?))
+            ORDER BY created_at DESC LIMIT 1
+        """, (kind, cache_key, self._stale_before())).fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+
+    def update(self, job_id, **fields):
+        """Update progress fields of a running job"""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+        conn.close()
+
+    def _to_dict(self, row):
+        job = dict(row)
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _stale_before(self):
+        """Heartbeats older than this timestamp belong to dead workers"""
+        return (datetime.now() - timedelta(seconds=self.stale_after)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _claim(self):
+        """Fail running jobs whose worker stopped, then atomically move the oldest queued job to running and return it"""
+        conn = self._connect()
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute("""
+                UPDATE jobs SET status = 'failed', error = 'The worker running this job stopped', finished_at = ?
+                WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            """, (now, self._stale_before()))
+            cursor.execute("SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1")
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? WHERE id = ?", (now, now, row[0]))
+            cursor.execute("COMMIT")
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if not row:
+            return None
+        job_id, kind, params = row
+        return Job(self, job_id, kind, json.loads(params) if params else {})
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error claiming job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat(self, job_id, stopped):
+        """Refresh a running job's heartbeat until stopped is set"""
+        while not stopped.wait(self.heartbeat_interval):
+            try:
+                self.update(job_id, heartbeat_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            except sqlite3.Error as e:
+                print(f"Error updating job heartbeat: {e}")
+
+    def _run(self, job):
+        if self.debug_mode:
+            print(f"Running job {job.id} ({job.kind}) with params {job.params}")
+        stopped = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job.id, stopped), name=f"job-heartbeat-{job.id}", daemon=True).start()
+        try:
+            handler = JOB_HANDLERS[job.kind]
+            result, result_path = handler(job)
+            finished = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.update(job.id, status='done', progress=100, result=json.dumps(result), result_path=result_path, finished_at=finished)
+        except Exception as e:
+            traceback.print_exc()
+            finished = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.update(job.id, status='failed', error=str(e), finished_at=finished)
+        finally:
+            stopped.set()
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def _reset_after_fork():
+    """Give a forked child fresh locks; its worker threads are started again on first use"""
+    global _job_queue_lock
+    _job_queue_lock = threading.Lock()
+    if _job_queue is not None:
+        _job_queue._start_lock = threading.Lock()
+        _job_queue._wakeup = threading.Event()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_job_queue():
+    """Return this process's job queue, starting its workers if needed"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+    _job_queue.start()
+    return _job_queue
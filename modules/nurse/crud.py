@@ -3,6 +3,7 @@ from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
 from ..utils import format_currency
+from ..patient.balances import adjust_changed_charges, attach_patients_db, remove_staff_charges, staff_shift_charges
 
 class NurseCRUD:
     def __init__(self, nurse_module, auth_module):
@@ -71,12 +72,17 @@ class NurseCRUD:
         conn = sqlite3.connect("db/nurses.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
+            cursor.execute("BEGIN IMMEDIATE")
+            before = staff_shift_charges(cursor, "nurse", nurse_id)
             cursor.execute("UPDATE nurses SET name = ?, level = ?, hourly_rate = ? WHERE id = ?", 
                           (name, level, rate, nurse_id))
+            adjust_changed_charges(cursor, "nurse", before, staff_shift_charges(cursor, "nurse", nurse_id), "patients_db")
             conn.commit()
             self.auth_module.log_action(self.auth_module.current_user, "UPDATE_NURSE", f"Updated nurse: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error updating nurse: {e}")
             return False
         finally:
@@ -91,10 +97,13 @@ class NurseCRUD:
             nurse = cursor.fetchone()
             if nurse:
                 nurse_name = nurse[0]
+                remove_staff_charges(cursor, "nurse", nurse_id)
+                # The staff row goes first: shifts in closed payroll months may only be deleted with their employee
+                cursor.execute("DELETE FROM nurses WHERE id = ?", (nurse_id,))
                 cursor.execute("DELETE FROM nurse_shifts WHERE nurse_id = ?", (nurse_id,))
                 cursor.execute("DELETE FROM nurse_interventions WHERE nurse_id = ?", (nurse_id,))
                 cursor.execute("DELETE FROM nurse_payments WHERE nurse_id = ?", (nurse_id,))
-                cursor.execute("DELETE FROM nurses WHERE id = ?", (nurse_id,))
+                cursor.execute("DELETE FROM nurse_roster_templates WHERE nurse_id = ?", (nurse_id,))
                 conn.commit()
                 self.auth_module.log_action(self.auth_module.current_user, "DELETE_NURSE", f"Deleted nurse: {nurse_name}")
                 return True
@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
+from ..catalog import get_catalog
+from ..patient.balances import adjust_balance, attach_patients_db
 
 class InterventionsHandler:
     def __init__(self, nurse_module):
@@ -9,28 +11,24 @@ class InterventionsHandler:
         self.parent = nurse_module.parent
 
     def load_interventions(self):
-        """Load interventions from the database"""
-        conn = sqlite3.connect("db/interventions.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, bonus_amount FROM interventions ORDER BY name")
-        interventions = cursor.fetchall()
-        conn.close()
-        return interventions
+        """Load interventions from the reference catalog"""
+        return get_catalog().interventions()
 
     def add_intervention(self, nurse_id, patient_id, date, intervention_id):
         """Add a new intervention for a nurse"""
         conn = sqlite3.connect("db/nurses.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
             cursor.execute("""
                 INSERT INTO nurse_interventions (nurse_id, patient_id, date, intervention_id)
                 VALUES (?, ?, ?, ?)
             """, (nurse_id, patient_id, date, intervention_id))
+            intervention = get_catalog().intervention(intervention_id)
+            adjust_balance(cursor, patient_id, "nurse", intervention[2], "patients_db")
             conn.commit()
             
-            cursor.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
-            cursor.execute("SELECT name FROM interventions_db.interventions WHERE id = ?", (intervention_id,))
-            intervention_name = cursor.fetchone()[0]
+            intervention_name = intervention[1]
             self.nurse_module.auth_module.log_action(self.nurse_module.auth_module.current_user, "ADD_INTERVENTION", f"Added intervention {intervention_name} for nurse ID {nurse_id}")
             return True
         except sqlite3.Error as e:
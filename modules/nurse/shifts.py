@@ -3,7 +3,9 @@ from tkinter import ttk, messagebox
 import sqlite3
 from datetime import datetime
 from ..utils import show_error_message
-from ..utils import calculate_hours
+from ..utils import calculate_hours, find_overlapping_shift, shift_timestamp
+from ..patient.balances import adjust_balance, attach_patients_db, shift_charge
+from ..catalog import get_catalog
 
 class ShiftsHandler:
     def __init__(self, nurse_module):
@@ -12,14 +14,9 @@ class ShiftsHandler:
         self.nurse_levels = self.get_nurse_levels()
 
     def get_nurse_levels(self):
-        """Fetch nurse levels from the database"""
+        """Fetch nurse levels from the reference catalog"""
         try:
-            conn = sqlite3.connect("db/nurses.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, level_name, hourly_rate FROM nurse_levels")
-            levels = {f"{name} ({rate}/hr)": id for id, name, rate in cursor.fetchall()}
-            conn.close()
-            return levels
+            return {f"{name} ({rate}/hr)": id for id, name, rate in get_catalog().nurse_levels()}
         except sqlite3.Error as e:
             show_error_message("Error", f"Failed to fetch nurse levels: {e}")
             return {}
@@ -28,23 +25,9 @@ class ShiftsHandler:
         """Check for overlapping shifts with a 20-minute tolerance."""
         conn = sqlite3.connect("db/nurses.db")
         cursor = conn.cursor()
-        cursor.execute("SELECT arrival_datetime, leave_datetime FROM nurse_shifts WHERE nurse_id = ?", (nurse_id,))
-        existing_shifts = cursor.fetchall()
+        overlapping = find_overlapping_shift(cursor, "nurse", nurse_id, arrival_datetime, leave_datetime)
         conn.close()
-
-        for existing_arrival_str, existing_leave_str in existing_shifts:
-            existing_arrival = datetime.strptime(existing_arrival_str, "%Y-%m-%d %H:%M:%S")
-            existing_leave = datetime.strptime(existing_leave_str, "%Y-%m-%d %H:%M:%S")
-
-            overlap_start = max(arrival_datetime, existing_arrival)
-            overlap_end = min(leave_datetime, existing_leave)
-
-            if overlap_start < overlap_end:
-                overlap_duration = overlap_end - overlap_start
-                if overlap_duration.total_seconds() / 60 > 20:
-                    return True  # Overlap is more than 20 minutes
-        
-        return False # No overlap or overlap is within tolerance
+        return overlapping is not None
 
     def get_shifts_for_nurse(self, nurse_id):
         """Fetch all shifts for a specific nurse."""
@@ -66,16 +49,22 @@ class ShiftsHandler:
 
     def add_shift(self, nurse_id, patient_id, arrival_datetime, leave_datetime, nurse_level_id):
         """Add a new shift for a nurse"""
-        if self.check_shift_overlap(nurse_id, arrival_datetime, leave_datetime):
-            return False
-
         conn = sqlite3.connect("db/nurses.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
+            # The overlap check and the insert share one write transaction, so
+            # concurrent requests cannot book the same hours twice
+            cursor.execute("BEGIN IMMEDIATE")
+            if find_overlapping_shift(cursor, "nurse", nurse_id, arrival_datetime, leave_datetime):
+                conn.rollback()
+                return False
             cursor.execute("""
-                INSERT INTO nurse_shifts (nurse_id, patient_id, arrival_datetime, leave_datetime, nurse_level_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (nurse_id, patient_id, arrival_datetime, leave_datetime, nurse_level_id))
+                INSERT INTO nurse_shifts (nurse_id, patient_id, arrival_datetime, leave_datetime, nurse_level_id, arrival_ts, leave_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (nurse_id, patient_id, arrival_datetime, leave_datetime, nurse_level_id,
+                  shift_timestamp(arrival_datetime), shift_timestamp(leave_datetime)))
+            adjust_balance(cursor, patient_id, "nurse", shift_charge(cursor, "nurse", cursor.lastrowid), "patients_db")
             conn.commit()
             self.nurse_module.auth_module.log_action(self.nurse_module.auth_module.current_user, "ADD_SHIFT", f"Added shift for nurse ID {nurse_id}")
             return True
@@ -90,9 +79,12 @@ class ShiftsHandler:
         conn = sqlite3.connect("db/nurses.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT nurse_id FROM nurse_shifts WHERE id = ?", (shift_id,))
-            nurse_id = cursor.fetchone()[0]
+            attach_patients_db(cursor)
+            cursor.execute("SELECT nurse_id, patient_id FROM nurse_shifts WHERE id = ?", (shift_id,))
+            nurse_id, patient_id = cursor.fetchone()
+            charge = shift_charge(cursor, "nurse", shift_id)
             cursor.execute("DELETE FROM nurse_shifts WHERE id = ?", (shift_id,))
+            adjust_balance(cursor, patient_id, "nurse", -charge, "patients_db")
             conn.commit()
             self.nurse_module.auth_module.log_action(self.nurse_module.auth_module.current_user, "REMOVE_SHIFT", f"Removed shift for nurse ID {nurse_id}")
             return True
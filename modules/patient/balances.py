@@ -0,0 +1,198 @@
+import argparse
+import sqlite3
+from .billing import PatientBillEngine, CATEGORIES, RENTAL_DAYS_SQL
+from ..utils import setup_database
+from ..catalog import get_catalog
+from ..staff_costs import SHIFT_HOURS_SQL, shift_rate_sql, shift_tables_sql, shift_costs, shift_cost
+
+COMPONENTS = ["stays"] + CATEGORIES + ["equipment", "doctor", "nurse"]
+
+def adjust_balance(cursor, patient_id, component, amount, schema="main"):
+    """Add amount to one component of a patient's running balance.
+
+    Runs on the caller's cursor so the adjustment commits or rolls back with
+    the charge that caused it. Connections to another database attach
+    patients.db and pass its schema name.
+    """
+    if not amount:
+        return
+    cursor.execute(f"INSERT OR IGNORE INTO {schema}.patient_balances (patient_id) VALUES (?)", (patient_id,))
+    cursor.execute(f"""
+        UPDATE {schema}.patient_balances
+        SET {component} = {component} + ?, total = total + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE patient_id = ?
+    """, (amount, amount, patient_id))
+
+def attach_patients_db(cursor):
+    """Attach patients.db to a staff database connection as patients_db"""
+    cursor.execute("ATTACH DATABASE 'db/patients.db' AS patients_db")
+
+def shift_charge(cursor, staff_type, shift_id):
+    """Return what a stored shift adds to a bill: its hours at the shift's hourly rate"""
+    return shift_cost(cursor, staff_type, shift_id)
+
+def remove_staff_charges(cursor, staff_type, staff_id):
+    """Take a staff member's shifts and interventions off every patient balance before they are deleted"""
+    attach_patients_db(cursor)
+    cursor.execute(f"""
+        SELECT sh.patient_id, SUM({SHIFT_HOURS_SQL} * {shift_rate_sql(staff_type)})
+        FROM {shift_tables_sql(staff_type)}
+        WHERE sh.{staff_type}_id = ?
+        GROUP BY sh.patient_id
+    """, (staff_id,))
+    for patient_id, charge in cursor.fetchall():
+        adjust_balance(cursor, patient_id, staff_type, -(charge or 0.0), "patients_db")
+    cursor.execute(f"SELECT patient_id, intervention_id FROM {staff_type}_interventions WHERE {staff_type}_id = ?", (staff_id,))
+    for patient_id, intervention_id in cursor.fetchall():
+        intervention = get_catalog().intervention(intervention_id)
+        if intervention:
+            adjust_balance(cursor, patient_id, staff_type, -intervention[2], "patients_db")
+
+def adjust_changed_charges(cursor, component, before, after, schema="main"):
+    """Move each patient's balance by the difference between two {patient_id: charge} readings.
+
+    Rate edits read the affected charges, update the rate and read them
+    again on the same cursor, so only those patients' balances change and
+    the adjustment commits with the edit.
+    """
+    for patient_id in set(before) | set(after):
+        adjust_balance(cursor, patient_id, component, after.get(patient_id, 0.0) - before.get(patient_id, 0.0), schema)
+
+def care_level_charges(cursor, care_level_id):
+    """Return {patient_id: stay charges} at a care level, on an items.db connection with patients_db attached"""
+    cursor.execute("""
+        SELECT ps.patient_id, SUM(cl.daily_rate)
+        FROM patients_db.patient_stays ps
+        JOIN care_levels cl ON ps.care_level_id = cl.id
+        WHERE ps.care_level_id = ? AND ps.patient_id IN (SELECT id FROM patients_db.patients)
+        GROUP BY ps.patient_id
+    """, (care_level_id,))
+    return {patient_id: charge or 0.0 for patient_id, charge in cursor.fetchall()}
+
+def intervention_charges(cursor, staff_type, intervention_id):
+    """Return {patient_id: bonus charges} of an intervention, on an interventions.db connection with the staff db and patients_db attached"""
+    cursor.execute(f"""
+        SELECT si.patient_id, SUM(i.bonus_amount)
+        FROM {staff_type}s_db.{staff_type}_interventions si
+        JOIN interventions i ON si.intervention_id = i.id
+        WHERE si.intervention_id = ? AND si.patient_id IN (SELECT id FROM patients_db.patients)
+        GROUP BY si.patient_id
+    """, (intervention_id,))
+    return {patient_id: charge or 0.0 for patient_id, charge in cursor.fetchall()}
+
+def staff_shift_charges(cursor, staff_type, staff_id):
+    """Return {patient_id: shift charges} of one staff member, on a staff db connection with patients_db attached"""
+    costs = shift_costs(cursor, staff_type, "patient_id",
+                        where=f"sh.{staff_type}_id = ? AND sh.patient_id IN (SELECT id FROM patients_db.patients)",
+                        params=(staff_id,))
+    return {patient_id: cost for patient_id, (shifts, hours, cost) in costs.items()}
+
+def compute_balances(cursor):
+    """Recompute every patient's balance from the raw charge rows with grouped queries"""
+    balances = {}
+
+    def add(rows, component):
+        for patient_id, amount in rows:
+            balances.setdefault(patient_id, dict.fromkeys(COMPONENTS, 0.0))[component] += amount or 0.0
+
+    cursor.execute("""
+        SELECT ps.patient_id, SUM(cl.daily_rate) FROM patient_stays ps
+        JOIN items_db.care_levels cl ON ps.care_level_id = cl.id
+        GROUP BY ps.patient_id
+    """)
+    add(cursor.fetchall(), "stays")
+
+    for category in CATEGORIES:
+        cursor.execute(f"""
+            SELECT patient_id, SUM(line_total) FROM patient_{category}
+            GROUP BY patient_id
+        """)
+        add(cursor.fetchall(), category)
+
+    cursor.execute(f"SELECT patient_id, SUM({RENTAL_DAYS_SQL} * daily_rental_price) FROM patient_equipment GROUP BY patient_id")
+    add(cursor.fetchall(), "equipment")
+
+    for staff_type in ["doctor", "nurse"]:
+        db = f"{staff_type}s_db"
+        costs = shift_costs(cursor, staff_type, "patient_id", db)
+        add([(patient_id, cost) for patient_id, (shifts, hours, cost) in costs.items()], staff_type)
+        cursor.execute(f"""
+            SELECT si.patient_id, SUM(i.bonus_amount)
+            FROM {db}.{staff_type}_interventions si
+            JOIN interventions_db.interventions i ON si.intervention_id = i.id
+            GROUP BY si.patient_id
+        """)
+        add(cursor.fetchall(), staff_type)
+
+    # Only patients that still exist carry a balance
+    cursor.execute("SELECT id FROM patients")
+    existing = {row[0] for row in cursor.fetchall()}
+    return {patient_id: components for patient_id, components in balances.items() if patient_id in existing}
+
+def reconcile_balances(fix=False, tolerance=0.005):
+    """Compare patient_balances with the raw rows; with fix=True rewrite the table to match.
+
+    An audit and repair command: every write path, rate edits included,
+    adjusts the balances it affects in its own transaction.
+
+    Returns a list of (patient_id, component, stored, expected) mismatches.
+    """
+    conn = PatientBillEngine().connect()
+    cursor = conn.cursor()
+    try:
+        expected = compute_balances(cursor)
+        cursor.execute(f"SELECT patient_id, {', '.join(COMPONENTS)} FROM patient_balances")
+        stored = {row[0]: dict(zip(COMPONENTS, row[1:])) for row in cursor.fetchall()}
+
+        mismatches = []
+        for patient_id in sorted(set(expected) | set(stored)):
+            for component in COMPONENTS:
+                stored_amount = stored.get(patient_id, {}).get(component, 0.0)
+                expected_amount = expected.get(patient_id, {}).get(component, 0.0)
+                if abs(stored_amount - expected_amount) > tolerance:
+                    mismatches.append((patient_id, component, stored_amount, expected_amount))
+
+        if fix and mismatches:
+            cursor.execute("DELETE FROM patient_balances")
+            cursor.executemany(
+                f"INSERT INTO patient_balances (patient_id, {', '.join(COMPONENTS)}, total) VALUES (?{', ?' * (len(COMPONENTS) + 1)})",
+                [(patient_id, *[components[c] for c in COMPONENTS], sum(components.values()))
+                 for patient_id, components in expected.items()]
+            )
+            conn.commit()
+        return mismatches
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error reconciling patient balances: {e}")
+        return []
+    finally:
+        conn.close()
+
+def backfill_balances():
+    """Fill an empty patient_balances table from existing charges"""
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM patient_balances), EXISTS (SELECT 1 FROM patients)")
+    has_balances, has_patients = cursor.fetchone()
+    conn.close()
+    if has_patients and not has_balances:
+        reconcile_balances(fix=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify patient_balances against the raw charge rows")
+    parser.add_argument('--fix', action='store_true', help="rewrite patient_balances from the raw rows")
+    args = parser.parse_args()
+
+    setup_database()
+    mismatches = reconcile_balances(fix=args.fix)
+    for patient_id, component, stored, expected in mismatches:
+        print(f"Patient {patient_id} {component}: stored {stored:.2f}, expected {expected:.2f}")
+    if not mismatches:
+        print("All patient balances match")
+    elif args.fix:
+        print(f"Fixed {len(mismatches)} mismatched balance(s)")
+    else:
+        print(f"{len(mismatches)} mismatched balance(s); run with --fix to rebuild")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import multiprocessing
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import openpyxl
+from .billing import PatientBillEngine
+from .costing_export import write_cost_sheet, write_cost_sheet_pdf
+from ..jobs import register_job_handler
+
+def select_patients(discharged_from=None, discharged_to=None, status=None):
+    """Return ids of patients discharged in a date range and/or with a status.
+
+    status is 'discharged' (has a discharge date) or 'admitted' (no discharge
+    date yet); None selects both.
+    """
+    query = "SELECT id FROM patients WHERE 1 = 1"
+    params = []
+    if discharged_from:
+        query += " AND discharge_date >= ?"
+        params.append(discharged_from)
+    if discharged_to:
+        query += " AND discharge_date <= ?"
+        params.append(discharged_to)
+    if status == 'discharged':
+        query += " AND discharge_date IS NOT NULL AND discharge_date != ''"
+    elif status == 'admitted':
+        query += " AND (discharge_date IS NULL OR discharge_date = '')"
+    query += " ORDER BY id"
+
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    patient_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return patient_ids
+
+def safe_filename(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "patient"
+
+_engine = None
+_engine_conn = None
+
+def _init_worker(cwd):
+    """Open one attached connection per worker process and reuse it for every bill"""
+    global _engine, _engine_conn
+    os.chdir(cwd)
+    _engine = PatientBillEngine()
+    _engine_conn = _engine.connect()
+
+def _bill_patient(patient_id, out_dir, formats):
+    """Compute one bill and write its files; runs in a worker process"""
+    bill = _engine.compute_bill(patient_id, _engine_conn)
+    if not bill:
+        return None
+    patient = bill['patient']
+    base = f"{patient['id']:05d}_{safe_filename(patient['name'])}_cost_sheet"
+    files = []
+    if 'xlsx' in formats:
+        write_cost_sheet(bill, os.path.join(out_dir, base + ".xlsx"))
+        files.append(base + ".xlsx")
+    if 'pdf' in formats:
+        write_cost_sheet_pdf(bill, os.path.join(out_dir, base + ".pdf"))
+        files.append(base + ".pdf")
+    return {
+        'id': patient['id'],
+        'name': patient['name'],
+        'admission_date': patient['admission_date'],
+        'discharge_date': patient['discharge_date'],
+        'totals': bill['totals'],
+        'total': bill['total'],
+        'files': files,
+    }
+
+def write_index_sheet(summaries, filename):
+    """Write the summary index of a billing batch"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Index"
+    columns = ["stays", "labs", "drugs", "radiology", "consultations", "equipment", "doctor", "nurse"]
+    sheet.append(["Patient ID", "Name", "Admission Date", "Discharge Date"] + [c.capitalize() for c in columns] + ["Total", "Files"])
+    for summary in summaries:
+        sheet.append([summary['id'], summary['name'], summary['admission_date'], summary['discharge_date'] or 'N/A']
+                     + [summary['totals'][c] for c in columns] + [summary['total'], ", ".join(summary['files'])])
+    sheet.append([])
+    sheet.append(["Patients", len(summaries)])
+    sheet.append(["Grand Total", sum(summary['total'] for summary in summaries)])
+    workbook.save(filename)
+
+def run_batch_billing(patient_ids, zip_path, formats=("xlsx",), workers=None, progress_callback=None):
+    """Bill the given patients in parallel and bundle the sheets and an index into a zip.
+
+    Bills are computed in a pool of worker processes (spawned, so this is
+    safe to call from a threaded web process), each holding one database
+    connection. Returns the per-patient summaries in patient id order.
+    """
+    workers = workers or os.cpu_count() or 1
+    summaries = []
+    with tempfile.TemporaryDirectory(prefix="batch_billing_") as out_dir:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(os.getcwd(),)) as pool:
+            futures = [pool.submit(_bill_patient, patient_id, out_dir, tuple(formats)) for patient_id in patient_ids]
+            for done, future in enumerate(as_completed(futures), 1):
+                summary = future.result()
+                if summary:
+                    summaries.append(summary)
+                if progress_callback:
+                    progress_callback(done, len(futures))
+
+        summaries.sort(key=lambda summary: summary['id'])
+        write_index_sheet(summaries, os.path.join(out_dir, "index.xlsx"))
+
+        os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            bundle.write(os.path.join(out_dir, "index.xlsx"), "index.xlsx")
+            for summary in summaries:
+                for name in summary['files']:
+                    bundle.write(os.path.join(out_dir, name), name)
+    return summaries
+
+def run_batch_billing_job(job):
+    """Job handler: bill the selected patients and return the zip bundle"""
+    params = job.params
+    patient_ids = select_patients(params.get('discharged_from'), params.get('discharged_to'), params.get('status'))
+    zip_path = job.output_path(f"billing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+    summaries = run_batch_billing(patient_ids, zip_path, params.get('formats', ["xlsx"]), params.get('workers'), job.update_progress)
+    result = {
+        'patients': len(summaries),
+        'grand_total': sum(summary['total'] for summary in summaries),
+    }
+    return result, zip_path
+
+register_job_handler('batch_billing', run_batch_billing_job)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate cost sheets for many patients and bundle them into a zip")
+    parser.add_argument('--from', dest='discharged_from', help="first discharge date (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='discharged_to', help="last discharge date (YYYY-MM-DD)")
+    parser.add_argument('--status', choices=['discharged', 'admitted'])
+    parser.add_argument('--pdf', action='store_true', help="also write a PDF per patient")
+    parser.add_argument('--workers', type=int, help="worker processes (default: number of cores)")
+    parser.add_argument('--output', help="zip file to write")
+    args = parser.parse_args()
+
+    patient_ids = select_patients(args.discharged_from, args.discharged_to, args.status)
+    if not patient_ids:
+        print("No patients match the selection")
+        return
+    zip_path = args.output or f"billing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    formats = ["xlsx", "pdf"] if args.pdf else ["xlsx"]
+
+    def progress(done, total):
+        print(f"\rBilled {done}/{total} patients", end="", flush=True)
+
+    summaries = run_batch_billing(patient_ids, zip_path, formats, args.workers, progress)
+    print(f"\nWrote {len(summaries)} cost sheets to {zip_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import sqlite3
+from datetime import datetime
+from ..staff_costs import STAFF_TYPES, SHIFT_HOURS_SQL, shift_rate_sql, shift_tables_sql
+
+CATEGORIES = ["labs", "drugs", "radiology", "consultations"]
+
+# Days charged for a rental row; a row without an end date is one day
+RENTAL_DAYS_SQL = "MAX(COALESCE(CAST(julianday(end_date) - julianday(start_date) AS INTEGER), 1), 1)"
+
+def rental_days(start_date, end_date):
+    """Python counterpart of RENTAL_DAYS_SQL"""
+    if not end_date:
+        return 1
+    days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+    return max(days, 1)
+
+class PatientBillEngine:
+    """Headless computation of a patient's bill.
+
+    A bill is built from a fixed number of joined queries on one connection
+    with the items, staff and interventions databases attached, so its cost
+    does not grow with the number of lines beyond reading them.
+    """
+    def __init__(self, db_dir="db"):
+        self.db_dir = db_dir
+
+    def connect(self):
+        """Open patients.db with the other databases a bill reads attached"""
+        conn = sqlite3.connect(f"{self.db_dir}/patients.db")
+        cursor = conn.cursor()
+        cursor.execute(f"ATTACH DATABASE '{self.db_dir}/items.db' AS items_db")
+        cursor.execute(f"ATTACH DATABASE '{self.db_dir}/doctors.db' AS doctors_db")
+        cursor.execute(f"ATTACH DATABASE '{self.db_dir}/nurses.db' AS nurses_db")
+        cursor.execute(f"ATTACH DATABASE '{self.db_dir}/interventions.db' AS interventions_db")
+        return conn
+
+    def compute_bill(self, patient_id, conn=None):
+        """Return the structured bill for a patient, or None if the patient does not exist"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self.connect()
+        try:
+            return self._compute(conn.cursor(), patient_id)
+        finally:
+            if own_conn:
+                conn.close()
+
+    def _compute(self, cursor, patient_id):
+        cursor.execute("SELECT id, name, admission_date, discharge_date FROM patients WHERE id = ?", (patient_id,))
+        patient = cursor.fetchone()
+        if not patient:
+            return None
+
+        bill = {
+            'patient': {
+                'id': patient[0],
+                'name': patient[1],
+                'admission_date': patient[2],
+                'discharge_date': patient[3],
+            },
+            'line_items': [],
+        }
+
+        # Stays
+        cursor.execute("""
+            SELECT ps.stay_date, cl.name, cl.daily_rate
+            FROM patient_stays ps
+            JOIN items_db.care_levels cl ON ps.care_level_id = cl.id
+            WHERE ps.patient_id = ?
+            ORDER BY ps.stay_date
+        """, (patient_id,))
+        stays = cursor.fetchall()
+        bill['stays'] = {'lines': stays, 'total': sum(row[2] for row in stays)}
+        for date, level, rate in stays:
+            self._add_line(bill, 'stay', date, level, 1, rate, rate)
+
+        # Items, all four categories in one pass
+        # Prices come from the snapshot taken when the item was charged
+        union = " UNION ALL ".join(
+            f"SELECT '{category}' AS category, p.date, COALESCE(i.name, 'Unknown') AS name, p.quantity, "
+            f"COALESCE(p.unit_price, 0) AS unit_price, COALESCE(p.line_total, 0) AS line_total "
+            f"FROM patient_{category} p LEFT JOIN items_db.items i ON p.item_id = i.id WHERE p.patient_id = :patient_id"
+            for category in CATEGORIES
+        )
+        cursor.execute(f"SELECT * FROM ({union}) ORDER BY category, date", {'patient_id': patient_id})
+        bill['categories'] = {category: {'lines': [], 'total': 0.0} for category in CATEGORIES}
+        for category, date, name, quantity, price, total in cursor.fetchall():
+            bill['categories'][category]['lines'].append((date, name, quantity, price, total))
+            bill['categories'][category]['total'] += total
+            self._add_line(bill, category, date, name, quantity, price, total)
+
+        # Equipment, each record is a rental interval charged per day
+        cursor.execute("""
+            SELECT COALESCE(e.name, 'Unknown'), pe.start_date, pe.end_date, pe.daily_rental_price
+            FROM patient_equipment pe
+            LEFT JOIN items_db.equipment e ON pe.equipment_id = e.id
+            WHERE pe.patient_id = ?
+            ORDER BY pe.start_date
+        """, (patient_id,))
+        equipment = []
+        for name, start_date, end_date, daily_price in cursor.fetchall():
+            days = rental_days(start_date, end_date)
+            cost = days * daily_price
+            equipment.append((name, start_date, end_date, days, daily_price, cost))
+            self._add_line(bill, 'equipment', start_date, name, days, daily_price, cost)
+        bill['equipment'] = {'lines': equipment, 'total': sum(row[5] for row in equipment)}
+
+        # Staff shifts and interventions
+        bill['staff'] = {}
+        for staff_type in STAFF_TYPES:
+            db = f"{staff_type}s_db"
+            cursor.execute(f"""
+                SELECT sh.arrival_datetime, sh.leave_datetime, s.name, {SHIFT_HOURS_SQL}, {shift_rate_sql(staff_type)}
+                FROM {shift_tables_sql(staff_type, db)}
+                WHERE sh.patient_id = ?
+                ORDER BY sh.arrival_datetime
+            """, (patient_id,))
+            shifts = []
+            for arrival, leave, staff_name, hours, rate in cursor.fetchall():
+                cost = hours * rate
+                shifts.append((arrival, leave, staff_name, hours, rate, cost))
+                self._add_line(bill, f"{staff_type}_shift", arrival[:10], staff_name, hours, rate, cost)
+
+            cursor.execute(f"""
+                SELECT si.date, i.name, COALESCE(s.name, 'Unknown'), i.bonus_amount
+                FROM {db}.{staff_type}_interventions si
+                JOIN interventions_db.interventions i ON si.intervention_id = i.id
+                LEFT JOIN {db}.{staff_type}s s ON si.{staff_type}_id = s.id
+                WHERE si.patient_id = ?
+                ORDER BY si.date
+            """, (patient_id,))
+            interventions = cursor.fetchall()
+            for date, intervention_name, staff_name, bonus in interventions:
+                self._add_line(bill, f"{staff_type}_intervention", date, f"{intervention_name} ({staff_name})", 1, bonus, bonus)
+
+            bill['staff'][staff_type] = {
+                'shifts': shifts,
+                'interventions': interventions,
+                'total': sum(row[5] for row in shifts) + sum(row[3] for row in interventions),
+            }
+
+        bill['totals'] = {
+            'stays': bill['stays']['total'],
+            **{category: bill['categories'][category]['total'] for category in CATEGORIES},
+            'equipment': bill['equipment']['total'],
+            **{staff_type: bill['staff'][staff_type]['total'] for staff_type in STAFF_TYPES},
+        }
+        bill['total'] = sum(bill['totals'].values())
+        return bill
+
+    def _add_line(self, bill, kind, date, description, quantity, unit_price, total):
+        bill['line_items'].append({
+            'type': kind,
+            'date': date,
+            'description': description,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total': total,
+        })
@@ -0,0 +1,118 @@
+import argparse
+import sqlite3
+from .billing import CATEGORIES
+from ..utils import setup_database
+from ..jobs import register_job_handler
+
+# (schema, table) rows that belong to a patient, as seen from patients.db with
+# the staff databases attached
+PATIENT_DEPENDENTS = (
+    [("main", "patient_stays")]
+    + [("main", f"patient_{category}") for category in CATEGORIES]
+    + [("main", "patient_equipment"), ("main", "patient_balances")]
+    + [(f"{staff_type}s_db", f"{staff_type}_{kind}") for staff_type in ["doctor", "nurse"] for kind in ["shifts", "interventions", "roster_templates"]]
+)
+
+# (schema, table, staff column, staff table) rows that belong to a staff member
+STAFF_DEPENDENTS = [
+    (f"{staff_type}s_db", f"{staff_type}_{kind}", f"{staff_type}_id", f"{staff_type}s")
+    for staff_type in ["doctor", "nurse"] for kind in ["shifts", "interventions", "payments", "roster_templates"]
+]
+
+def connect_with_staff_dbs():
+    """Open patients.db with doctors.db and nurses.db attached, so one transaction spans all three"""
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE 'db/doctors.db' AS doctors_db")
+    cursor.execute("ATTACH DATABASE 'db/nurses.db' AS nurses_db")
+    return conn
+
+STAFF_SCHEMAS = [f"{staff_type}s_db" for staff_type in ["doctor", "nurse"]]
+
+def delete_patient_rows(cursor, patient_id):
+    """Delete a patient and every row that refers to them, in the caller's transaction.
+
+    The patient is listed in each staff database's deleted_patients while
+    their rows go, so the payroll lock lets shifts in closed months be
+    deleted with them.
+    """
+    for schema in STAFF_SCHEMAS:
+        cursor.execute(f"INSERT OR IGNORE INTO {schema}.deleted_patients (patient_id) VALUES (?)", (patient_id,))
+    for schema, table in PATIENT_DEPENDENTS:
+        cursor.execute(f"DELETE FROM {schema}.{table} WHERE patient_id = ?", (patient_id,))
+    cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+    for schema in STAFF_SCHEMAS:
+        cursor.execute(f"DELETE FROM {schema}.deleted_patients WHERE patient_id = ?", (patient_id,))
+
+def sweep_orphans(dry_run=False):
+    """Delete rows whose patient or staff member no longer exists.
+
+    Returns {table: rows} for the tables that had orphans; with dry_run the
+    rows are only counted.
+    """
+    conn = connect_with_staff_dbs()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        # Let the payroll lock pass rows of patients that are already gone
+        for staff_type in ["doctor", "nurse"]:
+            for kind in ["shifts", "interventions"]:
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {staff_type}s_db.deleted_patients (patient_id)
+                    SELECT DISTINCT patient_id FROM {staff_type}s_db.{staff_type}_{kind}
+                    WHERE patient_id IS NOT NULL AND patient_id NOT IN (SELECT id FROM main.patients)
+                """)
+        orphans = {}
+        checks = [(schema, table, "patient_id", "main.patients") for schema, table in PATIENT_DEPENDENTS]
+        checks += [(schema, table, column, f"{schema}.{staff_table}") for schema, table, column, staff_table in STAFF_DEPENDENTS]
+        for schema, table, column, parent in checks:
+            condition = f"{column} IS NOT NULL AND {column} NOT IN (SELECT id FROM {parent})"
+            if dry_run:
+                cursor.execute(f"SELECT COUNT(*) FROM {schema}.{table} WHERE {condition}")
+                count = cursor.fetchone()[0]
+            else:
+                cursor.execute(f"DELETE FROM {schema}.{table} WHERE {condition}")
+                count = cursor.rowcount
+            if count:
+                orphans[table] = orphans.get(table, 0) + count
+        if dry_run:
+            conn.rollback()
+        else:
+            for schema in STAFF_SCHEMAS:
+                cursor.execute(f"DELETE FROM {schema}.deleted_patients")
+            conn.commit()
+        return orphans
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error sweeping orphaned rows: {e}")
+        return None
+    finally:
+        conn.close()
+
+def run_sweep_orphans_job(job):
+    """Job handler: delete orphaned rows across the patient and staff databases"""
+    orphans = sweep_orphans()
+    if orphans is None:
+        raise ValueError("Could not sweep orphaned rows; nothing was deleted.")
+    return {'deleted': orphans, 'total': sum(orphans.values())}, None
+
+register_job_handler('sweep_orphans', run_sweep_orphans_job)
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete rows that refer to deleted patients or staff")
+    parser.add_argument('--dry-run', action='store_true', help="only count the orphaned rows")
+    args = parser.parse_args()
+
+    setup_database()
+    orphans = sweep_orphans(dry_run=args.dry_run)
+    if orphans is None:
+        return
+    for table, count in sorted(orphans.items()):
+        print(f"{table}: {count} orphaned row(s)")
+    if not orphans:
+        print("No orphaned rows")
+    elif not args.dry_run:
+        print(f"Deleted {sum(orphans.values())} orphaned row(s)")
+
+if __name__ == '__main__':
+    main()
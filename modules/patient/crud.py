@@ -3,6 +3,7 @@ from tkinter import ttk, messagebox
 import sqlite3
 from tkcalendar import DateEntry
 from ..utils import show_error_message
+from .cleanup import connect_with_staff_dbs, delete_patient_rows
 
 class PatientCRUD:
     def __init__(self, patient_module, auth_module):
@@ -15,10 +16,15 @@ class PatientCRUD:
         return [patient_id for patient_id, var in self.patient_module.patient_vars.items() if var.get()]
 
     def load_patients(self):
-        """Load patients from the database"""
+        """Load patients with their running balance from the database"""
         conn = sqlite3.connect("db/patients.db")
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, admission_date, discharge_date FROM patients ORDER BY name")
+        cursor.execute("""
+            SELECT p.id, p.name, p.admission_date, p.discharge_date, COALESCE(b.total, 0)
+            FROM patients p
+            LEFT JOIN patient_balances b ON b.patient_id = p.id
+            ORDER BY p.name
+        """)
         patients = cursor.fetchall()
         conn.close()
         return patients
@@ -48,6 +54,7 @@ class PatientCRUD:
                 self.patient_module.items_handler.load_category_items("radiology")
                 self.patient_module.items_handler.load_category_items("consultations")
                 self.patient_module.equipment_handler.load_patient_equipment()
+                self.patient_module.timeline_handler.load_timeline()
         else:
             # Clear details if none or multiple are selected
             self.patient_module.name_var.set("")
@@ -100,23 +107,18 @@ class PatientCRUD:
             conn.close()
 
     def delete_patient(self, patient_id):
-        """Delete a patient"""
-        conn = sqlite3.connect("db/patients.db")
+        """Delete a patient with their charges, shifts and interventions in every database"""
+        conn = connect_with_staff_dbs()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT name FROM patients WHERE id = ?", (patient_id,))
             patient_name = cursor.fetchone()[0]
-            cursor.execute("DELETE FROM patient_stays WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patient_labs WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patient_drugs WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patient_radiology WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patient_consultations WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patient_equipment WHERE patient_id = ?", (patient_id,))
-            cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+            delete_patient_rows(cursor, patient_id)
             conn.commit()
             self.auth_module.log_action(self.auth_module.current_user, "DELETE_PATIENT", f"Deleted patient: {patient_name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error deleting patient: {e}")
             return False
         finally:
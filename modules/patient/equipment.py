@@ -4,6 +4,10 @@ import sqlite3
 from datetime import datetime, timedelta
 from tkcalendar import DateEntry
 from ..utils import format_currency, show_error_message
+from ..catalog import get_catalog
+from .balances import adjust_balance
+from .billing import rental_days
+from .rentals import end_rental, record_rental
 
 class EquipmentHandler:
     def __init__(self, patient_module):
@@ -39,26 +43,18 @@ class EquipmentHandler:
         self.equipment_tree.pack(fill=tk.BOTH, expand=True)
 
     def load_equipment(self):
-        """Load equipment from the database"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rental_price FROM equipment ORDER BY name")
-        equipment = cursor.fetchall()
-        conn.close()
-        return equipment
+        """Load equipment from the reference catalog"""
+        return get_catalog().equipment()
 
     def add_equipment(self, patient_id, equipment_id, start_date, end_date, daily_price, current_user):
         """Add a new equipment record for a patient"""
         conn = sqlite3.connect("db/patients.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO patient_equipment (patient_id, equipment_id, start_date, end_date, daily_rental_price) VALUES (?, ?, ?, ?, ?)", 
-                           (patient_id, equipment_id, start_date, end_date, daily_price))
+            record_rental(cursor, patient_id, equipment_id, start_date, end_date or None, daily_price)
             conn.commit()
             
-            cursor.execute("ATTACH DATABASE 'db/items.db' AS items_db")
-            cursor.execute("SELECT name FROM items_db.equipment WHERE id = ?", (equipment_id,))
-            equipment_name = cursor.fetchone()[0]
+            equipment_name = get_catalog().equipment_item(equipment_id)[1]
             self.patient_module.auth_module.log_action(current_user, "ADD_EQUIPMENT", f"Added equipment {equipment_name} for patient ID {patient_id}")
             return True
         except sqlite3.Error as e:
@@ -72,14 +68,12 @@ class EquipmentHandler:
         conn = sqlite3.connect("db/patients.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT patient_id, equipment_id FROM patient_equipment WHERE id = ?", (record_id,))
-            patient_id, equipment_id = cursor.fetchone()
-            
-            cursor.execute("ATTACH DATABASE 'db/items.db' AS items_db")
-            cursor.execute("SELECT name FROM items_db.equipment WHERE id = ?", (equipment_id,))
-            equipment_name = cursor.fetchone()[0]
+            cursor.execute("SELECT patient_id, equipment_id, start_date, end_date, daily_rental_price FROM patient_equipment WHERE id = ?", (record_id,))
+            patient_id, equipment_id, start_date, end_date, daily_price = cursor.fetchone()
+            equipment_name = get_catalog().equipment_item(equipment_id)[1]
 
             cursor.execute("DELETE FROM patient_equipment WHERE id = ?", (record_id,))
+            adjust_balance(cursor, patient_id, "equipment", -rental_days(start_date, end_date) * daily_price)
             conn.commit()
             self.patient_module.auth_module.log_action(self.patient_module.auth_module.current_user, "REMOVE_EQUIPMENT", f"Removed equipment {equipment_name} for patient ID {patient_id}")
             return True
@@ -89,6 +83,31 @@ class EquipmentHandler:
         finally:
             conn.close()
 
+    def end_equipment(self, record_id, end_date, resume_date=None, current_user=None):
+        """End an equipment rental on a date, optionally resuming it later"""
+        conn = sqlite3.connect("db/patients.db")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            end_rental(cursor, record_id, end_date, resume_date or None)
+            cursor.execute("SELECT patient_id, equipment_id FROM patient_equipment WHERE id = ?", (record_id,))
+            patient_id, equipment_id = cursor.fetchone()
+            conn.commit()
+
+            equipment = get_catalog().equipment_item(equipment_id)
+            equipment_name = equipment[1] if equipment else "Unknown"
+            details = f"Ended equipment {equipment_name} for patient ID {patient_id} on {end_date}"
+            if resume_date:
+                details += f", resuming on {resume_date}"
+            self.patient_module.auth_module.log_action(current_user or self.patient_module.auth_module.current_user, "END_EQUIPMENT", details)
+            return True
+        except (sqlite3.Error, ValueError) as e:
+            conn.rollback()
+            print(f"Error ending equipment rental: {e}")
+            return False
+        finally:
+            conn.close()
+
     def load_patient_equipment(self, patient_id):
         """Load equipment records for a specific patient"""
         conn = sqlite3.connect("db/patients.db")
@@ -114,18 +133,10 @@ class EquipmentHandler:
         for i in self.equipment_tree.get_children():
             self.equipment_tree.delete(i)
 
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT e.id, e.name, e.daily_rental_price
-            FROM care_level_equipment cle
-            JOIN equipment e ON cle.equipment_id = e.id
-            WHERE cle.care_level_id = ?
-        """, (care_level_id,))
-        
-        for row in cursor.fetchall():
-            self.equipment_tree.insert("", "end", iid=row[0], values=(row[1], stay_date.strftime('%Y-%m-%d'), "", format_currency(row[2])))
-        conn.close()
+        catalog = get_catalog()
+        for name, equipment_id in catalog.care_level_equipment(care_level_id):
+            price = catalog.equipment_price(equipment_id)
+            self.equipment_tree.insert("", "end", iid=equipment_id, values=(name, stay_date.strftime('%Y-%m-%d'), "", format_currency(price)))
 
     def confirm_stay_and_equipment(self):
         """Save the stay and the equipment list to the database."""
@@ -141,6 +152,7 @@ class EquipmentHandler:
             # Add the stay
             cursor.execute("INSERT INTO patient_stays (patient_id, stay_date, care_level_id) VALUES (?, ?, ?)",
                            (patient_id, stay_date_str, self.care_level_id))
+            adjust_balance(cursor, patient_id, "stays", self.patient_module.stays_handler.care_level_rate(self.care_level_id))
             self.patient_module.auth_module.log_action(self.patient_module.auth_module.current_user, "ADD_STAY", f"Added stay for patient ID {patient_id} on {stay_date_str}")
 
             # Add the equipment
@@ -158,11 +170,7 @@ class EquipmentHandler:
                         break
                 
                 if equipment_id:
-                    cursor.execute("""
-                        INSERT INTO patient_equipment 
-                        (patient_id, equipment_id, start_date, end_date, daily_rental_price, stay_date) 
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (patient_id, equipment_id, stay_date_str, end_date_str, price, stay_date_str))
+                    record_rental(cursor, patient_id, equipment_id, stay_date_str, end_date_str, price, stay_date_str)
 
             conn.commit()
             messagebox.showinfo("Success", "Stay and equipment confirmed successfully.")
@@ -3,6 +3,8 @@ from tkinter import ttk, messagebox
 import sqlite3
 from datetime import datetime
 from ..utils import format_currency, show_error_message
+from ..catalog import get_catalog
+from .balances import adjust_balance
 
 class ItemsHandler:
     def __init__(self, patient_module):
@@ -16,11 +18,7 @@ class ItemsHandler:
 
         ttk.Label(parent, text=f"Add {category.capitalize()}:").pack(anchor=tk.W, pady=(10, 5))
         
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, price FROM items WHERE category = ? ORDER BY name", (category,))
-        items = cursor.fetchall()
-        conn.close()
+        items = get_catalog().items(category)
         
         item_frame = ttk.Frame(parent)
         item_frame.pack(fill=tk.X, pady=5)
@@ -88,9 +86,9 @@ class ItemsHandler:
 
         table_name = f"patient_{category}"
         cursor.execute(f"""
-            SELECT p.id, p.date, i.name, p.quantity, i.price
+            SELECT p.id, p.date, COALESCE(i.name, 'Unknown'), p.quantity, p.unit_price
             FROM {table_name} p
-            JOIN items_db.items i ON p.item_id = i.id
+            LEFT JOIN items_db.items i ON p.item_id = i.id
             WHERE p.patient_id = ?
             ORDER BY p.date
         """, (patient_id,))
@@ -101,20 +99,35 @@ class ItemsHandler:
 
     def add_category_item(self, patient_id, category, item_id, date, quantity):
         """Add an item to a category for a specific patient"""
+        try:
+            item = get_catalog().item(item_id)
+            # Web forms pass the quantity as a string
+            quantity = float(quantity)
+        except (TypeError, ValueError) as e:
+            print(f"Error adding item: {e}")
+            return False
+        if item is None or item[1] != category:
+            print(f"Error adding item: no {category} item with ID {item_id}")
+            return False
+        if quantity <= 0:
+            print("Error adding item: the quantity must be greater than zero")
+            return False
+
         conn = sqlite3.connect("db/patients.db")
         cursor = conn.cursor()
         
         table_name = f"patient_{category}"
         try:
+            unit_price = item[3]
+            line_total = quantity * unit_price
             cursor.execute(f"""
-                INSERT INTO {table_name} (patient_id, date, item_id, quantity)
-                VALUES (?, ?, ?, ?)
-            """, (patient_id, date, item_id, quantity))
+                INSERT INTO {table_name} (patient_id, date, item_id, quantity, unit_price, line_total)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (patient_id, date, item_id, quantity, unit_price, line_total))
+            adjust_balance(cursor, patient_id, category, line_total)
             conn.commit()
             
-            cursor.execute("ATTACH DATABASE 'db/items.db' AS items_db")
-            cursor.execute("SELECT name FROM items_db.items WHERE id = ?", (item_id,))
-            item_name = cursor.fetchone()[0]
+            item_name = item[2]
             self.patient_module.auth_module.log_action(self.patient_module.auth_module.current_user, f"ADD_{category.upper()}", f"Added {item_name} (x{quantity}) for patient ID {patient_id}")
             return True
         except sqlite3.Error as e:
@@ -129,14 +142,13 @@ class ItemsHandler:
         cursor = conn.cursor()
         table_name = f"patient_{category}"
         try:
-            cursor.execute(f"SELECT patient_id, item_id, quantity FROM {table_name} WHERE id = ?", (record_id,))
-            patient_id, item_id, quantity = cursor.fetchone()
-            
-            cursor.execute("ATTACH DATABASE 'db/items.db' AS items_db")
-            cursor.execute("SELECT name FROM items_db.items WHERE id = ?", (item_id,))
-            item_name = cursor.fetchone()[0]
+            cursor.execute(f"SELECT patient_id, item_id, quantity, line_total FROM {table_name} WHERE id = ?", (record_id,))
+            patient_id, item_id, quantity, line_total = cursor.fetchone()
+            item = get_catalog().item(item_id)
+            item_name = item[2] if item else "Unknown"
             
             cursor.execute(f"DELETE FROM {table_name} WHERE id = ?", (record_id,))
+            adjust_balance(cursor, patient_id, category, -(line_total or 0.0))
             conn.commit()
             self.patient_module.auth_module.log_action(self.patient_module.auth_module.current_user, f"REMOVE_{category.upper()}", f"Removed {item_name} (x{quantity}) for patient ID {patient_id}")
             return True
@@ -0,0 +1,145 @@
+import argparse
+import sqlite3
+from datetime import datetime
+from .billing import rental_days
+from .balances import adjust_balance, reconcile_balances
+from ..utils import setup_database
+from ..jobs import register_job_handler
+
+def record_rental(cursor, patient_id, equipment_id, start_date, end_date, daily_price, stay_date=None):
+    """Charge a device for [start_date, end_date) as an interval.
+
+    A rental of the same device at the same price that ends where this one
+    starts (or starts where it ends) is extended instead of adding a row, so
+    consecutive daily stays keep one row per device.
+    """
+    if end_date:
+        cursor.execute("""
+            UPDATE patient_equipment SET end_date = ?
+            WHERE id = (SELECT id FROM patient_equipment
+                        WHERE patient_id = ? AND equipment_id = ? AND daily_rental_price = ? AND end_date = ?
+                        LIMIT 1)
+        """, (end_date, patient_id, equipment_id, daily_price, start_date))
+        if not cursor.rowcount:
+            cursor.execute("""
+                UPDATE patient_equipment SET start_date = ?
+                WHERE id = (SELECT id FROM patient_equipment
+                            WHERE patient_id = ? AND equipment_id = ? AND daily_rental_price = ? AND start_date = ?
+                            LIMIT 1)
+            """, (start_date, patient_id, equipment_id, daily_price, end_date))
+        extended = cursor.rowcount > 0
+    else:
+        extended = False
+
+    if not extended:
+        cursor.execute("""
+            INSERT INTO patient_equipment (patient_id, equipment_id, start_date, end_date, daily_rental_price, stay_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (patient_id, equipment_id, start_date, end_date, daily_price, stay_date))
+    adjust_balance(cursor, patient_id, "equipment", rental_days(start_date, end_date) * daily_price)
+
+def end_rental(cursor, record_id, end_date, resume_date=None):
+    """End a rental on end_date, the first day it is no longer charged.
+
+    The row's [start_date, end_date) interval is trimmed to stop at end_date;
+    an open rental gets end_date set. With resume_date, the days from
+    resume_date to the old end stay rented as a new row, which splits the
+    interval around a pause. The patient's balance moves by the change in
+    charge. Raises ValueError when the dates do not shorten the rental.
+    """
+    cursor.execute("SELECT patient_id, equipment_id, start_date, end_date, daily_rental_price, stay_date FROM patient_equipment WHERE id = ?",
+                   (record_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"no rental with ID {record_id}")
+    patient_id, equipment_id, start_date, old_end, daily_price, stay_date = row
+
+    datetime.strptime(end_date, "%Y-%m-%d")
+    if end_date <= start_date:
+        raise ValueError("the rental must end after it starts; delete it instead")
+    if old_end and end_date >= old_end:
+        raise ValueError(f"the rental already ends on {old_end}")
+    if resume_date:
+        datetime.strptime(resume_date, "%Y-%m-%d")
+        if resume_date <= end_date or (old_end and resume_date >= old_end):
+            raise ValueError("the rental must resume after it ends and before its old end date")
+
+    cursor.execute("UPDATE patient_equipment SET end_date = ? WHERE id = ?", (end_date, record_id))
+    charge = rental_days(start_date, end_date) - rental_days(start_date, old_end)
+    if resume_date:
+        cursor.execute("""
+            INSERT INTO patient_equipment (patient_id, equipment_id, start_date, end_date, daily_rental_price, stay_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (patient_id, equipment_id, resume_date, old_end, daily_price, stay_date))
+        charge += rental_days(resume_date, old_end)
+    adjust_balance(cursor, patient_id, "equipment", charge * daily_price)
+
+def compact_rentals(progress_callback=None):
+    """Merge back-to-back rental rows of the same device and price into single intervals.
+
+    Returns (rows_before, rows_after).
+    """
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT id, patient_id, equipment_id, daily_rental_price, start_date, end_date
+            FROM patient_equipment
+            ORDER BY patient_id, equipment_id, daily_rental_price, start_date, id
+        """)
+        rows = cursor.fetchall()
+
+        updates = []
+        deletes = []
+        current = None
+        for index, (row_id, patient_id, equipment_id, price, start_date, end_date) in enumerate(rows):
+            if progress_callback and index % 1000 == 0:
+                progress_callback(index, len(rows))
+            key = (patient_id, equipment_id, price)
+            if current and current['key'] == key and current['end_date'] and current['end_date'] == start_date and end_date:
+                current['end_date'] = end_date
+                current['merged'] = True
+                deletes.append((row_id,))
+                continue
+            if current and current['merged']:
+                updates.append((current['end_date'], current['id']))
+            current = {'id': row_id, 'key': key, 'end_date': end_date, 'merged': False}
+        if current and current['merged']:
+            updates.append((current['end_date'], current['id']))
+
+        cursor.executemany("UPDATE patient_equipment SET end_date = ? WHERE id = ?", updates)
+        cursor.executemany("DELETE FROM patient_equipment WHERE id = ?", deletes)
+        conn.commit()
+        if progress_callback:
+            progress_callback(len(rows), len(rows))
+        return len(rows), len(rows) - len(deletes)
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error compacting equipment rentals: {e}")
+        return None
+    finally:
+        conn.close()
+
+def run_compact_rentals_job(job):
+    """Job handler: compact rental rows, then bring balances in line with interval costing"""
+    rows_before, rows_after = compact_rentals(job.update_progress) or (0, 0)
+    reconcile_balances(fix=True)
+    return {'rows_before': rows_before, 'rows_after': rows_after}, None
+
+register_job_handler('compact_rentals', run_compact_rentals_job)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge daily equipment rental rows into contiguous intervals")
+    parser.parse_args()
+
+    setup_database()
+    result = compact_rentals()
+    if result is None:
+        return
+    reconcile_balances(fix=True)
+    rows_before, rows_after = result
+    print(f"Compacted {rows_before} equipment rental rows into {rows_after}")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
+from datetime import datetime, timedelta
 from tkcalendar import DateEntry
 from ..utils import format_currency, show_error_message
+from ..catalog import get_catalog
+from .balances import adjust_balance
+from .rentals import record_rental
 
 class StaysHandler:
     def __init__(self, patient_module):
@@ -37,13 +41,13 @@ class StaysHandler:
         self.stays_tree.pack(fill=tk.BOTH, expand=True)
 
     def load_care_levels(self):
-        """Load care levels from the database"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rate FROM care_levels ORDER BY name")
-        care_levels = cursor.fetchall()
-        conn.close()
-        return care_levels
+        """Load care levels from the reference catalog"""
+        return get_catalog().care_levels()
+
+    def care_level_rate(self, care_level_id):
+        """Return the daily rate of a care level, or 0 if it no longer exists"""
+        care_level = get_catalog().care_level(care_level_id) if care_level_id is not None else None
+        return care_level[2] if care_level else 0.0
 
     def add_stay(self, patient_id, stay_date, care_level_id, current_user):
         """Add a new stay for a patient"""
@@ -52,6 +56,7 @@ class StaysHandler:
         try:
             cursor.execute("INSERT INTO patient_stays (patient_id, stay_date, care_level_id) VALUES (?, ?, ?)",
                            (patient_id, stay_date, care_level_id))
+            adjust_balance(cursor, patient_id, "stays", self.care_level_rate(care_level_id))
             conn.commit()
             self.patient_module.auth_module.log_action(current_user, "ADD_STAY", f"Added stay for patient ID {patient_id} on {stay_date}")
             return True
@@ -61,16 +66,51 @@ class StaysHandler:
         finally:
             conn.close()
 
+    def add_stay_range(self, patient_id, start_date, end_date, care_level_id, current_user):
+        """Add a stay for every day from start_date to end_date inclusive, with the care level's default equipment.
+
+        All stays and rentals are written in one transaction with one audit entry.
+        """
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        if end < start:
+            return False
+        stay_dates = [(start + timedelta(days=day)).strftime("%Y-%m-%d") for day in range((end - start).days + 1)]
+        rental_end = (end + timedelta(days=1)).strftime("%Y-%m-%d")
+
+        catalog = get_catalog()
+        default_equipment = [(equipment_id, catalog.equipment_price(equipment_id))
+                             for _, equipment_id in catalog.care_level_equipment(care_level_id)]
+
+        conn = sqlite3.connect("db/patients.db")
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("INSERT INTO patient_stays (patient_id, stay_date, care_level_id) VALUES (?, ?, ?)",
+                               [(patient_id, stay_date, care_level_id) for stay_date in stay_dates])
+            adjust_balance(cursor, patient_id, "stays", len(stay_dates) * self.care_level_rate(care_level_id))
+            for equipment_id, daily_price in default_equipment:
+                record_rental(cursor, patient_id, equipment_id, start_date, rental_end, daily_price, start_date)
+            conn.commit()
+            self.patient_module.auth_module.log_action(current_user, "ADD_STAY_RANGE", f"Added {len(stay_dates)} stays for patient ID {patient_id} from {start_date} to {end_date}")
+            return True
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error adding stays: {e}")
+            return False
+        finally:
+            conn.close()
+
     def remove_stay(self, stay_id, current_user):
         """Remove a stay record"""
         conn = sqlite3.connect("db/patients.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT patient_id, stay_date FROM patient_stays WHERE id = ?", (stay_id,))
+            cursor.execute("SELECT patient_id, stay_date, care_level_id FROM patient_stays WHERE id = ?", (stay_id,))
             result = cursor.fetchone()
             if result:
-                patient_id, stay_date = result
+                patient_id, stay_date, care_level_id = result
                 cursor.execute("DELETE FROM patient_stays WHERE id = ?", (stay_id,))
+                adjust_balance(cursor, patient_id, "stays", -self.care_level_rate(care_level_id))
                 conn.commit()
                 self.patient_module.auth_module.log_action(current_user, "REMOVE_STAY", f"Removed stay for patient ID {patient_id} on {stay_date}")
                 return True
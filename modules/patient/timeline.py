@@ -0,0 +1,173 @@
+import tkinter as tk
+from tkinter import ttk
+import heapq
+from itertools import islice
+from ..utils import format_currency
+from .billing import PatientBillEngine, CATEGORIES, STAFF_TYPES, RENTAL_DAYS_SQL
+from ..staff_costs import SHIFT_HOURS_SQL, shift_rate_sql, shift_tables_sql
+
+def _timeline_sources():
+    """(source, query, timestamp column, id column) for every event source of a patient.
+
+    Each query selects (timestamp, id, description, amount) in timestamp
+    order; {where} is filled with the keyset and date conditions, so every
+    source is read along its (patient_id, date) index.
+    """
+    sources = [
+        ("stay", """
+            SELECT ps.stay_date, ps.id, 'Stay: ' || COALESCE(cl.name, 'Unknown'), COALESCE(cl.daily_rate, 0)
+            FROM patient_stays ps
+            LEFT JOIN items_db.care_levels cl ON ps.care_level_id = cl.id
+            WHERE ps.patient_id = :patient_id {where}
+            ORDER BY ps.stay_date, ps.id
+        """, "ps.stay_date", "ps.id"),
+        ("equipment", f"""
+            SELECT pe.start_date, pe.id,
+                   'Equipment: ' || COALESCE(e.name, 'Unknown') || COALESCE(' until ' || pe.end_date, ''),
+                   {RENTAL_DAYS_SQL} * pe.daily_rental_price
+            FROM patient_equipment pe
+            LEFT JOIN items_db.equipment e ON pe.equipment_id = e.id
+            WHERE pe.patient_id = :patient_id {{where}}
+            ORDER BY pe.start_date, pe.id
+        """, "pe.start_date", "pe.id"),
+    ]
+    for category in CATEGORIES:
+        sources.append((category, f"""
+            SELECT p.date, p.id, '{category.capitalize()}: ' || COALESCE(i.name, 'Unknown') || ' x' || p.quantity, COALESCE(p.line_total, 0)
+            FROM patient_{category} p
+            LEFT JOIN items_db.items i ON p.item_id = i.id
+            WHERE p.patient_id = :patient_id {{where}}
+            ORDER BY p.date, p.id
+        """, "p.date", "p.id"))
+    for staff_type in STAFF_TYPES:
+        db = f"{staff_type}s_db"
+        sources.append((f"{staff_type}_shift", f"""
+            SELECT sh.arrival_datetime, sh.id,
+                   '{staff_type.capitalize()} shift: ' || s.name || ' until ' || sh.leave_datetime,
+                   {SHIFT_HOURS_SQL} * {shift_rate_sql(staff_type)}
+            FROM {shift_tables_sql(staff_type, db)}
+            WHERE sh.patient_id = :patient_id {{where}}
+            ORDER BY sh.arrival_datetime, sh.id
+        """, "sh.arrival_datetime", "sh.id"))
+        sources.append((f"{staff_type}_intervention", f"""
+            SELECT si.date, si.id,
+                   '{staff_type.capitalize()} intervention: ' || COALESCE(i.name, 'Unknown') || ' (' || COALESCE(s.name, 'Unknown') || ')',
+                   COALESCE(i.bonus_amount, 0)
+            FROM {db}.{staff_type}_interventions si
+            LEFT JOIN interventions_db.interventions i ON si.intervention_id = i.id
+            LEFT JOIN {db}.{staff_type}s s ON si.{staff_type}_id = s.id
+            WHERE si.patient_id = :patient_id {{where}}
+            ORDER BY si.date, si.id
+        """, "si.date", "si.id"))
+    return sources
+
+def parse_cursor(cursor_str):
+    """Split a 'timestamp|source|id' page cursor"""
+    timestamp, source, row_id = cursor_str.rsplit("|", 2)
+    return timestamp, source, int(row_id)
+
+def _read_source(conn, source, query, ts_column, id_column, patient_id, after, from_date, to_date):
+    """Yield (timestamp, source, id, description, amount) for one source, lazily and in order"""
+    conditions = []
+    params = {'patient_id': patient_id}
+    if after:
+        after_ts, after_source, after_id = after
+        params['after_ts'] = after_ts
+        params['after_id'] = after_id
+        # Events sort by (timestamp, source, id); resume strictly after the cursor
+        if source < after_source:
+            conditions.append(f"{ts_column} > :after_ts")
+        elif source == after_source:
+            conditions.append(f"({ts_column} > :after_ts OR ({ts_column} = :after_ts AND {id_column} > :after_id))")
+        else:
+            conditions.append(f"{ts_column} >= :after_ts")
+    if from_date:
+        conditions.append(f"{ts_column} >= :from_date")
+        params['from_date'] = from_date
+    if to_date:
+        # to_date is inclusive; datetimes on that day sort after the bare date
+        conditions.append(f"{ts_column} < date(:to_date, '+1 day')")
+        params['to_date'] = to_date
+    where = "".join(f" AND {condition}" for condition in conditions)
+
+    cursor = conn.cursor()
+    cursor.execute(query.format(where=where), params)
+    for timestamp, row_id, description, amount in cursor:
+        yield (timestamp, source, row_id, description, amount)
+
+def iter_timeline(conn, patient_id, after=None, from_date=None, to_date=None):
+    """Merge all sources of a patient's history into one chronological stream.
+
+    Each source is an ordered query read row by row and heapq.merge only holds
+    the head of each, so memory does not grow with the length of the history.
+    """
+    streams = [_read_source(conn, source, query, ts_column, id_column, patient_id, after, from_date, to_date)
+               for source, query, ts_column, id_column in _timeline_sources()]
+    return heapq.merge(*streams)
+
+def timeline_page(patient_id, after=None, limit=50, from_date=None, to_date=None):
+    """Return up to limit timeline events after a cursor, with the cursor of the next page.
+
+    after is a cursor string from a previous page; from_date and to_date
+    (YYYY-MM-DD, inclusive) restrict the page to a range of days.
+    """
+    conn = PatientBillEngine().connect()
+    try:
+        after_key = parse_cursor(after) if after else None
+        rows = list(islice(iter_timeline(conn, patient_id, after_key, from_date, to_date), limit + 1))
+    finally:
+        conn.close()
+
+    events = [{
+        'timestamp': timestamp,
+        'type': source,
+        'id': row_id,
+        'description': description,
+        'amount': amount,
+    } for timestamp, source, row_id, description, amount in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = f"{last[0]}|{last[1]}|{last[2]}"
+    return {'events': events, 'next': next_cursor}
+
+class TimelineHandler:
+    PAGE_SIZE = 100
+
+    def __init__(self, patient_module):
+        self.patient_module = patient_module
+        self.parent = patient_module.parent
+        self.next_cursor = None
+
+    def setup_timeline_tab(self, parent):
+        """Setup the patient timeline tab"""
+        list_frame = ttk.LabelFrame(parent, text="Timeline", padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.timeline_tree = ttk.Treeview(list_frame, columns=("Date", "Type", "Description", "Amount"), show="headings")
+        self.timeline_tree.heading("Date", text="Date")
+        self.timeline_tree.heading("Type", text="Type")
+        self.timeline_tree.heading("Description", text="Description")
+        self.timeline_tree.heading("Amount", text="Amount")
+        self.timeline_tree.pack(fill=tk.BOTH, expand=True)
+
+        self.load_more_button = ttk.Button(list_frame, text="Load More", command=self.load_more)
+        self.load_more_button.pack(pady=(5, 0))
+
+    def load_timeline(self):
+        """Show the first page of the current patient's timeline"""
+        for i in self.timeline_tree.get_children():
+            self.timeline_tree.delete(i)
+        self.next_cursor = None
+        self.load_more()
+
+    def load_more(self):
+        """Append the next page of the current patient's timeline"""
+        patient_id = getattr(self.patient_module, 'current_patient_id', None)
+        if patient_id is None:
+            return
+        page = timeline_page(patient_id, after=self.next_cursor, limit=self.PAGE_SIZE)
+        for event in page['events']:
+            self.timeline_tree.insert("", "end", values=(event['timestamp'], event['type'], event['description'], format_currency(event['amount'])))
+        self.next_cursor = page['next']
+        self.load_more_button.state(["!disabled"] if self.next_cursor else ["disabled"])
@@ -5,6 +5,7 @@ from .patient.stays import StaysHandler
 from .patient.items import ItemsHandler
 from .patient.costing import CostingHandler
 from .patient.equipment import EquipmentHandler
+from .patient.timeline import TimelineHandler
 
 class PatientModule:
     def __init__(self, parent, auth_module):
@@ -18,6 +19,7 @@ class PatientModule:
         self.items_handler = ItemsHandler(self)
         self.costing_handler = CostingHandler(self)
         self.equipment_handler = EquipmentHandler(self)
+        self.timeline_handler = TimelineHandler(self)
 
         self.setup_ui()
         self.crud_handler.load_patients()
@@ -102,6 +104,10 @@ class PatientModule:
         self.notebook.add(self.equipment_tab_frame, text="Equipment")
         self.equipment_handler.setup_equipment_tab(self.equipment_tab_frame)
 
+        self.timeline_tab_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.timeline_tab_frame, text="Timeline")
+        self.timeline_handler.setup_timeline_tab(self.timeline_tab_frame)
+
         cost_frame = ttk.LabelFrame(details_frame, text="Cost Calculation", padding="5")
         cost_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
 
@@ -123,6 +129,8 @@ class PatientModule:
                     tree.delete(item)
         for i in self.equipment_handler.equipment_tree.get_children():
             self.equipment_handler.equipment_tree.delete(i)
+        for i in self.timeline_handler.timeline_tree.get_children():
+            self.timeline_handler.timeline_tree.delete(i)
 
     def switch_to_equipment_tab_for_stay(self, stay_date, care_level_id):
         """Switch to the equipment tab and load defaults for a new stay."""
@@ -0,0 +1,328 @@
+import argparse
+import calendar
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from .utils import calculate_salary_details, setup_database
+from .staff_costs import STAFF_TYPES, period_cost_sql
+
+PAYMENT_COLUMNS = ["id", "staff_id", "name", "month", "year", "hourly_rate", "total_hours", "base_salary",
+                   "total_bonus", "total_salary", "paid", "paid_date", "closed", "closed_date", "computed_at", "details"]
+
+def month_bounds(year, month):
+    """Return the first and last day of a month as YYYY-MM-DD strings"""
+    last_day = calendar.monthrange(int(year), int(month))[1]
+    return f"{int(year):04d}-{int(month):02d}-01", f"{int(year):04d}-{int(month):02d}-{last_day:02d}"
+
+def _period(year, month):
+    return f"{int(month):02d}", f"{int(year):04d}"
+
+def _connect(staff_type):
+    """Open a staff database with patients.db and interventions.db attached"""
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE 'db/patients.db' AS patients_db")
+    cursor.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
+    return conn
+
+def run_payroll(year, month, staff_types=STAFF_TYPES):
+    """Compute hours, bonus and salary of every employee for a month and store them in the payments tables.
+
+    Each staff type is computed with one grouped INSERT ... SELECT. The stored
+    hourly_rate is the effective rate, base salary over hours, because nurse
+    hours are costed at their level's rate and any rate may change mid-month;
+    it falls back to the employee's rate when there are no hours. Rows already
+    marked paid or closed are kept as they are; open rows are recomputed.
+    Returns {staff_type: rows written}.
+    """
+    start_date, end_date = month_bounds(year, month)
+    month_str, year_str = _period(year, month)
+    shift_filter = "d.patient_id IN (SELECT id FROM patients_db.patients)"
+    written = {}
+    for staff_type in staff_types:
+        conn = _connect(staff_type)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM {staff_type}_payments WHERE year = ? AND month = ? AND paid = 0 AND closed = 0",
+                           (year_str, month_str))
+            cursor.execute(f"""
+                INSERT INTO {staff_type}_payments
+                    ({staff_type}_id, month, year, hourly_rate, total_hours, base_salary, total_bonus, total_salary, computed_at)
+                SELECT s.id, :month, :year,
+                       CASE WHEN h.hours > 0 THEN ROUND(h.cost / h.hours, 2) ELSE s.hourly_rate END,
+                       COALESCE(h.hours, 0),
+                       COALESCE(h.cost, 0),
+                       COALESCE(b.bonus, 0),
+                       COALESCE(h.cost, 0) + COALESCE(b.bonus, 0),
+                       CURRENT_TIMESTAMP
+                FROM {staff_type}s s
+                LEFT JOIN ({period_cost_sql(staff_type, f"{staff_type}_id", where=shift_filter)}) h ON h.group_key = s.id
+                LEFT JOIN (
+                    SELECT si.{staff_type}_id AS staff_id, SUM(i.bonus_amount) AS bonus
+                    FROM {staff_type}_interventions si
+                    JOIN interventions_db.interventions i ON si.intervention_id = i.id
+                    JOIN patients_db.patients p ON si.patient_id = p.id
+                    WHERE si.date BETWEEN :start_date AND :end_date
+                    GROUP BY si.{staff_type}_id
+                ) b ON b.staff_id = s.id
+                WHERE h.hours IS NOT NULL OR b.bonus IS NOT NULL
+                ON CONFLICT ({staff_type}_id, year, month) DO NOTHING
+            """, {'month': month_str, 'year': year_str, 'start_date': start_date, 'end_date': end_date})
+            written[staff_type] = cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error running {staff_type} payroll: {e}")
+            written[staff_type] = 0
+        finally:
+            conn.close()
+    return written
+
+def _update_payments(year, month, assignments, condition, staff_types, staff_id=None):
+    month_str, year_str = _period(year, month)
+    updated = 0
+    for staff_type in staff_types:
+        conn = sqlite3.connect(f"db/{staff_type}s.db")
+        cursor = conn.cursor()
+        try:
+            query = f"UPDATE {staff_type}_payments SET {assignments} WHERE year = ? AND month = ? AND {condition}"
+            params = [year_str, month_str]
+            if staff_id is not None:
+                query += f" AND {staff_type}_id = ?"
+                params.append(staff_id)
+            cursor.execute(query, params)
+            updated += cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error updating {staff_type} payments: {e}")
+        finally:
+            conn.close()
+    return updated
+
+def mark_paid(year, month, staff_types=STAFF_TYPES, staff_id=None):
+    """Mark a month's payments (optionally of one employee) as paid; returns the number of rows marked"""
+    return _update_payments(year, month, "paid = 1, paid_date = CURRENT_TIMESTAMP", "paid = 0", staff_types, staff_id)
+
+def close_payroll(year, month, staff_types=STAFF_TYPES):
+    """Lock a month's payroll: its results are stored once and never recomputed.
+
+    Open rows are brought up to date with run_payroll first, then each
+    employee's shift and intervention details are stored with the row, so
+    the salary views of a closed month read everything back from the
+    payments table. Returns the number of rows closed.
+    """
+    run_payroll(year, month, staff_types)
+    start_date, end_date = month_bounds(year, month)
+    closed = 0
+    for staff_type in staff_types:
+        details = []
+        for payment in load_payments(staff_type, year, month):
+            if payment['closed']:
+                continue
+            salary = calculate_salary_details(staff_type, payment['staff_id'], start_date, end_date)
+            stored = {"shifts": salary['shifts'], "interventions": salary['interventions']} if salary else {}
+            details.append((json.dumps(stored), payment['id']))
+
+        conn = sqlite3.connect(f"db/{staff_type}s.db")
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(f"""
+                UPDATE {staff_type}_payments SET closed = 1, closed_date = CURRENT_TIMESTAMP, details = ?
+                WHERE id = ? AND closed = 0
+            """, details)
+            closed += cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Error closing {staff_type} payroll: {e}")
+        finally:
+            conn.close()
+    return closed
+
+def load_payments(staff_type, year, month, staff_id=None):
+    """Return a month's stored payments for one staff type as dicts, ordered by name"""
+    month_str, year_str = _period(year, month)
+    query = f"""
+        SELECT p.id, p.{staff_type}_id, COALESCE(s.name, 'Unknown'), p.month, p.year, p.hourly_rate, p.total_hours,
+               p.base_salary, p.total_bonus, p.total_salary, p.paid, p.paid_date, p.closed, p.closed_date, p.computed_at,
+               p.details
+        FROM {staff_type}_payments p
+        LEFT JOIN {staff_type}s s ON p.{staff_type}_id = s.id
+        WHERE p.year = ? AND p.month = ?
+    """
+    params = [year_str, month_str]
+    if staff_id is not None:
+        query += f" AND p.{staff_type}_id = ?"
+        params.append(staff_id)
+    query += " ORDER BY s.name"
+
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    payments = [dict(zip(PAYMENT_COLUMNS, row)) for row in cursor.fetchall()]
+    conn.close()
+    return payments
+
+def salary_stamp(staff_type, staff_id):
+    """Return the change counters a salary computation depends on.
+
+    The employee's own counter is bumped by triggers whenever their shifts,
+    interventions or staff row change; the patients, interventions and nurse
+    level counters cover the names, bonuses and level rates the details read.
+    """
+    conn = _connect(staff_type)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT (SELECT version FROM {staff_type}_salary_versions WHERE {staff_type}_id = ?),
+               (SELECT version FROM patients_db.table_versions WHERE table_name = 'patients'),
+               (SELECT version FROM interventions_db.table_versions WHERE table_name = 'interventions'),
+               (SELECT version FROM main.table_versions WHERE table_name = 'nurse_levels')
+    """, (staff_id,))
+    stamp = cursor.fetchone()
+    conn.close()
+    return stamp
+
+class SalaryCache:
+    """Process-wide cache of calculate_salary_details results keyed by employee type, id and period.
+
+    Each entry remembers the salary_stamp it was computed at. A lookup reads
+    the stamp with one small query and recomputes only when it moved, so
+    shift and intervention writes from any process (web app, desktop app,
+    imports, rosters) invalidate that employee's entries. The least recently
+    used entries are dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries=256):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+
+    def get(self, staff_type, staff_id, start_date, end_date):
+        key = (staff_type, int(staff_id), start_date, end_date)
+        stamp = salary_stamp(staff_type, staff_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return dict(entry[1])
+
+        details = calculate_salary_details(staff_type, staff_id, start_date, end_date)
+        if details is None:
+            return None
+        with self._lock:
+            self._entries[key] = (stamp, details)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(details)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+salary_cache = SalaryCache()
+
+def _stored_salary(payment):
+    """Salary details of a closed payment row, as stored by close_payroll"""
+    # Months closed before details were stored only have their totals
+    details = json.loads(payment['details']) if payment['details'] else {}
+    return {
+        "name": payment['name'],
+        "hourly_rate": payment['hourly_rate'],
+        "total_hours": payment['total_hours'],
+        "base_salary": payment['base_salary'],
+        "total_bonus": payment['total_bonus'],
+        "total_salary": payment['total_salary'],
+        "shifts": details.get("shifts", []),
+        "interventions": details.get("interventions", []),
+        "paid": bool(payment['paid']),
+        "closed": True,
+    }
+
+def closed_months(staff_type, start_date, end_date):
+    """Return the (year, month) of every closed payroll month lying entirely within start_date..end_date"""
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT DISTINCT year, month FROM {staff_type}_payments
+        WHERE closed = 1
+          AND year || '-' || month || '-01' >= ?
+          AND date(year || '-' || month || '-01', '+1 month', '-1 day') <= ?
+        ORDER BY year, month
+    """, (start_date, end_date))
+    months = cursor.fetchall()
+    conn.close()
+    return months
+
+def salary_summary(staff_type, staff_id, start_date, end_date):
+    """Salary totals and details for an employee and period.
+
+    Closed payroll months lying within the period are read from their stored
+    payment rows and never recomputed; the days around them come from the
+    salary cache. Shifts and interventions of closed months cannot change,
+    so a period only partly covering a closed month still matches its row.
+    """
+    months = closed_months(staff_type, start_date, end_date)
+    if not months:
+        return salary_cache.get(staff_type, staff_id, start_date, end_date)
+
+    parts = []
+    open_from = start_date
+    for year, month in months:
+        month_start, month_end = month_bounds(year, month)
+        if open_from < month_start:
+            day_before = (datetime.strptime(month_start, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+            parts.append(salary_cache.get(staff_type, staff_id, open_from, day_before))
+        payments = load_payments(staff_type, year, month, staff_id)
+        # An employee without a row had nothing to pay in that month
+        if payments:
+            parts.append(_stored_salary(payments[0]))
+        open_from = (datetime.strptime(month_end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    if open_from <= end_date:
+        parts.append(salary_cache.get(staff_type, staff_id, open_from, end_date))
+
+    parts = [part for part in parts if part]
+    if not parts:
+        return salary_cache.get(staff_type, staff_id, start_date, end_date)
+    if len(parts) == 1:
+        return parts[0]
+
+    summary = {
+        "name": parts[-1]['name'],
+        "hourly_rate": parts[-1]['hourly_rate'],
+        "shifts": [shift for part in parts for shift in part['shifts']],
+        "interventions": [intervention for part in parts for intervention in part['interventions']],
+        "closed": all(part.get('closed') for part in parts),
+        "paid": all(part.get('paid') for part in parts),
+    }
+    for total in ("total_hours", "base_salary", "total_bonus", "total_salary"):
+        summary[total] = round(sum(part[total] or 0 for part in parts), 2)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Run, pay and close the monthly payroll")
+    parser.add_argument('action', choices=['run', 'pay', 'close', 'show'])
+    parser.add_argument('year', type=int)
+    parser.add_argument('month', type=int)
+    parser.add_argument('--staff', choices=STAFF_TYPES, help="only doctors or only nurses")
+    args = parser.parse_args()
+
+    setup_database()
+    staff_types = [args.staff] if args.staff else STAFF_TYPES
+    if args.action == 'run':
+        for staff_type, rows in run_payroll(args.year, args.month, staff_types).items():
+            print(f"Computed {rows} {staff_type} payment(s)")
+    elif args.action == 'pay':
+        print(f"Marked {mark_paid(args.year, args.month, staff_types)} payment(s) as paid")
+    elif args.action == 'close':
+        print(f"Closed {close_payroll(args.year, args.month, staff_types)} payment(s)")
+    for staff_type in staff_types:
+        for payment in load_payments(staff_type, args.year, args.month):
+            status = ", ".join(label for label, flag in [("paid", payment['paid']), ("closed", payment['closed'])] if flag) or "open"
+            print(f"{staff_type:6} {payment['name']:20} {payment['total_hours']:8.2f} h  "
+                  f"bonus {payment['total_bonus']:10.2f}  salary {payment['total_salary']:10.2f}  {status}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import heapq
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+import openpyxl
+from .payroll import STAFF_TYPES, closed_months, load_payments, month_bounds
+from .staff_costs import shift_rate_sql, period_tables_sql
+from .utils import setup_database
+from .jobs import register_job_handler
+
+INVALID_TITLE_CHARS = re.compile(r"[\\/*?:\[\]]")
+
+SUMMARY_HEADER = ["Type", "ID", "Name", "Hourly Rate", "Shifts", "Total Hours", "Base Salary",
+                  "Interventions", "Bonus", "Total Salary", "Figures", "Sheet"]
+
+def sheet_title(staff_type, staff_id, name, used):
+    """Return a unique worksheet title (at most 31 characters, no reserved characters) for an employee"""
+    base = f"{staff_type[0].upper()}{staff_id} {INVALID_TITLE_CHARS.sub('', name or '')}".strip()[:31]
+    title = base
+    suffix = 2
+    while title.lower() in used:
+        title = f"{base[:31 - len(str(suffix)) - 1]}~{suffix}"
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+class _StaffRows:
+    """Reads a query ordered by staff id one employee at a time"""
+
+    def __init__(self, cursor):
+        self.groups = groupby(cursor, key=itemgetter(0))
+        self.pending = next(self.groups, None)
+
+    def rows_for(self, staff_id):
+        """Yield the rows of staff_id; call with increasing ids and consume each result fully"""
+        # Groups below staff_id belong to deleted staff and are skipped
+        while self.pending is not None and self.pending[0] < staff_id:
+            self.pending = next(self.groups, None)
+        if self.pending is not None and self.pending[0] == staff_id:
+            yield from self.pending[1]
+            self.pending = next(self.groups, None)
+
+def _staff_streams(conn, staff_type, start_date, end_date, closed):
+    """Open the employee, shift and intervention queries of one staff type, all ordered by staff id.
+
+    Days of the closed months in `closed` ('YYYY-MM' strings) are left out;
+    their figures come from the stored payment rows.
+    """
+    employees = conn.cursor()
+    employees.execute(f"SELECT id, name, hourly_rate FROM {staff_type}s_db.{staff_type}s ORDER BY id")
+
+    placeholders = ", ".join("?" for _ in closed)
+    shifts = conn.cursor()
+    shifts.execute(f"""
+        SELECT d.{staff_type}_id, sh.arrival_datetime, sh.leave_datetime, p.name, SUM(d.hours), {shift_rate_sql(staff_type)}
+        FROM {period_tables_sql(staff_type, f"{staff_type}s_db")}
+        JOIN patients p ON sh.patient_id = p.id
+        WHERE d.day BETWEEN ? AND ? AND substr(d.day, 1, 7) NOT IN ({placeholders})
+        GROUP BY d.shift_id
+        ORDER BY d.{staff_type}_id, sh.arrival_datetime
+    """, (start_date, end_date, *closed))
+
+    interventions = conn.cursor()
+    interventions.execute(f"""
+        SELECT si.{staff_type}_id, si.date, i.name, p.name, i.bonus_amount
+        FROM {staff_type}s_db.{staff_type}_interventions si
+        JOIN interventions_db.interventions i ON si.intervention_id = i.id
+        JOIN patients p ON si.patient_id = p.id
+        WHERE si.date BETWEEN ? AND ? AND substr(si.date, 1, 7) NOT IN ({placeholders})
+        ORDER BY si.{staff_type}_id, si.date
+    """, (start_date, end_date, *closed))
+    return employees, shifts, interventions
+
+def _stored_payments(staff_type, months):
+    """Return {staff_id: [payment, ...]} for the closed months, in month order"""
+    stored = {}
+    for year, month in months:
+        for payment in load_payments(staff_type, year, month):
+            stored.setdefault(payment['staff_id'], []).append(payment)
+    return stored
+
+def _stored_rows(staff_id, payments):
+    """Return the stored shift and intervention rows of closed payments, shaped like the live query rows"""
+    shifts = []
+    interventions = []
+    for payment in payments:
+        # Months closed before details were stored only have their totals
+        details = json.loads(payment['details']) if payment['details'] else {}
+        for shift in details.get("shifts", []):
+            shifts.append((staff_id, shift['arrival'], shift['leave'], shift['patient'], shift['hours'],
+                           shift.get('rate', payment['hourly_rate'])))
+        for intervention in details.get("interventions", []):
+            interventions.append((staff_id, intervention['date'], intervention['name'], intervention['patient'], intervention['bonus']))
+    return shifts, interventions
+
+def _covers_period(months, start_date, end_date):
+    """Tell whether consecutive closed months make up the whole period"""
+    day = start_date
+    for year, month in months:
+        month_start, month_end = month_bounds(year, month)
+        if month_start != day:
+            return False
+        day = (datetime.strptime(month_end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    return bool(months) and day > end_date
+
+def _count_employees(conn):
+    return sum(conn.execute(f"SELECT COUNT(*) FROM {staff_type}s_db.{staff_type}s").fetchone()[0]
+               for staff_type in STAFF_TYPES)
+
+def export_payroll_workbook(start_date, end_date, filename, progress_callback=None):
+    """Write every doctor's and nurse's salary for a period into one workbook.
+
+    The workbook is opened in write-only mode and every query is read row by
+    row, ordered by staff id, so rows go straight to disk and memory does not
+    grow with the number of employees or shifts. The first sheet summarises
+    all employees; each employee gets a detail sheet with their shifts and
+    interventions. Closed payroll months lying within the period are read
+    from their stored payment rows, so the workbook matches them even if
+    rates changed since; every other day is computed live from the shifts,
+    and each row says which figures it holds. Returns the summary totals.
+    """
+    conn = sqlite3.connect("db/patients.db")
+    conn.execute("ATTACH DATABASE 'db/doctors.db' AS doctors_db")
+    conn.execute("ATTACH DATABASE 'db/nurses.db' AS nurses_db")
+    conn.execute("ATTACH DATABASE 'db/interventions.db' AS interventions_db")
+    try:
+        workbook = openpyxl.Workbook(write_only=True)
+        summary = workbook.create_sheet("Summary")
+        summary.append(["Payroll", f"{start_date} to {end_date}"])
+        months = {staff_type: closed_months(staff_type, start_date, end_date) for staff_type in STAFF_TYPES}
+        for staff_type in STAFF_TYPES:
+            closed = ", ".join(f"{year}-{month}" for year, month in months[staff_type]) or "none"
+            summary.append([f"Closed {staff_type} months:", closed])
+        summary.append(["Figures outside closed months are computed live from the current shifts."])
+        summary.append([])
+        summary.append(SUMMARY_HEADER)
+
+        total = _count_employees(conn)
+        done = 0
+        used_titles = {"summary"}
+        totals = {'employees': 0, 'total_hours': 0, 'total_bonus': 0, 'total_salary': 0}
+        for staff_type in STAFF_TYPES:
+            closed = [f"{year}-{month}" for year, month in months[staff_type]]
+            stored = _stored_payments(staff_type, months[staff_type])
+            all_closed = _covers_period(months[staff_type], start_date, end_date)
+            employees, shifts, interventions = _staff_streams(conn, staff_type, start_date, end_date, closed)
+            shift_rows, intervention_rows = _StaffRows(shifts), _StaffRows(interventions)
+
+            for staff_id, name, hourly_rate in employees:
+                payments = stored.get(staff_id, [])
+                stored_shifts, stored_interventions = _stored_rows(staff_id, payments)
+                if not closed:
+                    figures = "Live"
+                elif all_closed:
+                    figures = "Closed"
+                else:
+                    figures = f"Closed {', '.join(closed)}, live otherwise"
+
+                title = sheet_title(staff_type, staff_id, name, used_titles)
+                sheet = workbook.create_sheet(title)
+                sheet.append([f"{staff_type.capitalize()} Salary Sheet"])
+                sheet.append([f"{staff_type.capitalize()} Name:", name])
+                sheet.append(["Period:", f"{start_date} to {end_date}"])
+                sheet.append(["Hourly Rate:", hourly_rate])
+                sheet.append(["Figures:", figures])
+                sheet.append([])
+
+                # Closed months and live days do not overlap, so merging by arrival keeps the sheet in date order
+                sheet.append(["Shifts"])
+                sheet.append(["Arrival", "Leave", "Patient", "Hours", "Rate", "Amount"])
+                shift_count = 0
+                hours = 0
+                base_salary = 0
+                for _, arrival, leave, patient, shift_hours, rate in heapq.merge(shift_rows.rows_for(staff_id), stored_shifts,
+                                                                               key=itemgetter(1)):
+                    sheet.append([arrival, leave, patient, shift_hours, rate, shift_hours * rate])
+                    shift_count += 1
+                    hours += shift_hours
+                    base_salary += shift_hours * rate
+                sheet.append([])
+
+                sheet.append(["Interventions"])
+                sheet.append(["Date", "Intervention", "Patient", "Bonus"])
+                intervention_count = 0
+                bonus = 0
+                for _, date, intervention, patient, amount in heapq.merge(intervention_rows.rows_for(staff_id), stored_interventions,
+                                                                          key=itemgetter(1)):
+                    sheet.append([date, intervention, patient, amount])
+                    intervention_count += 1
+                    bonus += amount
+                sheet.append([])
+
+                # The stored totals of closed months replace the sums of their detail rows, which
+                # months closed before details were stored do not have
+                hours += sum((payment['total_hours'] or 0) for payment in payments) - sum(row[4] for row in stored_shifts)
+                base_salary += sum((payment['base_salary'] or 0) for payment in payments) - sum(row[4] * row[5] for row in stored_shifts)
+                bonus += sum((payment['total_bonus'] or 0) for payment in payments) - sum(row[4] for row in stored_interventions)
+
+                sheet.append(["Total Hours:", hours])
+                sheet.append(["Base Salary:", base_salary])
+                sheet.append(["Bonus from Interventions:", bonus])
+                sheet.append(["Total Salary:", base_salary + bonus])
+
+                summary.append([staff_type.capitalize(), staff_id, name, hourly_rate, shift_count, hours,
+                                base_salary, intervention_count, bonus, base_salary + bonus, figures, title])
+                totals['employees'] += 1
+                totals['total_hours'] += hours
+                totals['total_bonus'] += bonus
+                totals['total_salary'] += base_salary + bonus
+
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+
+        summary.append([])
+        summary.append(["Employees", totals['employees']])
+        summary.append(["Total Hours", totals['total_hours']])
+        summary.append(["Total Bonus", totals['total_bonus']])
+        summary.append(["Total Payroll", totals['total_salary']])
+        workbook.save(filename)
+        return totals
+    finally:
+        conn.close()
+
+def run_payroll_export_job(job):
+    """Job handler: export the payroll workbook for a period"""
+    params = job.params
+    filename = job.output_path(f"payroll_{params['from_date']}_to_{params['to_date']}.xlsx")
+    totals = export_payroll_workbook(params['from_date'], params['to_date'], filename, job.update_progress)
+    return totals, filename
+
+register_job_handler('payroll_export', run_payroll_export_job)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the salaries of all doctors and nurses for a period into one workbook")
+    parser.add_argument('--from', dest='from_date', required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='to_date', required=True, help="last day (YYYY-MM-DD)")
+    parser.add_argument('--output', help="xlsx file to write")
+    args = parser.parse_args()
+
+    setup_database()
+    filename = args.output or f"payroll_{args.from_date}_to_{args.to_date}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+    def progress(done, total):
+        print(f"\rExported {done}/{total} employees", end="", flush=True)
+
+    totals = export_payroll_workbook(args.from_date, args.to_date, filename, progress)
+    print(f"\nWrote {totals['employees']} salary sheets, total payroll {totals['total_salary']:.2f}, to {filename}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import sqlite3
+from datetime import datetime, timedelta
+from .utils import setup_database, shift_timestamp
+from .staff_costs import STAFF_TYPES
+from .shift_import import check_overlaps, insert_shifts
+from .patient.balances import attach_patients_db
+
+# Longest date range a template is expanded over in one go
+MAX_EXPAND_DAYS = 366
+
+TEMPLATE_COLUMNS = ["id", "staff_id", "staff_name", "patient_id", "patient_name", "name", "start_time",
+                    "shift_hours", "days_on", "days_off", "anchor_date", "nurse_level_id"]
+
+def add_template(staff_type, staff_id, patient_id, name, start_time, shift_hours, days_on, days_off, anchor_date, nurse_level_id=None):
+    """Store a rotation such as 12-hour days, 4 on / 4 off, starting its cycle on anchor_date; returns its id or None"""
+    try:
+        datetime.strptime(start_time, "%H:%M")
+        datetime.strptime(anchor_date, "%Y-%m-%d")
+        shift_hours, days_on, days_off = float(shift_hours), int(days_on), int(days_off)
+    except (TypeError, ValueError) as e:
+        print(f"Error adding roster template: {e}")
+        return None
+    if not 0 < shift_hours <= 24 or days_on < 1 or days_off < 0:
+        print("Error adding roster template: shifts last up to 24 hours and a rotation needs at least one day on")
+        return None
+
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    try:
+        level_column = ", nurse_level_id" if staff_type == "nurse" else ""
+        values = [staff_id, patient_id, name, start_time, shift_hours, days_on, days_off, anchor_date]
+        if staff_type == "nurse":
+            values.append(nurse_level_id or None)
+        cursor.execute(f"""
+            INSERT INTO {staff_type}_roster_templates
+                ({staff_type}_id, patient_id, name, start_time, shift_hours, days_on, days_off, anchor_date{level_column})
+            VALUES ({", ".join("?" for _ in values)})
+        """, values)
+        conn.commit()
+        return cursor.lastrowid
+    except sqlite3.Error as e:
+        print(f"Error adding roster template: {e}")
+        return None
+    finally:
+        conn.close()
+
+def delete_template(staff_type, template_id, staff_id=None):
+    """Delete a roster template, of staff_id only when given; shifts already expanded from it are kept"""
+    query = f"DELETE FROM {staff_type}_roster_templates WHERE id = ?"
+    params = [template_id]
+    if staff_id is not None:
+        query += f" AND {staff_type}_id = ?"
+        params.append(staff_id)
+
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Error deleting roster template: {e}")
+        return False
+    finally:
+        conn.close()
+
+def load_templates(staff_type, staff_id=None, template_id=None):
+    """Return roster templates as dicts with the staff member's and patient's names"""
+    level_column = "t.nurse_level_id" if staff_type == "nurse" else "NULL"
+    query = f"""
+        SELECT t.id, t.{staff_type}_id, COALESCE(s.name, 'Unknown'), t.patient_id, COALESCE(p.name, 'Unknown'), t.name,
+               t.start_time, t.shift_hours, t.days_on, t.days_off, t.anchor_date, {level_column}
+        FROM {staff_type}_roster_templates t
+        LEFT JOIN {staff_type}s s ON t.{staff_type}_id = s.id
+        LEFT JOIN patients_db.patients p ON t.patient_id = p.id
+        WHERE 1 = 1
+    """
+    params = []
+    if staff_id is not None:
+        query += f" AND t.{staff_type}_id = ?"
+        params.append(staff_id)
+    if template_id is not None:
+        query += " AND t.id = ?"
+        params.append(template_id)
+    query += " ORDER BY t.id"
+
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    attach_patients_db(cursor)
+    cursor.execute(query, params)
+    templates = [dict(zip(TEMPLATE_COLUMNS, row)) for row in cursor.fetchall()]
+    conn.close()
+    return templates
+
+def expand_template(template, from_date, to_date):
+    """Return the shifts a template produces for the days from_date..to_date (inclusive), computed in memory.
+
+    A day is worked when its position in the cycle, counted from the
+    template's anchor date, falls within the days on. Shifts are dicts in
+    the shape shift_import validates and inserts.
+    """
+    start_hour, start_minute = (int(part) for part in template['start_time'].split(":"))
+    anchor = datetime.strptime(template['anchor_date'], "%Y-%m-%d").date()
+    day = datetime.strptime(from_date, "%Y-%m-%d").date()
+    last_day = datetime.strptime(to_date, "%Y-%m-%d").date()
+    cycle = template['days_on'] + template['days_off']
+    duration = timedelta(hours=template['shift_hours'])
+
+    shifts = []
+    while day <= last_day:
+        if (day - anchor).days % cycle < template['days_on']:
+            arrival = datetime(day.year, day.month, day.day, start_hour, start_minute)
+            leave = arrival + duration
+            shifts.append({
+                'row': len(shifts) + 1,
+                'staff_id': template['staff_id'],
+                'patient_id': template['patient_id'],
+                'level_id': template['nurse_level_id'],
+                'employee': template['staff_name'],
+                'patient': template['patient_name'],
+                'arrival': arrival.strftime("%Y-%m-%d %H:%M:%S"),
+                'leave': leave.strftime("%Y-%m-%d %H:%M:%S"),
+                'arrival_ts': shift_timestamp(arrival),
+                'leave_ts': shift_timestamp(leave),
+            })
+        day += timedelta(days=1)
+    return shifts
+
+def check_range(from_date, to_date):
+    """Validate an expansion range; raises ValueError with a message for the user"""
+    try:
+        first = datetime.strptime(from_date, "%Y-%m-%d").date()
+        last = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Please use YYYY-MM-DD dates")
+    if last < first:
+        raise ValueError("The range ends before it starts")
+    if (last - first).days + 1 > MAX_EXPAND_DAYS:
+        raise ValueError(f"A template can be expanded over at most {MAX_EXPAND_DAYS} days at a time")
+
+def roster_shifts(staff_type, template_id, from_date, to_date, apply=False, staff_id=None):
+    """Expand a template over a date range and check it against the stored shifts.
+
+    The range is checked with check_range, which raises ValueError. The
+    expansion is built in memory first; the overlap check (and, with apply,
+    the insert of every non-overlapping shift) then runs in one IMMEDIATE
+    transaction. Returns {'template', 'shifts', 'rejects', 'applied'}, or
+    None if the template does not exist (or, with staff_id, belongs to
+    someone else) or the database fails.
+    """
+    check_range(from_date, to_date)
+    templates = load_templates(staff_type, staff_id=staff_id, template_id=template_id)
+    if not templates:
+        return None
+    template = templates[0]
+    shifts = expand_template(template, from_date, to_date)
+
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    try:
+        attach_patients_db(cursor)
+        cursor.execute("BEGIN IMMEDIATE")
+        accepted, rejects = check_overlaps(cursor, staff_type, shifts) if shifts else ([], [])
+        applied = 0
+        if apply and accepted:
+            insert_shifts(cursor, staff_type, accepted)
+            conn.commit()
+            applied = len(accepted)
+        else:
+            conn.rollback()
+        return {
+            'template': template,
+            'shifts': sorted(accepted, key=lambda shift: shift['arrival_ts']),
+            'rejects': sorted(rejects, key=lambda reject: reject['row']),
+            'applied': applied,
+        }
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error expanding roster template: {e}")
+        return None
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage recurring shift rotations and expand them into shifts")
+    parser.add_argument('staff_type', choices=STAFF_TYPES)
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    list_parser = subparsers.add_parser('list', help="show the roster templates")
+    list_parser.add_argument('--staff-id', type=int)
+
+    add_parser = subparsers.add_parser('add', help="add a roster template")
+    add_parser.add_argument('staff_id', type=int)
+    add_parser.add_argument('patient_id', type=int)
+    add_parser.add_argument('name')
+    add_parser.add_argument('--start', required=True, help="shift start time (HH:MM)")
+    add_parser.add_argument('--hours', type=float, required=True, help="shift length in hours")
+    add_parser.add_argument('--on', type=int, required=True, help="days on in each cycle")
+    add_parser.add_argument('--off', type=int, required=True, help="days off in each cycle")
+    add_parser.add_argument('--anchor', required=True, help="first day of a cycle (YYYY-MM-DD)")
+    add_parser.add_argument('--level', type=int, help="nurse level id")
+
+    expand_parser = subparsers.add_parser('expand', help="preview or create the shifts of a template")
+    expand_parser.add_argument('template_id', type=int)
+    expand_parser.add_argument('--from', dest='from_date', required=True, help="first day (YYYY-MM-DD)")
+    expand_parser.add_argument('--to', dest='to_date', required=True, help="last day (YYYY-MM-DD)")
+    expand_parser.add_argument('--apply', action='store_true', help="create the shifts instead of only listing them")
+    args = parser.parse_args()
+
+    setup_database()
+    if args.action == 'list':
+        for template in load_templates(args.staff_type, args.staff_id):
+            print(f"{template['id']:4} {template['staff_name']:20} {template['name']:20} {template['start_time']} "
+                  f"{template['shift_hours']:g}h {template['days_on']} on/{template['days_off']} off from {template['anchor_date']} "
+                  f"for {template['patient_name']}")
+    elif args.action == 'add':
+        template_id = add_template(args.staff_type, args.staff_id, args.patient_id, args.name, args.start, args.hours,
+                                   args.on, args.off, args.anchor, args.level)
+        if template_id:
+            print(f"Added roster template {template_id}")
+    else:
+        try:
+            result = roster_shifts(args.staff_type, args.template_id, args.from_date, args.to_date, apply=args.apply)
+        except ValueError as e:
+            print(f"Error expanding roster template: {e}")
+            return
+        if result is None:
+            print("No such roster template")
+            return
+        for shift in result['shifts']:
+            print(f"  {shift['arrival']} - {shift['leave']}")
+        for reject in result['rejects']:
+            print(f"  skipped {reject['arrival']} - {reject['leave']}: {reject['reason']}")
+        if args.apply:
+            print(f"Created {result['applied']} shift(s), skipped {len(result['rejects'])}")
+        else:
+            print(f"{len(result['shifts'])} shift(s) would be created, {len(result['rejects'])} skipped (use --apply)")
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
+from ..catalog import get_catalog, invalidate_catalog
+from ..patient.balances import attach_patients_db, adjust_changed_charges, care_level_charges
 
 class CareLevelManagementHandler:
     def __init__(self, settings_module):
@@ -26,21 +28,18 @@ class CareLevelManagementHandler:
         ttk.Button(buttons_frame, text="Delete", command=self.delete_care_level).pack(side=tk.LEFT)
 
     def load_care_levels(self):
-        """Load care levels from the database"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rate FROM care_levels ORDER BY name")
-        care_levels = cursor.fetchall()
-        conn.close()
-        return care_levels
+        """Load care levels from the reference catalog"""
+        return get_catalog().care_levels()
 
-    def add_care_level(self, name, rate):
+    def add_care_level(self, name, rate, patients_per_nurse=None):
         """Add a new care level"""
         conn = sqlite3.connect("db/items.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO care_levels (name, daily_rate) VALUES (?, ?)", (name, rate))
+            cursor.execute("INSERT INTO care_levels (name, daily_rate, patients_per_nurse) VALUES (?, ?, ?)",
+                           (name, rate, patients_per_nurse or None))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "CREATE_CARE_LEVEL", f"Created care level: {name}")
             return True
         except sqlite3.Error as e:
@@ -51,23 +50,25 @@ class CareLevelManagementHandler:
 
     def get_care_level(self, care_level_id):
         """Get a single care level by ID"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rate FROM care_levels WHERE id = ?", (care_level_id,))
-        care_level = cursor.fetchone()
-        conn.close()
-        return care_level
+        return get_catalog().care_level(care_level_id)
 
-    def edit_care_level(self, care_level_id, name, rate):
+    def edit_care_level(self, care_level_id, name, rate, patients_per_nurse=None):
         """Edit a care level"""
         conn = sqlite3.connect("db/items.db")
         cursor = conn.cursor()
         try:
-            cursor.execute("UPDATE care_levels SET name = ?, daily_rate = ? WHERE id = ?", (name, rate, care_level_id))
+            attach_patients_db(cursor)
+            cursor.execute("BEGIN IMMEDIATE")
+            before = care_level_charges(cursor, care_level_id)
+            cursor.execute("UPDATE care_levels SET name = ?, daily_rate = ?, patients_per_nurse = ? WHERE id = ?",
+                           (name, rate, patients_per_nurse or None, care_level_id))
+            adjust_changed_charges(cursor, "stays", before, care_level_charges(cursor, care_level_id), "patients_db")
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "UPDATE_CARE_LEVEL", f"Updated care level: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error updating care level: {e}")
             return False
         finally:
@@ -78,13 +79,19 @@ class CareLevelManagementHandler:
         conn = sqlite3.connect("db/items.db")
         cursor = conn.cursor()
         try:
+            attach_patients_db(cursor)
+            cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT name FROM care_levels WHERE id = ?", (care_level_id,))
             name = cursor.fetchone()[0]
+            before = care_level_charges(cursor, care_level_id)
             cursor.execute("DELETE FROM care_levels WHERE id = ?", (care_level_id,))
+            adjust_changed_charges(cursor, "stays", before, {}, "patients_db")
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "DELETE_CARE_LEVEL", f"Deleted care level: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error deleting care level: {e}")
             return False
         finally:
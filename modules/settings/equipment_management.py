@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
+from ..catalog import get_catalog, invalidate_catalog
 
 class EquipmentManagementHandler:
     def __init__(self, settings_module):
@@ -48,13 +49,8 @@ class EquipmentManagementHandler:
         ttk.Button(assignment_frame, text="Unassign Selected Equipment", command=self.unassign_equipment).pack()
 
     def load_equipment(self):
-        """Load equipment from the database"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rental_price FROM equipment ORDER BY name")
-        equipment = cursor.fetchall()
-        conn.close()
-        return equipment
+        """Load equipment from the reference catalog"""
+        return get_catalog().equipment()
 
     def add_equipment(self, name, price):
         """Add new equipment"""
@@ -63,6 +59,7 @@ class EquipmentManagementHandler:
         try:
             cursor.execute("INSERT INTO equipment (name, daily_rental_price) VALUES (?, ?)", (name, price))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "CREATE_EQUIPMENT", f"Created equipment: {name}")
             return True
         except sqlite3.Error as e:
@@ -73,12 +70,7 @@ class EquipmentManagementHandler:
 
     def get_equipment(self, equipment_id):
         """Get a single piece of equipment by ID"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, daily_rental_price FROM equipment WHERE id = ?", (equipment_id,))
-        equipment = cursor.fetchone()
-        conn.close()
-        return equipment
+        return get_catalog().equipment_item(equipment_id)
 
     def edit_equipment(self, equipment_id, name, price):
         """Edit equipment"""
@@ -87,6 +79,7 @@ class EquipmentManagementHandler:
         try:
             cursor.execute("UPDATE equipment SET name = ?, daily_rental_price = ? WHERE id = ?", (name, price, equipment_id))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "UPDATE_EQUIPMENT", f"Updated equipment: {name}")
             return True
         except sqlite3.Error as e:
@@ -105,6 +98,7 @@ class EquipmentManagementHandler:
             cursor.execute("DELETE FROM equipment WHERE id = ?", (equipment_id,))
             cursor.execute("DELETE FROM care_level_equipment WHERE equipment_id = ?", (equipment_id,))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "DELETE_EQUIPMENT", f"Deleted equipment: {name}")
             return True
         except sqlite3.Error as e:
@@ -114,24 +108,12 @@ class EquipmentManagementHandler:
             conn.close()
 
     def load_care_levels(self):
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM care_levels ORDER BY name")
-        self.care_levels = cursor.fetchall()
-        conn.close()
+        self.care_levels = [(id, name) for id, name, *_ in get_catalog().care_levels()]
         self.care_level_combo['values'] = [name for id, name in self.care_levels]
 
     def load_assigned_equipment(self, care_level_id):
         """Load equipment assigned to a specific care level."""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT e.name, e.id FROM care_level_equipment cle
-            JOIN equipment e ON cle.equipment_id = e.id
-            WHERE cle.care_level_id = ?
-        """, (care_level_id,))
-        assigned_equipment = cursor.fetchall()
-        conn.close()
+        assigned_equipment = get_catalog().care_level_equipment(care_level_id)
         
         if hasattr(self, 'assigned_equipment_tree'):
             for i in self.assigned_equipment_tree.get_children():
@@ -159,6 +141,7 @@ class EquipmentManagementHandler:
         try:
             cursor.execute("INSERT INTO care_level_equipment (care_level_id, equipment_id) VALUES (?, ?)", (care_level_id, selected_equipment))
             conn.commit()
+            invalidate_catalog()
             item = self.equipment_tree.item(selected_equipment)
             name, _ = item['values']
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "ASSIGN_EQUIPMENT", f"Assigned equipment '{name}' to care level '{care_level_name}'")
@@ -186,6 +169,7 @@ class EquipmentManagementHandler:
 
         cursor.execute("DELETE FROM care_level_equipment WHERE care_level_id = ? AND equipment_id = ?", (care_level_id, equipment_id))
         conn.commit()
+        invalidate_catalog()
         conn.close()
         self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "UNASSIGN_EQUIPMENT", f"Unassigned equipment '{equipment_name}' from care level '{care_level_name}'")
         self.load_assigned_equipment()
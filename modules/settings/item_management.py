@@ -2,6 +2,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
 from ..utils import show_error_message
+from ..catalog import get_catalog, invalidate_catalog
+from ..patient.balances import attach_patients_db, adjust_changed_charges, intervention_charges
+from ..staff_costs import STAFF_TYPES
 
 class ItemManagementHandler:
     def __init__(self, settings_module):
@@ -67,13 +70,8 @@ class ItemManagementHandler:
         ttk.Button(buttons_frame, text="Delete", command=lambda c=category: self.delete_item(c)).pack(side=tk.LEFT)
 
     def load_interventions(self):
-        """Load interventions from the database"""
-        conn = sqlite3.connect("db/interventions.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, bonus_amount FROM interventions ORDER BY name")
-        interventions = cursor.fetchall()
-        conn.close()
-        return interventions
+        """Load interventions from the reference catalog"""
+        return get_catalog().interventions()
 
     def add_intervention(self, name, bonus):
         """Add a new intervention"""
@@ -82,6 +80,7 @@ class ItemManagementHandler:
         try:
             cursor.execute("INSERT INTO interventions (name, bonus_amount) VALUES (?, ?)", (name, bonus))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "CREATE_INTERVENTION", f"Created intervention: {name}")
             return True
         except sqlite3.Error as e:
@@ -92,23 +91,34 @@ class ItemManagementHandler:
 
     def get_intervention(self, intervention_id):
         """Get a single intervention by ID"""
+        return get_catalog().intervention(intervention_id)
+
+    def _connect_with_charges(self):
+        """Open interventions.db with the staff databases and patients.db attached, for edits that move patient balances"""
         conn = sqlite3.connect("db/interventions.db")
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, bonus_amount FROM interventions WHERE id = ?", (intervention_id,))
-        intervention = cursor.fetchone()
-        conn.close()
-        return intervention
+        for staff_type in STAFF_TYPES:
+            cursor.execute(f"ATTACH DATABASE 'db/{staff_type}s.db' AS {staff_type}s_db")
+        attach_patients_db(cursor)
+        return conn
 
     def edit_intervention(self, intervention_id, name, bonus):
         """Edit an intervention"""
-        conn = sqlite3.connect("db/interventions.db")
+        conn = self._connect_with_charges()
         cursor = conn.cursor()
         try:
+            cursor.execute("BEGIN IMMEDIATE")
+            before = {staff_type: intervention_charges(cursor, staff_type, intervention_id) for staff_type in STAFF_TYPES}
             cursor.execute("UPDATE interventions SET name = ?, bonus_amount = ? WHERE id = ?", (name, bonus, intervention_id))
+            for staff_type in STAFF_TYPES:
+                adjust_changed_charges(cursor, staff_type, before[staff_type],
+                                       intervention_charges(cursor, staff_type, intervention_id), "patients_db")
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "UPDATE_INTERVENTION", f"Updated intervention: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error updating intervention: {e}")
             return False
         finally:
@@ -116,29 +126,30 @@ class ItemManagementHandler:
 
     def delete_intervention(self, intervention_id):
         """Delete an intervention"""
-        conn = sqlite3.connect("db/interventions.db")
+        conn = self._connect_with_charges()
         cursor = conn.cursor()
         try:
+            cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT name FROM interventions WHERE id = ?", (intervention_id,))
             name = cursor.fetchone()[0]
+            before = {staff_type: intervention_charges(cursor, staff_type, intervention_id) for staff_type in STAFF_TYPES}
             cursor.execute("DELETE FROM interventions WHERE id = ?", (intervention_id,))
+            for staff_type in STAFF_TYPES:
+                adjust_changed_charges(cursor, staff_type, before[staff_type], {}, "patients_db")
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, "DELETE_INTERVENTION", f"Deleted intervention: {name}")
             return True
         except sqlite3.Error as e:
+            conn.rollback()
             print(f"Error deleting intervention: {e}")
             return False
         finally:
             conn.close()
 
     def load_items(self, category):
-        """Load items for a specific category from the database"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, price FROM items WHERE category = ? ORDER BY name", (category,))
-        items = cursor.fetchall()
-        conn.close()
-        return items
+        """Load items for a specific category from the reference catalog"""
+        return get_catalog().items(category)
 
     def add_item(self, category, name, price):
         """Add a new item"""
@@ -147,6 +158,7 @@ class ItemManagementHandler:
         try:
             cursor.execute("INSERT INTO items (category, name, price) VALUES (?, ?, ?)", (category, name, price))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, f"CREATE_ITEM", f"Created item: {name} in {category}")
             return True
         except sqlite3.Error as e:
@@ -157,12 +169,11 @@ class ItemManagementHandler:
 
     def get_item(self, item_id):
         """Get a single item by ID"""
-        conn = sqlite3.connect("db/items.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, category, price FROM items WHERE id = ?", (item_id,))
-        item = cursor.fetchone()
-        conn.close()
-        return item
+        item = get_catalog().item(item_id)
+        if not item:
+            return None
+        item_id, category, name, price = item
+        return (item_id, name, category, price)
 
     def edit_item(self, item_id, category, name, price):
         """Edit an item"""
@@ -171,6 +182,7 @@ class ItemManagementHandler:
         try:
             cursor.execute("UPDATE items SET category = ?, name = ?, price = ? WHERE id = ?", (category, name, price, item_id))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, f"UPDATE_ITEM", f"Updated item: {name} in {category}")
             return True
         except sqlite3.Error as e:
@@ -188,6 +200,7 @@ class ItemManagementHandler:
             name, category = cursor.fetchone()
             cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
             conn.commit()
+            invalidate_catalog()
             self.settings_module.auth_module.log_action(self.settings_module.auth_module.current_user, f"DELETE_ITEM", f"Deleted item: {name} from {category}")
             return True
         except sqlite3.Error as e:
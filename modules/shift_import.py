@@ -0,0 +1,330 @@
+import argparse
+import csv
+import os
+import sqlite3
+import zipfile
+from datetime import datetime
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from .utils import setup_database, SHIFT_OVERLAP_TOLERANCE_MINUTES, MAX_SHIFT_DAYS, shift_timestamp
+from .patient.balances import adjust_balance, attach_patients_db
+from .staff_costs import STAFF_TYPES, shift_costs
+
+# Accepted header names for each column, compared case-insensitively
+COLUMN_ALIASES = {
+    'employee': ["employee", "name", "doctor", "nurse", "staff"],
+    'patient': ["patient", "patient name"],
+    'arrival': ["arrival", "arrival_datetime", "start", "clock in"],
+    'leave': ["leave", "leave_datetime", "end", "clock out"],
+    'level': ["level", "nurse level", "nurse_level"],
+}
+
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M"]
+
+REJECT_COLUMNS = ["row", "employee", "patient", "arrival", "leave", "reason"]
+
+def read_rows(filename):
+    """Yield each data row of a CSV or XLSX timesheet as a dict keyed by the header, reading lazily"""
+    if filename.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell or "").strip().lower() for cell in next(rows, [])]
+            for row in rows:
+                if any(cell not in (None, "") for cell in row):
+                    yield dict(zip(header, row))
+        finally:
+            workbook.close()
+    else:
+        with open(filename, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = [cell.strip().lower() for cell in next(reader, [])]
+            for row in reader:
+                if any(cell.strip() for cell in row):
+                    yield dict(zip(header, row))
+
+def _column(row, name):
+    for alias in COLUMN_ALIASES[name]:
+        value = row.get(alias)
+        if value not in (None, ""):
+            return value.strip() if isinstance(value, str) else value
+    return None
+
+def parse_datetime(value):
+    """Return a timesheet cell as a datetime, or None if it cannot be read"""
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0)
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+def _name_index(rows):
+    """Map lower-cased names to ids; names used by more than one record map to None"""
+    index = {}
+    for row_id, name in rows:
+        key = (name or "").strip().lower()
+        index[key] = None if key in index else row_id
+    return index
+
+def load_indexes(cursor, staff_type):
+    """Read the employee, patient and nurse level names once into dicts"""
+    cursor.execute(f"SELECT id, name FROM {staff_type}s")
+    staff = _name_index(cursor.fetchall())
+    cursor.execute("SELECT id, name FROM patients_db.patients")
+    patients = _name_index(cursor.fetchall())
+    levels = {}
+    if staff_type == "nurse":
+        cursor.execute("SELECT id, level_name FROM nurse_levels")
+        levels = _name_index(cursor.fetchall())
+    return staff, patients, levels
+
+def _resolve(index, value, label):
+    """Look a name up in an index; returns (id, reject reason)"""
+    key = str(value).strip().lower()
+    if key not in index:
+        return None, f"Unknown {label} '{value}'"
+    if index[key] is None:
+        return None, f"More than one {label} is named '{value}'"
+    return index[key], None
+
+def parse_shifts(rows, staff_type, staff, patients, levels):
+    """Validate timesheet rows; returns (shifts, rejects).
+
+    Each shift is a dict with the resolved ids, the normalised datetimes and
+    their Unix timestamps; each reject is a REJECT_COLUMNS dict.
+    """
+    shifts = []
+    rejects = []
+    for row_number, row in enumerate(rows, 2):
+        employee, patient = _column(row, 'employee'), _column(row, 'patient')
+        arrival_value, leave_value = _column(row, 'arrival'), _column(row, 'leave')
+
+        def reject(reason):
+            rejects.append({'row': row_number, 'employee': employee, 'patient': patient,
+                            'arrival': arrival_value, 'leave': leave_value, 'reason': reason})
+
+        if not (employee and patient and arrival_value and leave_value):
+            reject("Missing employee, patient, arrival or leave")
+            continue
+        arrival, leave = parse_datetime(arrival_value), parse_datetime(leave_value)
+        if not arrival or not leave:
+            reject("Arrival and leave must look like YYYY-MM-DD HH:MM[:SS]")
+            continue
+        if leave <= arrival:
+            reject("Leave is not after arrival")
+            continue
+        if (shift_timestamp(leave) - 1) // 86400 - shift_timestamp(arrival) // 86400 > MAX_SHIFT_DAYS:
+            reject(f"Shift is longer than {MAX_SHIFT_DAYS + 1} calendar days")
+            continue
+        staff_id, reason = _resolve(staff, employee, staff_type)
+        if reason:
+            reject(reason)
+            continue
+        patient_id, reason = _resolve(patients, patient, "patient")
+        if reason:
+            reject(reason)
+            continue
+        level_id = None
+        level = _column(row, 'level') if staff_type == "nurse" else None
+        if level:
+            level_id, reason = _resolve(levels, level, "nurse level")
+            if reason:
+                reject(reason)
+                continue
+
+        shifts.append({
+            'row': row_number,
+            'staff_id': staff_id,
+            'patient_id': patient_id,
+            'level_id': level_id,
+            'employee': employee,
+            'patient': patient,
+            'arrival': arrival.strftime("%Y-%m-%d %H:%M:%S"),
+            'leave': leave.strftime("%Y-%m-%d %H:%M:%S"),
+            'arrival_ts': shift_timestamp(arrival),
+            'leave_ts': shift_timestamp(leave),
+        })
+    return shifts, rejects
+
+def sweep_overlaps(new_shifts, existing_shifts, tolerance_minutes=SHIFT_OVERLAP_TOLERANCE_MINUTES):
+    """Return {row: reason} for the new shifts of one employee that overlap by more than the tolerance.
+
+    Both lists are swept once in arrival order, keeping only the intervals
+    still open at the current arrival. A new shift overlapping a stored one
+    is always the one rejected; between two new shifts the later row loses.
+    Shifts are dicts with arrival_ts and leave_ts, plus row (new) or id
+    (existing).
+    """
+    tolerance = tolerance_minutes * 60
+    rejected = {}
+
+    def sweep(intervals, conflict):
+        active = []
+        for interval in sorted(intervals, key=lambda shift: (shift['arrival_ts'], 'row' in shift)):
+            # Intervals ending within the tolerance of this arrival cannot overlap it or any later one
+            active = [shift for shift in active if shift['leave_ts'] - interval['arrival_ts'] > tolerance]
+            overlapping = [shift for shift in active
+                           if min(shift['leave_ts'], interval['leave_ts']) - interval['arrival_ts'] > tolerance]
+            if not conflict(interval, overlapping):
+                active.append(interval)
+
+    def against_existing(interval, overlapping):
+        stored = [shift for shift in overlapping if 'id' in shift]
+        if 'row' in interval and stored:
+            rejected[interval['row']] = f"Overlaps existing shift {stored[0]['id']}"
+            return True
+        if 'id' in interval:
+            for shift in overlapping:
+                if 'row' in shift and shift['row'] not in rejected:
+                    rejected[shift['row']] = f"Overlaps existing shift {interval['id']}"
+        return False
+
+    def within_batch(interval, overlapping):
+        if overlapping:
+            rejected[interval['row']] = f"Overlaps row {overlapping[0]['row']} of this file"
+            return True
+        return False
+
+    sweep(new_shifts + existing_shifts, against_existing)
+    sweep([shift for shift in new_shifts if shift['row'] not in rejected], within_batch)
+    return rejected
+
+def _existing_shifts(cursor, staff_type, staff_id, shifts):
+    """Read the stored shifts of an employee that can touch the batch, along the overlap index"""
+    cursor.execute(f"""
+        SELECT id, arrival_ts, leave_ts FROM {staff_type}_shifts
+        WHERE {staff_type}_id = ? AND leave_ts > ? AND arrival_ts < ?
+    """, (staff_id, min(shift['arrival_ts'] for shift in shifts), max(shift['leave_ts'] for shift in shifts)))
+    return [{'id': row[0], 'arrival_ts': row[1], 'leave_ts': row[2]} for row in cursor.fetchall()]
+
+def closed_periods(cursor, staff_type):
+    """Return (start_ts, end_ts, 'YYYY-MM') for every closed payroll month of a staff type"""
+    cursor.execute(f"SELECT DISTINCT year, month FROM {staff_type}_payments WHERE closed = 1")
+    periods = []
+    for year, month in cursor.fetchall():
+        start = datetime(int(year), int(month), 1)
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        periods.append((shift_timestamp(start), shift_timestamp(end), start.strftime("%Y-%m")))
+    return periods
+
+def check_overlaps(cursor, staff_type, shifts):
+    """Split validated new shifts into (accepted, rejects) with one sort-and-sweep per employee.
+
+    Shifts reaching into a closed payroll month are rejected first; the
+    database refuses them anyway.
+    """
+    accepted = []
+    rejects = []
+    closed = closed_periods(cursor, staff_type)
+    by_staff = {}
+    for shift in shifts:
+        month = next((label for start, end, label in closed if start < shift['leave_ts'] and end > shift['arrival_ts']), None)
+        if month:
+            rejects.append({**{column: shift[column] for column in REJECT_COLUMNS[:-1]}, 'reason': f"Payroll for {month} is closed"})
+            continue
+        by_staff.setdefault(shift['staff_id'], []).append(shift)
+
+    for staff_id, staff_shifts in by_staff.items():
+        rejected = sweep_overlaps(staff_shifts, _existing_shifts(cursor, staff_type, staff_id, staff_shifts))
+        for shift in staff_shifts:
+            if shift['row'] in rejected:
+                rejects.append({**{column: shift[column] for column in REJECT_COLUMNS[:-1]}, 'reason': rejected[shift['row']]})
+            else:
+                accepted.append(shift)
+    return accepted, rejects
+
+def insert_shifts(cursor, staff_type, shifts):
+    """Insert validated shifts with one executemany and charge them to patient balances, in the caller's transaction"""
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {staff_type}_shifts")
+    last_id = cursor.fetchone()[0]
+    level_column = ", nurse_level_id" if staff_type == "nurse" else ""
+    level_value = ", :level_id" if staff_type == "nurse" else ""
+    cursor.executemany(f"""
+        INSERT INTO {staff_type}_shifts ({staff_type}_id, patient_id, arrival_datetime, leave_datetime, arrival_ts, leave_ts{level_column})
+        VALUES (:staff_id, :patient_id, :arrival, :leave, :arrival_ts, :leave_ts{level_value})
+    """, sorted(shifts, key=lambda shift: (shift['staff_id'], shift['arrival_ts'])))
+
+    # Charge the new shifts to their patients with the shared costing query
+    for patient_id, (count, hours, cost) in shift_costs(cursor, staff_type, "patient_id", where="sh.id > ?", params=(last_id,)).items():
+        adjust_balance(cursor, patient_id, staff_type, cost, "patients_db")
+
+def import_shifts(staff_type, filename, dry_run=False):
+    """Import a timesheet of doctor or nurse shifts.
+
+    Rows are streamed from the file and names resolved through in-memory
+    indexes; each employee's rows are then checked against each other and
+    their stored shifts with one sort-and-sweep, and the valid rows are
+    inserted with one executemany in a single IMMEDIATE transaction, with
+    patient balances adjusted in the same transaction. Returns
+    {'imported': n, 'valid': n, 'rejects': [...]}; with dry_run nothing is written.
+    A file that cannot be read imports nothing and adds an 'error' message.
+    """
+    conn = sqlite3.connect(f"db/{staff_type}s.db")
+    cursor = conn.cursor()
+    try:
+        attach_patients_db(cursor)
+        staff, patients, levels = load_indexes(cursor, staff_type)
+        shifts, rejects = parse_shifts(read_rows(filename), staff_type, staff, patients, levels)
+
+        cursor.execute("BEGIN IMMEDIATE")
+        accepted, overlapping = check_overlaps(cursor, staff_type, shifts)
+        rejects = sorted(rejects + overlapping, key=lambda reject: reject['row'])
+
+        if dry_run or not accepted:
+            conn.rollback()
+            return {'imported': 0, 'valid': len(accepted), 'rejects': rejects}
+
+        insert_shifts(cursor, staff_type, accepted)
+        conn.commit()
+        return {'imported': len(accepted), 'valid': len(accepted), 'rejects': rejects}
+    except UnicodeDecodeError:
+        conn.rollback()
+        return {'imported': 0, 'valid': 0, 'rejects': [],
+                'error': "Could not read the timesheet: save the CSV file with UTF-8 encoding and try again."}
+    except (OSError, zipfile.BadZipFile, InvalidFileException) as e:
+        conn.rollback()
+        return {'imported': 0, 'valid': 0, 'rejects': [],
+                'error': f"Could not read the timesheet: it is not a valid CSV or XLSX file ({e})."}
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error importing {staff_type} shifts: {e}")
+        return None
+    finally:
+        conn.close()
+
+def write_reject_report(rejects, filename):
+    """Write rejected timesheet rows and their reasons to a CSV file"""
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REJECT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rejects)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import doctor or nurse shifts from a CSV or XLSX timesheet")
+    parser.add_argument('staff_type', choices=STAFF_TYPES)
+    parser.add_argument('filename', help="timesheet with employee, patient, arrival and leave columns (and level for nurses)")
+    parser.add_argument('--dry-run', action='store_true', help="only validate the rows")
+    parser.add_argument('--rejects', help="CSV file for the rejected rows (default: <timesheet>_rejects.csv)")
+    args = parser.parse_args()
+
+    setup_database()
+    result = import_shifts(args.staff_type, args.filename, dry_run=args.dry_run)
+    if result is None:
+        return
+    if result.get('error'):
+        print(result['error'])
+        return
+    if args.dry_run:
+        print(f"{result['valid']} valid shift(s), nothing imported")
+    else:
+        print(f"Imported {result['imported']} shift(s)")
+    if result['rejects']:
+        reject_file = args.rejects or f"{os.path.splitext(args.filename)[0]}_rejects.csv"
+        write_reject_report(result['rejects'], reject_file)
+        print(f"Rejected {len(result['rejects'])} row(s), see {reject_file}")
+
+if __name__ == '__main__':
+    main()
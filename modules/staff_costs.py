@@ -0,0 +1,85 @@
+# Shift hours and cost, shared by salaries, payroll, bills, balances and reports.
+# A shift is paid at the hourly rate of the level it was worked at when it
+# records one (nurse_shifts.nurse_level_id), otherwise at the staff member's
+# own rate, so a shift costs the same on a bill, a payslip and the report.
+
+STAFF_TYPES = ["doctor", "nurse"]
+
+# Hours of the shift aliased sh, rounded per shift like calculate_hours
+SHIFT_HOURS_SQL = "ROUND((julianday(sh.leave_datetime) - julianday(sh.arrival_datetime)) * 24, 2)"
+
+def shift_rate_sql(staff_type):
+    """Hourly rate of the shift aliased sh, joined by shift_tables_sql"""
+    if staff_type == "nurse":
+        return "COALESCE(nl.hourly_rate, s.hourly_rate)"
+    return "s.hourly_rate"
+
+def shift_tables_sql(staff_type, schema="main"):
+    """FROM clause of a staff type's shifts (sh) with their staff member (s) and, for nurses, level (nl).
+
+    Shifts of deleted staff members are left out, as they are everywhere else.
+    """
+    tables = (f"{schema}.{staff_type}_shifts sh "
+              f"JOIN {schema}.{staff_type}s s ON sh.{staff_type}_id = s.id")
+    if staff_type == "nurse":
+        tables += f" LEFT JOIN {schema}.nurse_levels nl ON sh.nurse_level_id = nl.id"
+    return tables
+
+def shift_cost_sql(staff_type, group_by, schema="main", where="1 = 1"):
+    """Grouped query of (group_key, shifts, hours, cost) over the shifts matching where.
+
+    group_by is a column of the shifts table, e.g. 'nurse_id' or 'patient_id'.
+    """
+    return f"""
+        SELECT sh.{group_by} AS group_key, COUNT(*) AS shifts, SUM({SHIFT_HOURS_SQL}) AS hours,
+               SUM({SHIFT_HOURS_SQL} * {shift_rate_sql(staff_type)}) AS cost
+        FROM {shift_tables_sql(staff_type, schema)}
+        WHERE {where}
+        GROUP BY sh.{group_by}
+    """
+
+def shift_costs(cursor, staff_type, group_by, schema="main", where="1 = 1", params=()):
+    """Return {key: (shifts, hours, cost)} for the shifts matching where, in one grouped query"""
+    cursor.execute(shift_cost_sql(staff_type, group_by, schema, where), params)
+    return {key: (shifts, hours or 0.0, cost or 0.0) for key, shifts, hours, cost in cursor.fetchall()}
+
+def shift_cost(cursor, staff_type, shift_id, schema="main"):
+    """Return the cost of one stored shift"""
+    cursor.execute(f"""
+        SELECT {SHIFT_HOURS_SQL} * {shift_rate_sql(staff_type)}
+        FROM {shift_tables_sql(staff_type, schema)}
+        WHERE sh.id = ?
+    """, (shift_id,))
+    row = cursor.fetchone()
+    return row[0] or 0.0 if row else 0.0
+
+# Period totals read the per-day split of each shift ({staff}_shift_day_hours,
+# aliased d), so a night shift counts in the day, month or report range each of
+# its hours fall in, and the range filter is an indexed comparison on d.day.
+
+def period_tables_sql(staff_type, schema="main"):
+    """FROM clause of a staff type's shift hours per day (d) with their shift (sh), staff member (s) and, for nurses, level (nl)"""
+    tables = (f"{schema}.{staff_type}_shift_day_hours d "
+              f"JOIN {schema}.{staff_type}_shifts sh ON d.shift_id = sh.id "
+              f"JOIN {schema}.{staff_type}s s ON sh.{staff_type}_id = s.id")
+    if staff_type == "nurse":
+        tables += f" LEFT JOIN {schema}.nurse_levels nl ON sh.nurse_level_id = nl.id"
+    return tables
+
+def period_cost_sql(staff_type, group_by, schema="main", where="1 = 1"):
+    """Grouped query of (group_key, shifts, hours, cost) over the hours worked on the days :start_date..:end_date.
+
+    group_by is a column of the day hours table, e.g. 'nurse_id', 'patient_id' or 'day'.
+    """
+    return f"""
+        SELECT d.{group_by} AS group_key, COUNT(DISTINCT d.shift_id) AS shifts, SUM(d.hours) AS hours,
+               SUM(d.hours * {shift_rate_sql(staff_type)}) AS cost
+        FROM {period_tables_sql(staff_type, schema)}
+        WHERE d.day BETWEEN :start_date AND :end_date AND {where}
+        GROUP BY d.{group_by}
+    """
+
+def period_costs(cursor, staff_type, group_by, start_date, end_date, schema="main"):
+    """Return {key: (shifts, hours, cost)} for the hours worked from start_date to end_date, in one grouped query"""
+    cursor.execute(period_cost_sql(staff_type, group_by, schema), {'start_date': start_date, 'end_date': end_date})
+    return {key: (shifts, hours or 0.0, cost or 0.0) for key, shifts, hours, cost in cursor.fetchall()}
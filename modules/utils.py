@@ -1,9 +1,11 @@
 import sqlite3
 import os
+import calendar
 from datetime import datetime
 import configparser
 from tkinter import messagebox
 import traceback
+from .staff_costs import shift_rate_sql, period_tables_sql
 
 def show_error_message(title, message):
     """Display an error message box, with traceback in debug mode."""
@@ -37,6 +39,340 @@ def setup_database():
     # Setup items database
     setup_items_db()
 
+    # Fill price snapshots on item rows written before they existed
+    backfill_item_prices()
+
+    # Build running patient balances from existing charges on first run
+    from .patient.balances import backfill_balances
+    backfill_balances()
+
+def backfill_item_prices():
+    """Snapshot current item prices onto patient item rows that have no unit_price yet"""
+    conn = sqlite3.connect("db/patients.db")
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE 'db/items.db' AS items_db")
+    try:
+        for category in ["labs", "drugs", "radiology", "consultations"]:
+            cursor.execute(f"""
+                UPDATE patient_{category}
+                SET unit_price = (SELECT price FROM items_db.items WHERE id = patient_{category}.item_id)
+                WHERE unit_price IS NULL
+            """)
+            cursor.execute(f"UPDATE patient_{category} SET line_total = quantity * unit_price WHERE line_total IS NULL AND unit_price IS NOT NULL")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error backfilling item prices: {e}")
+    finally:
+        conn.close()
+
+def setup_payments_table(cursor, staff_type):
+    """Add the payroll run columns to a payments table, one row per employee and month"""
+    table = f"{staff_type}_payments"
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = [info[1] for info in cursor.fetchall()]
+    for column, definition in [("hourly_rate", "REAL"), ("base_salary", "REAL"), ("closed", "BOOLEAN DEFAULT 0"),
+                               ("closed_date", "TIMESTAMP"), ("computed_at", "TIMESTAMP"), ("details", "TEXT")]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_period ON {table} ({staff_type}_id, year, month)")
+
+def setup_salary_versions(cursor, staff_type):
+    """Keep a per-employee change counter, bumped by triggers on writes to their shifts, interventions and staff row"""
+    table = f"{staff_type}_salary_versions"
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            {staff_type}_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    bump = f"INSERT INTO {table} ({staff_type}_id, version) VALUES ({{row}}, 1) ON CONFLICT ({staff_type}_id) DO UPDATE SET version = version + 1;"
+    for source, column in [(f"{staff_type}_shifts", f"{staff_type}_id"), (f"{staff_type}_interventions", f"{staff_type}_id"),
+                           (f"{staff_type}s", "id")]:
+        for operation, rows in [("INSERT", ["NEW"]), ("UPDATE", ["OLD", "NEW"]), ("DELETE", ["OLD"])]:
+            if source == f"{staff_type}s" and operation == "INSERT":
+                continue
+            statements = " ".join(bump.format(row=f"{row}.{column}") for row in rows)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {source}_{operation.lower()}_salary_version
+                AFTER {operation} ON {source}
+                BEGIN
+                    {statements}
+                END
+            ''')
+
+def setup_payroll_locks(cursor, staff_type):
+    """Reject writes to shifts and interventions dated inside a closed payroll month.
+
+    A shift is dated in every month its arrival..leave interval reaches into,
+    so a night shift ending in a closed month is rejected too. Deleting a
+    shift is allowed once its employee is gone, which lets a whole staff
+    record be deleted together with its payments, or when its patient is
+    listed in deleted_patients: the patient delete and orphan sweep paths
+    list the patients they remove there for the length of their own
+    transaction. A closed month's payments keep their stored details.
+    """
+    cursor.execute("CREATE TABLE IF NOT EXISTS deleted_patients (patient_id INTEGER PRIMARY KEY)")
+
+    def closed_month(start, end):
+        return f"""EXISTS (
+            SELECT 1 FROM {staff_type}_payments p
+            WHERE p.closed = 1
+              AND julianday(p.year || '-' || p.month || '-01') < julianday({end})
+              AND julianday(p.year || '-' || p.month || '-01', '+1 month') > julianday({start})
+        )"""
+
+    level_column = ", nurse_level_id" if staff_type == "nurse" else ""
+    sources = [
+        (f"{staff_type}_shifts", f"{staff_type}_id, arrival_datetime, leave_datetime{level_column}",
+         lambda row: closed_month(f"{row}.arrival_datetime", f"{row}.leave_datetime")),
+        (f"{staff_type}_interventions", f"{staff_type}_id, date, intervention_id",
+         lambda row: closed_month(f"{row}.date", f"date({row}.date, '+1 day')")),
+    ]
+    for source, columns, closed in sources:
+        # Older delete triggers also blocked deleting a patient's rows; replace them
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"{source}_delete_payroll_lock",))
+        trigger = cursor.fetchone()
+        if trigger and "deleted_patients" not in trigger[0]:
+            cursor.execute(f"DROP TRIGGER {source}_delete_payroll_lock")
+
+        for operation, when in [
+            ("INSERT", closed("NEW")),
+            (f"UPDATE OF {columns}", f"{closed('OLD')} OR {closed('NEW')}"),
+            ("DELETE", f"{closed('OLD')} AND EXISTS (SELECT 1 FROM {staff_type}s WHERE id = OLD.{staff_type}_id)"
+                       " AND OLD.patient_id NOT IN (SELECT patient_id FROM deleted_patients)"),
+        ]:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {source}_{operation.split()[0].lower()}_payroll_lock
+                BEFORE {operation} ON {source}
+                WHEN {when}
+                BEGIN
+                    SELECT RAISE(ABORT, 'payroll for this period is closed');
+                END
+            ''')
+
+# Longest shift, in calendar days after its arrival day, that the per-day split covers; longer shifts are rejected
+MAX_SHIFT_DAYS = 366
+
+def setup_shift_day_hours(cursor, staff_type):
+    """Maintain {staff_type}_shift_day_hours: the hours of every shift split by calendar day.
+
+    Triggers on the shifts table insert, replace and delete a shift's rows,
+    so every write path keeps the split in step. Each day row holds the part
+    of the shift between midnight and midnight. Day parts are rounded
+    cumulatively from the arrival, so a shift's days add up exactly to its
+    hours rounded like staff_costs.SHIFT_HOURS_SQL and the rounding
+    remainder lands on its last day. Period queries filter and group on the
+    indexed day column instead of DATE(arrival_datetime). Shifts stored
+    before the table existed, or split by an older version of the triggers,
+    are split again here. Shifts reaching more than MAX_SHIFT_DAYS past
+    their arrival day are rejected.
+    """
+    table = f"{staff_type}_shift_day_hours"
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    backfill = cursor.fetchone() is None
+
+    # Older triggers rounded each day on its own; replace them and split every shift again
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"{staff_type}_shifts_insert_day_hours",))
+    trigger = cursor.fetchone()
+    if trigger and "- shift.arrival" not in trigger[0]:
+        cursor.execute(f"DROP TRIGGER {staff_type}_shifts_insert_day_hours")
+        cursor.execute(f"DROP TRIGGER IF EXISTS {staff_type}_shifts_update_day_hours")
+        cursor.execute(f"DELETE FROM {table}")
+        backfill = True
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS shift_day_offsets (n INTEGER PRIMARY KEY)")
+    cursor.execute("SELECT COUNT(*) FROM shift_day_offsets")
+    if cursor.fetchone()[0] != MAX_SHIFT_DAYS + 1:
+        cursor.execute("DELETE FROM shift_day_offsets")
+        cursor.executemany("INSERT INTO shift_day_offsets (n) VALUES (?)", [(n,) for n in range(MAX_SHIFT_DAYS + 1)])
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            shift_id INTEGER NOT NULL,
+            {staff_type}_id INTEGER NOT NULL,
+            patient_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            hours REAL NOT NULL,
+            PRIMARY KEY (shift_id, day)
+        )
+    ''')
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_day ON {table} (day, {staff_type}_id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_staff ON {table} ({staff_type}_id, day)")
+
+    def split(row, source=""):
+        # One row per calendar day from the arrival day to the day before the leave instant
+        return f'''
+            INSERT INTO {table} (shift_id, {staff_type}_id, patient_id, day, hours)
+            SELECT shift.id, shift.staff_id, shift.patient_id, DATE(shift.day_start, 'unixepoch'),
+                   ROUND(ROUND((MIN(shift.leave, shift.day_start + 86400) - shift.arrival) / 3600.0, 2)
+                         - ROUND((MAX(shift.arrival, shift.day_start) - shift.arrival) / 3600.0, 2), 2)
+            FROM (
+                SELECT bounds.*, (bounds.arrival / 86400 + o.n) * 86400 AS day_start
+                FROM (
+                    SELECT {row}.id AS id, {row}.{staff_type}_id AS staff_id, {row}.patient_id AS patient_id,
+                           CAST(strftime('%s', {row}.arrival_datetime) AS INTEGER) AS arrival,
+                           CAST(strftime('%s', {row}.leave_datetime) AS INTEGER) AS leave
+                    {source}
+                ) bounds
+                JOIN shift_day_offsets o ON o.n <= (bounds.leave - 1) / 86400 - bounds.arrival / 86400
+                WHERE bounds.leave > bounds.arrival
+            ) shift
+        '''
+
+    too_long = f"""
+        (CAST(strftime('%s', NEW.leave_datetime) AS INTEGER) - 1) / 86400
+        - CAST(strftime('%s', NEW.arrival_datetime) AS INTEGER) / 86400 > {MAX_SHIFT_DAYS}
+    """
+    for operation in ("INSERT", "UPDATE OF arrival_datetime, leave_datetime"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {staff_type}_shifts_{operation.split()[0].lower()}_max_days
+            BEFORE {operation} ON {staff_type}_shifts
+            WHEN {too_long}
+            BEGIN
+                SELECT RAISE(ABORT, 'shift is longer than {MAX_SHIFT_DAYS + 1} calendar days');
+            END
+        ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {staff_type}_shifts_insert_day_hours
+        AFTER INSERT ON {staff_type}_shifts
+        BEGIN
+            {split("NEW")};
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {staff_type}_shifts_update_day_hours
+        AFTER UPDATE OF {staff_type}_id, patient_id, arrival_datetime, leave_datetime ON {staff_type}_shifts
+        BEGIN
+            DELETE FROM {table} WHERE shift_id = OLD.id;
+            {split("NEW")};
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {staff_type}_shifts_delete_day_hours
+        AFTER DELETE ON {staff_type}_shifts
+        BEGIN
+            DELETE FROM {table} WHERE shift_id = OLD.id;
+        END
+    ''')
+
+    if backfill:
+        cursor.execute(split("sh", f"FROM {staff_type}_shifts sh"))
+
+def setup_roster_templates(cursor, staff_type):
+    """Create the table of recurring shift rotations (days on / days off) of a staff type"""
+    level_column = "nurse_level_id INTEGER REFERENCES nurse_levels(id)," if staff_type == "nurse" else ""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {staff_type}_roster_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {staff_type}_id INTEGER NOT NULL,
+            patient_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            shift_hours REAL NOT NULL,
+            days_on INTEGER NOT NULL,
+            days_off INTEGER NOT NULL,
+            anchor_date DATE NOT NULL,
+            {level_column}
+            FOREIGN KEY ({staff_type}_id) REFERENCES {staff_type}s (id)
+        )
+    ''')
+
+# Shifts of one employee may overlap by this much, e.g. for a handover
+SHIFT_OVERLAP_TOLERANCE_MINUTES = 20
+
+def setup_shift_timestamps(cursor, staff_type):
+    """Add numeric arrival_ts/leave_ts columns (Unix seconds) to a shifts table, fill them and index them for overlap checks"""
+    table = f"{staff_type}_shifts"
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = [info[1] for info in cursor.fetchall()]
+    for column in ["arrival_ts", "leave_ts"]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    cursor.execute(f"""
+        UPDATE {table}
+        SET arrival_ts = CAST(strftime('%s', arrival_datetime) AS INTEGER),
+            leave_ts = CAST(strftime('%s', leave_datetime) AS INTEGER)
+        WHERE arrival_ts IS NULL OR leave_ts IS NULL
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_overlap ON {table} ({staff_type}_id, leave_ts, arrival_ts)")
+
+def shift_timestamp(value):
+    """Return a shift datetime (datetime or 'YYYY-MM-DD HH:MM:SS') as Unix seconds, like strftime('%s')"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return calendar.timegm(value.timetuple())
+
+def find_overlapping_shift(cursor, staff_type, staff_id, arrival_datetime, leave_datetime, tolerance_minutes=SHIFT_OVERLAP_TOLERANCE_MINUTES):
+    """Return the id of a shift of the employee overlapping the interval by more than the tolerance, or None.
+
+    Only shifts ending after the new one starts are read, along the
+    (staff, leave_ts) index, so the cost does not grow with past shifts.
+    """
+    cursor.execute(f"""
+        SELECT id FROM {staff_type}_shifts
+        WHERE {staff_type}_id = :staff_id
+          AND leave_ts > :arrival + :tolerance
+          AND arrival_ts < :leave - :tolerance
+          AND MIN(leave_ts, :leave) - MAX(arrival_ts, :arrival) > :tolerance
+        LIMIT 1
+    """, {
+        'staff_id': staff_id,
+        'arrival': shift_timestamp(arrival_datetime),
+        'leave': shift_timestamp(leave_datetime),
+        'tolerance': tolerance_minutes * 60,
+    })
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def setup_change_tracking(cursor, tables):
+    """Maintain a per-table change counter, bumped by triggers on every write"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    for table in tables:
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table,))
+        for operation in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{operation.lower()}_version
+                AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE table_versions
+                    SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+def get_change_stamp(sources):
+    """Return the change counters and latest change time for (database, table) pairs"""
+    tables_by_db = {}
+    for db, table in sources:
+        tables_by_db.setdefault(db, []).append(table)
+
+    versions = []
+    last_changed = None
+    for db, tables in tables_by_db.items():
+        conn = sqlite3.connect(f"db/{db}.db")
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in tables)
+        cursor.execute(f"SELECT table_name, version, changed_at FROM table_versions WHERE table_name IN ({placeholders})", tables)
+        for table, version, changed_at in cursor.fetchall():
+            versions.append(f"{db}.{table}:{version}")
+            if changed_at and (last_changed is None or changed_at > last_changed):
+                last_changed = changed_at
+        conn.close()
+
+    return {
+        "versions": sorted(versions),
+        "last_changed": datetime.strptime(last_changed, "%Y-%m-%d %H:%M:%S") if last_changed else None,
+    }
+
 def setup_doctors_db():
     """Setup doctors database"""
     conn = sqlite3.connect("db/doctors.db")
@@ -89,6 +425,19 @@ def setup_doctors_db():
         )
     ''')
     
+    # Per-patient, date-ordered reads (bills, timeline)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctor_shifts_patient ON doctor_shifts (patient_id, arrival_datetime)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctor_interventions_patient ON doctor_interventions (patient_id, date)")
+
+    setup_shift_timestamps(cursor, "doctor")
+    setup_shift_day_hours(cursor, "doctor")
+    setup_roster_templates(cursor, "doctor")
+    setup_payments_table(cursor, "doctor")
+    setup_salary_versions(cursor, "doctor")
+    setup_payroll_locks(cursor, "doctor")
+
+    setup_change_tracking(cursor, ["doctors", "doctor_shifts", "doctor_interventions", "doctor_payments"])
+    
     conn.commit()
     conn.close()
 
@@ -168,6 +517,19 @@ def setup_nurses_db():
         )
     ''')
     
+    # Per-patient, date-ordered reads (bills, timeline)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_nurse_shifts_patient ON nurse_shifts (patient_id, arrival_datetime)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_nurse_interventions_patient ON nurse_interventions (patient_id, date)")
+
+    setup_shift_timestamps(cursor, "nurse")
+    setup_shift_day_hours(cursor, "nurse")
+    setup_roster_templates(cursor, "nurse")
+    setup_payments_table(cursor, "nurse")
+    setup_salary_versions(cursor, "nurse")
+    setup_payroll_locks(cursor, "nurse")
+
+    setup_change_tracking(cursor, ["nurse_levels", "nurses", "nurse_shifts", "nurse_interventions", "nurse_payments"])
+    
     conn.commit()
     conn.close()
 
@@ -255,11 +617,46 @@ def setup_patients_db():
         )
     ''')
 
+    # Snapshot the unit price and line total on item rows so later price edits don't reprice history
+    for category in ["labs", "drugs", "radiology", "consultations"]:
+        cursor.execute(f"PRAGMA table_info(patient_{category})")
+        columns = [info[1] for info in cursor.fetchall()]
+        if 'unit_price' not in columns:
+            cursor.execute(f'ALTER TABLE patient_{category} ADD COLUMN unit_price REAL')
+        if 'line_total' not in columns:
+            cursor.execute(f'ALTER TABLE patient_{category} ADD COLUMN line_total REAL')
+
     # Add stay_date column to patient_equipment if it doesn't exist
     cursor.execute("PRAGMA table_info(patient_equipment)")
     columns = [info[1] for info in cursor.fetchall()]
     if 'stay_date' not in columns:
         cursor.execute('ALTER TABLE patient_equipment ADD COLUMN stay_date DATE')
+
+    # Running totals per patient, adjusted in the same transaction as each charge
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS patient_balances (
+            patient_id INTEGER PRIMARY KEY,
+            stays REAL NOT NULL DEFAULT 0,
+            labs REAL NOT NULL DEFAULT 0,
+            drugs REAL NOT NULL DEFAULT 0,
+            radiology REAL NOT NULL DEFAULT 0,
+            consultations REAL NOT NULL DEFAULT 0,
+            equipment REAL NOT NULL DEFAULT 0,
+            doctor REAL NOT NULL DEFAULT 0,
+            nurse REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (patient_id) REFERENCES patients (id)
+        )
+    ''')
+    
+    # Per-patient, date-ordered reads (bills, timeline)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patient_stays_patient ON patient_stays (patient_id, stay_date)")
+    for category in ["labs", "drugs", "radiology", "consultations"]:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_patient_{category}_patient ON patient_{category} (patient_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patient_equipment_patient ON patient_equipment (patient_id, start_date)")
+
+    setup_change_tracking(cursor, ["patients", "patient_stays", "patient_labs", "patient_drugs", "patient_radiology", "patient_consultations", "patient_equipment", "patient_balances"])
     
     conn.commit()
     conn.close()
@@ -295,9 +692,14 @@ def setup_interventions_db():
             default_interventions
         )
     
+    setup_change_tracking(cursor, ["interventions"])
+    
     conn.commit()
     conn.close()
 
+# Default minimum nurse-to-patient ratios of the default care levels
+DEFAULT_PATIENTS_PER_NURSE = {"ICU": 1, "Intermediate ICU": 2, "Ward": 4, "Special Nurse": 1}
+
 def setup_items_db():
     """Setup items database"""
     conn = sqlite3.connect("db/items.db")
@@ -320,10 +722,18 @@ def setup_items_db():
         CREATE TABLE IF NOT EXISTS care_levels (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL UNIQUE,
-            daily_rate REAL NOT NULL
+            daily_rate REAL NOT NULL,
+            patients_per_nurse REAL
         )
     ''')
 
+    # Minimum nurse-to-patient ratio of each care level, as patients per nurse (NULL: no requirement)
+    cursor.execute("PRAGMA table_info(care_levels)")
+    if "patients_per_nurse" not in [info[1] for info in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE care_levels ADD COLUMN patients_per_nurse REAL")
+        cursor.executemany("UPDATE care_levels SET patients_per_nurse = ? WHERE name = ?",
+                           [(ratio, name) for name, ratio in DEFAULT_PATIENTS_PER_NURSE.items()])
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS equipment (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -378,10 +788,12 @@ def setup_items_db():
             ("Special Nurse", 800.0)
         ]
         cursor.executemany(
-            "INSERT INTO care_levels (name, daily_rate) VALUES (?, ?)",
-            default_levels
+            "INSERT INTO care_levels (name, daily_rate, patients_per_nurse) VALUES (?, ?, ?)",
+            [(name, rate, DEFAULT_PATIENTS_PER_NURSE.get(name)) for name, rate in default_levels]
         )
     
+    setup_change_tracking(cursor, ["items", "care_levels", "equipment", "care_level_equipment"])
+    
     conn.commit()
     conn.close()
 
@@ -421,41 +833,37 @@ def calculate_salary_details(employee_type, employee_id, start_date, end_date):
 
     name, hourly_rate = employee
 
-    # Attach patients database
+    # Attach the patients and interventions databases once for both queries
     cursor.execute(f"ATTACH DATABASE '{patients_db_name}' AS patients_db")
+    cursor.execute(f"ATTACH DATABASE '{interventions_db_name}' AS interventions_db")
 
-    # Get detailed shifts
+    # Get detailed shifts, each at the rate it was worked at, with the hours that fall within the period
     cursor.execute(f"""
-        SELECT s.arrival_datetime, s.leave_datetime, p.name 
-        FROM {employee_type}_shifts s
-        JOIN patients_db.patients p ON s.patient_id = p.id
-        WHERE s.{employee_type}_id = ? AND
-              DATE(s.arrival_datetime) BETWEEN ? AND ?
+        SELECT sh.arrival_datetime, sh.leave_datetime, p.name, SUM(d.hours), {shift_rate_sql(employee_type)}
+        FROM {period_tables_sql(employee_type)}
+        JOIN patients_db.patients p ON sh.patient_id = p.id
+        WHERE d.{employee_type}_id = ? AND
+              d.day BETWEEN ? AND ?
+        GROUP BY d.shift_id
+        ORDER BY sh.arrival_datetime
     """, (employee_id, start_date, end_date))
     
     shifts_data = cursor.fetchall()
     
     shifts = []
     total_hours = 0
-    for arrival, leave, patient_name in shifts_data:
-        arrival_dt = datetime.strptime(arrival, "%Y-%m-%d %H:%M:%S")
-        leave_dt = datetime.strptime(leave, "%Y-%m-%d %H:%M:%S")
-        hours = calculate_hours(arrival_dt, leave_dt)
+    base_salary = 0
+    for arrival, leave, patient_name, hours, rate in shifts_data:
         total_hours += hours
+        base_salary += hours * rate
         shifts.append({
             "arrival": arrival,
             "leave": leave,
             "patient": patient_name,
-            "hours": hours
+            "hours": hours,
+            "rate": rate
         })
 
-    # Detach patients database
-    cursor.execute("DETACH DATABASE patients_db")
-    
-    # Attach interventions and patients databases
-    cursor.execute(f"ATTACH DATABASE '{interventions_db_name}' AS interventions_db")
-    cursor.execute(f"ATTACH DATABASE '{patients_db_name}' AS patients_db")
-
     # Get detailed interventions
     cursor.execute(f"""
         SELECT i.name, i.bonus_amount, p.name, di.date
@@ -482,7 +890,6 @@ def calculate_salary_details(employee_type, employee_id, start_date, end_date):
     conn.close()
 
     # Calculate total salary
-    base_salary = total_hours * hourly_rate
     total_salary = base_salary + total_bonus
 
     return {
@@ -506,6 +913,11 @@ def export_to_pdf(filename, data):
 
     text = c.beginText(40, height - 40)
     for line in data:
+        # Start a new page when the text reaches the bottom margin
+        if text.getY() < 40:
+            c.drawText(text)
+            c.showPage()
+            text = c.beginText(40, height - 40)
         text.textLine(line)
 
     c.drawText(text)
@@ -1,43 +1,86 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import sys
+from flask import Flask, render_template, request, redirect, url_for, session, flash, current_app
 import os
 import configparser
 
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 from modules.auth import AuthModule
-from blueprints.doctors import doctors_bp
-from blueprints.nurses import nurses_bp
-from blueprints.patients import patients_bp
-from blueprints.company import company_bp
-from blueprints.settings import settings_bp
-
-app = Flask(__name__)
-app.register_blueprint(doctors_bp)
-app.register_blueprint(nurses_bp)
-app.register_blueprint(patients_bp)
-app.register_blueprint(company_bp)
-app.register_blueprint(settings_bp)
-app.secret_key = os.urandom(24)
+from modules.utils import setup_database
+from modules.catalog import get_catalog
+from .blueprints.doctors import doctors_bp
+from .blueprints.nurses import nurses_bp
+from .blueprints.patients import patients_bp
+from .blueprints.company import company_bp
+from .blueprints.settings import settings_bp
+from .blueprints.jobs import jobs_bp
+from .instrumentation import init_instrumentation
 
 auth_module = AuthModule()
 
-# Read configuration
-config = configparser.ConfigParser()
-config.read('Config/config.ini')
-debug_mode = config.getboolean('DEBUG', 'debugmode', fallback=False)
+def load_secret_key(config):
+    """Return the session secret from config, or from a key file created on first use.
+
+    Every worker process must sign sessions with the same key, so the key is
+    never generated per process. The key file is created with O_EXCL so that
+    concurrent first starts agree on a single key.
+    """
+    secret_key = config.get('WEB', 'secret_key', fallback='').strip()
+    if secret_key:
+        return secret_key
+
+    key_file = config.get('WEB', 'secret_key_file', fallback='instance/secret_key')
+    os.makedirs(os.path.dirname(key_file) or '.', exist_ok=True)
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(32).hex())
+    except FileExistsError:
+        pass
+    with open(key_file) as f:
+        return f.read().strip()
+
+def create_app(config_path='Config/config.ini'):
+    """Build the web application from the given config file.
+
+    Safe to call in the master of a pre-forking WSGI server: it only runs the
+    schema setup and loads the reference catalog, which workers then share
+    read-only. Database connections are opened per request and the job
+    workers start lazily on first use, so both happen after the fork.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+
+    setup_database()
+    get_catalog().load()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = load_secret_key(config)
+    app.config['DEBUG_MODE'] = config.getboolean('DEBUG', 'debugmode', fallback=False)
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SECURE'] = config.getboolean('WEB', 'session_cookie_secure', fallback=False)
+
+    init_instrumentation(app, config)
+
+    app.register_blueprint(doctors_bp)
+    app.register_blueprint(nurses_bp)
+    app.register_blueprint(patients_bp)
+    app.register_blueprint(company_bp)
+    app.register_blueprint(settings_bp)
+    app.register_blueprint(jobs_bp)
+
+    app.before_request(before_request)
+    app.add_url_rule('/login', 'login', login, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+    app.add_url_rule('/', 'index', index)
+
+    return app
 
-@app.before_request
 def before_request():
-    if debug_mode is True :
+    if current_app.config['DEBUG_MODE'] is True :
             session["username"] = "admin"
             session["password"] = "admin123"
     #if debug_mode and 'username' not in session:
         #if request.endpoint and 'static' not in request.endpoint and request.endpoint != 'login':
             #session['username'] = 'admin'
 
-@app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -49,19 +92,17 @@ def login():
             flash('Invalid username or password')
     return render_template('login.html')
 
-@app.route('/logout')
 def logout():
     session.pop('username', None)
     return redirect(url_for('login'))
 
-@app.route('/')
 def index():
-    if debug_mode and 'username' not in session:
+    if current_app.config['DEBUG_MODE'] and 'username' not in session:
         session['username'] = 'admin'
 
     if 'username' not in session:
         return redirect(url_for('login'))
-    
+
     privileges = {
         'view_doctors_tab': auth_module.has_privilege(session['username'], 'view_doctors_tab'),
         'view_nurses_tab': auth_module.has_privilege(session['username'], 'view_nurses_tab'),
@@ -69,8 +110,8 @@ def index():
         'view_reports_tab': auth_module.has_privilege(session['username'], 'view_reports_tab'),
         'view_settings_tab': auth_module.has_privilege(session['username'], 'view_settings_tab'),
     }
-    
+
     return render_template('index.html', username=session['username'], privileges=privileges)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -1,49 +1,154 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import sys
-import os
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, make_response, flash
+from datetime import date
 
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-
-from modules.company.reporting import ReportingHandler
+# Importing these modules registers the company_report and payroll_export job handlers
+import modules.company.reporting
+import modules.payroll_export
 from modules.auth import AuthModule
+from modules.jobs import get_job_queue
+from modules.payroll import STAFF_TYPES, run_payroll, mark_paid, close_payroll, load_payments, month_bounds
+from modules.company.staffing import BUCKETS, staffing_report
+from modules.company.nurse_ratios import ratio_compliance_report
+from ..http_cache import conditional_get, compute_etag, REPORT_SOURCES, STAFFING_SOURCES, RATIO_SOURCES
+from .jobs import job_status
 
 company_bp = Blueprint('company', __name__, template_folder='../templates/company')
 
 auth_module = AuthModule()
 
+def get_report_job(from_date, to_date):
+    """Return the finished or in-progress report job for a date range, queueing one if needed.
+
+    Jobs are keyed by the change counters of the report tables, so a finished
+    job is reused until any of them changes.
+    """
+    key, _ = compute_etag(REPORT_SOURCES, from_date, to_date)
+    job_queue = get_job_queue()
+    job = job_queue.find_finished('company_report', key) or job_queue.find_active('company_report', key)
+    if job:
+        return job
+    job_id = job_queue.submit('company_report', {'from_date': from_date, 'to_date': to_date},
+                              created_by=session['username'], cache_key=key)
+    return job_queue.get(job_id)
+
 @company_bp.route('/company', methods=['GET', 'POST'])
+@conditional_get(REPORT_SOURCES)
 def report():
     if 'username' not in session:
         return redirect(url_for('login'))
-    
-    report_data = None
+
     if request.method == 'POST':
         from_date = request.form['from_date']
         to_date = request.form['to_date']
-        
-        reporting_handler = ReportingHandler(debug_mode=True)
-        patient_revenues = reporting_handler.calculate_patient_revenues(from_date, to_date)
-        doctor_costs = reporting_handler.calculate_doctor_costs(from_date, to_date)
-        nurse_costs = reporting_handler.calculate_nurse_costs(from_date, to_date)
-        
-        total_patient_revenue = patient_revenues['total']
-        pass_through_costs = patient_revenues['operational_cost']
-        total_staff_cost = doctor_costs['total'] + nurse_costs['total']
-        total_operational_cost = total_staff_cost + pass_through_costs
-        net_profit = total_patient_revenue - total_operational_cost
-        
-        report_data = {
-            "from_date": from_date,
-            "to_date": to_date,
-            "total_patient_revenue": total_patient_revenue,
-            "total_staff_cost": total_staff_cost,
-            "pass_through_costs": pass_through_costs,
-            "total_operational_cost": total_operational_cost,
-            "net_profit": net_profit,
-            "doctor_details": doctor_costs['details'],
-            "nurse_details": nurse_costs['details'],
-            "patient_details": patient_revenues['details']
-        }
-        
-    return render_template('report.html', report_data=report_data)
+        if request.accept_mimetypes.best == 'application/json':
+            job = get_report_job(from_date, to_date)
+            return jsonify(job_status(job)), 202
+        # Redirect to a GET URL so the report can be revalidated and bookmarked
+        return redirect(url_for('company.report', from_date=from_date, to_date=to_date))
+
+    report_data = None
+    job = None
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    if from_date and to_date:
+        job = get_report_job(from_date, to_date)
+        if job['status'] == 'done':
+            report_data = job['result']
+
+    response = make_response(render_template('report.html', report_data=report_data, job=job,
+                                             from_date=from_date, to_date=to_date))
+    if job and job['status'] != 'done':
+        # The progress page changes without any table changing, so never revalidate it
+        response.cache_control.no_store = True
+    return response
+
+@company_bp.route('/company/payroll', methods=['GET', 'POST'])
+def payroll():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    today = date.today()
+    year = request.values.get('year', today.year, type=int)
+    month = request.values.get('month', today.month, type=int)
+
+    if request.method == 'POST':
+        action = request.form['action']
+        if action == 'run':
+            written = run_payroll(year, month)
+            flash(f"Computed {sum(written.values())} payment(s) for {year}-{month:02d}")
+        elif action == 'pay':
+            flash(f"Marked {mark_paid(year, month)} payment(s) as paid")
+        elif action == 'close':
+            flash(f"Closed {close_payroll(year, month)} payment(s)")
+        return redirect(url_for('company.payroll', year=year, month=month))
+
+    payments = {staff_type: load_payments(staff_type, year, month) for staff_type in STAFF_TYPES}
+    from_date, to_date = month_bounds(year, month)
+    job = None
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = get_job_queue().get(job_id)
+    return render_template('payroll.html', year=year, month=month, payments=payments,
+                           from_date=from_date, to_date=to_date, job=job)
+
+@company_bp.route('/company/payroll/export', methods=['POST'])
+def payroll_export():
+    """Start a payroll workbook export for all staff; the payroll page polls the job"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    params = {'from_date': request.form['from_date'], 'to_date': request.form['to_date']}
+    job_id = get_job_queue().submit('payroll_export', params, created_by=session['username'])
+    return redirect(url_for('company.payroll', year=request.form.get('year'), month=request.form.get('month'), job_id=job_id))
+
+def _chart_points(rows, key, scale):
+    """SVG polyline points for one series, x = row index and y = 100 at zero down to 0 at scale"""
+    return " ".join(f"{index},{100 - row[key] / scale * 100:.2f}" for index, row in enumerate(rows))
+
+@company_bp.route('/company/staffing')
+@conditional_get(STAFFING_SOURCES)
+def staffing():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in BUCKETS:
+        bucket = 'hour'
+
+    staffing_data = None
+    charts = {}
+    error = None
+    if from_date and to_date:
+        try:
+            staffing_data = staffing_report(from_date, to_date, bucket)
+        except ValueError:
+            error = "Invalid dates. Please use YYYY-MM-DD."
+        if staffing_data:
+            scale = max(max(staffing_data['peak'].values()), 1)
+            for name, rows in [('timeline', staffing_data['buckets']), ('profile', staffing_data['profile'])]:
+                charts[name] = {
+                    'width': max(len(rows) - 1, 1),
+                    'series': {staff_type: _chart_points(rows, f"{staff_type}_average", scale) for staff_type in STAFF_TYPES},
+                }
+            charts['scale'] = scale
+    return render_template('staffing.html', staffing=staffing_data, charts=charts, error=error,
+                           from_date=from_date, to_date=to_date, bucket=bucket)
+
+@company_bp.route('/company/nurse_ratios')
+@conditional_get(RATIO_SOURCES)
+def nurse_ratios():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    compliance = None
+    error = None
+    if from_date and to_date:
+        try:
+            compliance = ratio_compliance_report(from_date, to_date)
+        except ValueError:
+            error = "Invalid dates. Please use YYYY-MM-DD."
+    return render_template('nurse_ratios.html', compliance=compliance, error=error, from_date=from_date, to_date=to_date)
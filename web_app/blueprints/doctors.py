@@ -1,17 +1,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import sys
-import os
 from datetime import datetime
-
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import os
+import tempfile
 
 from modules.doctor.crud import DoctorCRUD
 from modules.doctor.shifts import ShiftsHandler
 from modules.doctor.interventions import InterventionsHandler
 from modules.doctor.salary import SalaryHandler
 from modules.auth import AuthModule
-from modules.utils import calculate_salary_details
+from modules.payroll import salary_summary
+from modules.shift_import import import_shifts
+from modules.roster import add_template, delete_template, load_templates, roster_shifts
 
 doctors_bp = Blueprint('doctors', __name__, template_folder='../templates/doctors')
 
@@ -106,6 +105,94 @@ def add_shift(doctor_id):
         flash("Error adding shift. Check for overlaps.")
     return redirect(url_for('doctors.view_shifts', doctor_id=doctor_id))
 
+@doctors_bp.route('/doctors/shifts/import', methods=['GET', 'POST'])
+def import_timesheet():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('timesheet')
+        extension = os.path.splitext(upload.filename)[1].lower() if upload and upload.filename else ""
+        if extension not in ('.csv', '.xlsx'):
+            flash("Please choose a CSV or XLSX timesheet.")
+            return redirect(url_for('doctors.import_timesheet'))
+
+        with tempfile.TemporaryDirectory(prefix="timesheet_") as upload_dir:
+            filename = os.path.join(upload_dir, "timesheet" + extension)
+            upload.save(filename)
+            result = import_shifts("doctor", filename, dry_run='dry_run' in request.form)
+        if result is None:
+            flash("Error importing shifts.")
+        elif result.get('error'):
+            flash(result['error'])
+        elif 'dry_run' in request.form:
+            flash(f"{result['valid']} valid shift(s), {len(result['rejects'])} rejected. Nothing was imported.")
+        else:
+            auth_module.log_action(session['username'], "IMPORT_SHIFTS",
+                                   f"Imported {result['imported']} doctor shift(s) from {upload.filename}, {len(result['rejects'])} rejected")
+            flash(f"Imported {result['imported']} shift(s), {len(result['rejects'])} rejected.")
+
+    return render_template('doctors/import_shifts.html', result=result)
+
+@doctors_bp.route('/doctors/<int:doctor_id>/roster')
+def view_roster(doctor_id, preview=None):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    doctor_crud = DoctorCRUD(WebDoctorModule(), auth_module)
+    doctor = doctor_crud.get_doctor(doctor_id)
+    doctor_name = doctor[1] if doctor else "Unknown"
+    templates = load_templates("doctor", doctor_id)
+    return render_template('doctors/roster.html', templates=templates, doctor_id=doctor_id, doctor_name=doctor_name, preview=preview)
+
+@doctors_bp.route('/doctors/<int:doctor_id>/roster/add', methods=['POST'])
+def add_roster_template(doctor_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    name = request.form['name']
+    if add_template("doctor", doctor_id, request.form['patient_id'], name, request.form['start_time'],
+                    request.form['shift_hours'], request.form['days_on'], request.form['days_off'],
+                    request.form['anchor_date']):
+        flash(f"Roster template {name} added")
+    else:
+        flash("Error adding roster template. Check the start time, shift length and rotation.")
+    return redirect(url_for('doctors.view_roster', doctor_id=doctor_id))
+
+@doctors_bp.route('/doctors/<int:doctor_id>/roster/<int:template_id>/delete')
+def delete_roster_template(doctor_id, template_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    if delete_template("doctor", template_id, doctor_id):
+        flash("Roster template deleted")
+    else:
+        flash("Error deleting roster template")
+    return redirect(url_for('doctors.view_roster', doctor_id=doctor_id))
+
+@doctors_bp.route('/doctors/<int:doctor_id>/roster/<int:template_id>/expand', methods=['POST'])
+def expand_roster_template(doctor_id, template_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    apply = request.form.get('action') == 'apply'
+    from_date, to_date = request.form['from_date'], request.form['to_date']
+    try:
+        result = roster_shifts("doctor", template_id, from_date, to_date, apply=apply, staff_id=doctor_id)
+    except ValueError as e:
+        flash(f"Invalid date range. {e}.")
+        return redirect(url_for('doctors.view_roster', doctor_id=doctor_id))
+
+    if result is None:
+        flash("Error expanding roster template")
+    elif apply:
+        auth_module.log_action(session['username'], "ROSTER_SHIFTS",
+                               f"Created {result['applied']} shift(s) for doctor ID {doctor_id} from roster template {template_id}, {from_date} to {to_date}")
+        flash(f"Created {result['applied']} shift(s), skipped {len(result['rejects'])} overlapping or in a closed payroll month.")
+        return redirect(url_for('doctors.view_shifts', doctor_id=doctor_id))
+    return view_roster(doctor_id, preview=result)
+
 @doctors_bp.route('/doctors/shifts/delete/<int:shift_id>')
 def delete_shift(shift_id):
     if 'username' not in session:
@@ -181,7 +268,7 @@ def calculate_salary(doctor_id):
         start_date = request.form['start_date']
         end_date = request.form['end_date']
         
-        salary_details = calculate_salary_details("doctor", doctor_id, start_date, end_date)
+        salary_details = salary_summary("doctor", doctor_id, start_date, end_date)
         
         return render_template('doctors/salary.html', salary_details=salary_details, doctor_id=doctor_id, doctor_name=doctor_name)
         
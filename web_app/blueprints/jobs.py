@@ -0,0 +1,50 @@
+from flask import Blueprint, request, redirect, url_for, session, jsonify, send_file, abort
+import os
+
+from modules.jobs import get_job_queue
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def get_job_or_404(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        abort(404)
+    return job
+
+def job_status(job):
+    """Return the JSON-serialisable status of a job, without its result payload"""
+    status = {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'download_url': None,
+    }
+    if job['status'] == 'done' and job['result_path']:
+        status['download_url'] = url_for('jobs.download', job_id=job['id'])
+    return status
+
+@jobs_bp.route('/jobs/<job_id>')
+def status(job_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    job = get_job_or_404(job_id)
+    response = jsonify(job_status(job))
+    response.cache_control.no_store = True
+    return response
+
+@jobs_bp.route('/jobs/<job_id>/download')
+def download(job_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    job = get_job_or_404(job_id)
+    if job['status'] != 'done' or not job['result_path'] or not os.path.exists(job['result_path']):
+        abort(404)
+    return send_file(os.path.abspath(job['result_path']), as_attachment=True)
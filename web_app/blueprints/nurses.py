@@ -1,17 +1,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import sys
-import os
 from datetime import datetime
-
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import os
+import tempfile
 
 from modules.nurse.crud import NurseCRUD
 from modules.nurse.shifts import ShiftsHandler
 from modules.nurse.interventions import InterventionsHandler
 from modules.nurse.salary import SalaryHandler
 from modules.auth import AuthModule
-from modules.utils import calculate_salary_details
+from modules.payroll import salary_summary
+from modules.shift_import import import_shifts
+from modules.roster import add_template, delete_template, load_templates, roster_shifts
 
 nurses_bp = Blueprint('nurses', __name__, template_folder='../templates/nurses')
 
@@ -109,6 +108,94 @@ def add_shift(nurse_id):
         flash("Error adding shift. Check for overlaps.")
     return redirect(url_for('nurses.view_shifts', nurse_id=nurse_id))
 
+@nurses_bp.route('/nurses/shifts/import', methods=['GET', 'POST'])
+def import_timesheet():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('timesheet')
+        extension = os.path.splitext(upload.filename)[1].lower() if upload and upload.filename else ""
+        if extension not in ('.csv', '.xlsx'):
+            flash("Please choose a CSV or XLSX timesheet.")
+            return redirect(url_for('nurses.import_timesheet'))
+
+        with tempfile.TemporaryDirectory(prefix="timesheet_") as upload_dir:
+            filename = os.path.join(upload_dir, "timesheet" + extension)
+            upload.save(filename)
+            result = import_shifts("nurse", filename, dry_run='dry_run' in request.form)
+        if result is None:
+            flash("Error importing shifts.")
+        elif result.get('error'):
+            flash(result['error'])
+        elif 'dry_run' in request.form:
+            flash(f"{result['valid']} valid shift(s), {len(result['rejects'])} rejected. Nothing was imported.")
+        else:
+            auth_module.log_action(session['username'], "IMPORT_SHIFTS",
+                                   f"Imported {result['imported']} nurse shift(s) from {upload.filename}, {len(result['rejects'])} rejected")
+            flash(f"Imported {result['imported']} shift(s), {len(result['rejects'])} rejected.")
+
+    return render_template('nurses/import_shifts.html', result=result)
+
+@nurses_bp.route('/nurses/<int:nurse_id>/roster')
+def view_roster(nurse_id, preview=None):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    nurse_crud = NurseCRUD(WebNurseModule(), auth_module)
+    nurse = nurse_crud.get_nurse(nurse_id)
+    nurse_name = nurse[1] if nurse else "Unknown"
+    templates = load_templates("nurse", nurse_id)
+    return render_template('nurses/roster.html', templates=templates, nurse_id=nurse_id, nurse_name=nurse_name, preview=preview)
+
+@nurses_bp.route('/nurses/<int:nurse_id>/roster/add', methods=['POST'])
+def add_roster_template(nurse_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    name = request.form['name']
+    if add_template("nurse", nurse_id, request.form['patient_id'], name, request.form['start_time'],
+                    request.form['shift_hours'], request.form['days_on'], request.form['days_off'],
+                    request.form['anchor_date'], request.form.get('nurse_level_id')):
+        flash(f"Roster template {name} added")
+    else:
+        flash("Error adding roster template. Check the start time, shift length and rotation.")
+    return redirect(url_for('nurses.view_roster', nurse_id=nurse_id))
+
+@nurses_bp.route('/nurses/<int:nurse_id>/roster/<int:template_id>/delete')
+def delete_roster_template(nurse_id, template_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    if delete_template("nurse", template_id, nurse_id):
+        flash("Roster template deleted")
+    else:
+        flash("Error deleting roster template")
+    return redirect(url_for('nurses.view_roster', nurse_id=nurse_id))
+
+@nurses_bp.route('/nurses/<int:nurse_id>/roster/<int:template_id>/expand', methods=['POST'])
+def expand_roster_template(nurse_id, template_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    apply = request.form.get('action') == 'apply'
+    from_date, to_date = request.form['from_date'], request.form['to_date']
+    try:
+        result = roster_shifts("nurse", template_id, from_date, to_date, apply=apply, staff_id=nurse_id)
+    except ValueError as e:
+        flash(f"Invalid date range. {e}.")
+        return redirect(url_for('nurses.view_roster', nurse_id=nurse_id))
+
+    if result is None:
+        flash("Error expanding roster template")
+    elif apply:
+        auth_module.log_action(session['username'], "ROSTER_SHIFTS",
+                               f"Created {result['applied']} shift(s) for nurse ID {nurse_id} from roster template {template_id}, {from_date} to {to_date}")
+        flash(f"Created {result['applied']} shift(s), skipped {len(result['rejects'])} overlapping or in a closed payroll month.")
+        return redirect(url_for('nurses.view_shifts', nurse_id=nurse_id))
+    return view_roster(nurse_id, preview=result)
+
 @nurses_bp.route('/nurses/shifts/delete/<int:shift_id>')
 def delete_shift(shift_id):
     if 'username' not in session:
@@ -182,7 +269,7 @@ def calculate_salary(nurse_id):
         start_date = request.form['start_date']
         end_date = request.form['end_date']
         
-        salary_details = calculate_salary_details("nurse", nurse_id, start_date, end_date)
+        salary_details = salary_summary("nurse", nurse_id, start_date, end_date)
         
         return render_template('nurses/salary.html', salary_details=salary_details, nurse_id=nurse_id, nurse_name=nurse_name)
         
@@ -1,18 +1,18 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import sys
-import os
-
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 
 from modules.patient.crud import PatientCRUD
 from modules.patient.stays import StaysHandler
 from modules.patient.items import ItemsHandler
 from modules.patient.equipment import EquipmentHandler
-from modules.patient.costing import CostingHandler
+from modules.patient.billing import PatientBillEngine
+from modules.patient.timeline import parse_cursor, timeline_page
+# Importing batch_billing registers the batch_billing job handler
+import modules.patient.batch_billing
+from modules.jobs import get_job_queue
 from modules.auth import AuthModule
-from modules.settings.item_management import ItemManagementHandler
-from modules.settings.equipment_management import EquipmentManagementHandler
+from modules.catalog import get_catalog
+from ..http_cache import conditional_get, CATALOG_ITEMS, CATALOG_CARE_LEVELS, CATALOG_EQUIPMENT, PATIENTS, PATIENT_BALANCES, BILL_SOURCES
+from .jobs import job_status
 
 patients_bp = Blueprint('patients', __name__, template_folder='../templates/patients')
 
@@ -26,6 +26,7 @@ class WebPatientModule:
         pass
 
 @patients_bp.route('/patients')
+@conditional_get(PATIENT_BALANCES)
 def list_patients():
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -74,6 +75,7 @@ def edit_patient(patient_id):
     return render_template('edit_patient.html', patient=patient)
 
 @patients_bp.route('/patients/<int:patient_id>/stays', methods=['GET', 'POST'])
+@conditional_get(PATIENTS + CATALOG_CARE_LEVELS + [("patients", "patient_stays")])
 def view_stays(patient_id):
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -101,9 +103,21 @@ def view_stays(patient_id):
     
     return render_template('stays.html', stays=stays, care_levels=care_levels, patient_id=patient_id, patient_name=patient_name)
 
-class WebSettingsModule:
-    def __init__(self):
-        self.parent = None
+@patients_bp.route('/patients/<int:patient_id>/stays/range', methods=['POST'])
+def add_stay_range(patient_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    start_date = request.form['start_date']
+    end_date = request.form['end_date']
+    care_level_id = request.form['care_level_id']
+
+    stays_handler = StaysHandler(WebPatientModule())
+    if stays_handler.add_stay_range(patient_id, start_date, end_date, care_level_id, session['username']):
+        flash(f"Stays from {start_date} to {end_date} added successfully")
+        return redirect(url_for('patients.view_equipment', patient_id=patient_id))
+    flash("Error adding stays")
+    return redirect(url_for('patients.view_stays', patient_id=patient_id))
 
 @patients_bp.route('/patients/confirm_stay', methods=['GET', 'POST'])
 def confirm_stay():
@@ -122,8 +136,8 @@ def confirm_stay():
     print(f"--- Confirming stay for patient: {patient_name} ({patient_id}) ---")
     print(f"Pending stay details: {pending_stay}")
 
-    equipment_management_handler = EquipmentManagementHandler(WebSettingsModule())
-    default_equipment = equipment_management_handler.load_assigned_equipment(int(care_level_id))
+    catalog = get_catalog()
+    default_equipment = catalog.care_level_equipment(care_level_id)
     
     print(f"Default equipment for care level {care_level_id}: {default_equipment}")
 
@@ -133,7 +147,6 @@ def confirm_stay():
             flash("Stay added successfully")
 
             equipment_handler = EquipmentHandler(WebPatientModule())
-            all_equipment = equipment_handler.load_equipment()
             
             from datetime import datetime, timedelta
             start_date = datetime.strptime(stay_date, '%Y-%m-%d')
@@ -142,7 +155,7 @@ def confirm_stay():
             print("--- Adding default equipment ---")
             for equip in default_equipment:
                 equipment_id = equip[1]
-                daily_price = next((eq[2] for eq in all_equipment if eq[0] == int(equipment_id)), 0)
+                daily_price = catalog.equipment_price(equipment_id)
                 print(f"Adding equipment ID {equipment_id} with price {daily_price} for patient {patient_id}")
                 equipment_handler.add_equipment(patient_id, equipment_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), daily_price, session['username'])
             
@@ -174,6 +187,7 @@ def delete_stay(stay_id):
     return redirect(url_for('patients.view_stays', patient_id=patient_id))
 
 @patients_bp.route('/patients/<int:patient_id>/items/<category>', methods=['GET', 'POST'])
+@conditional_get(PATIENTS + CATALOG_ITEMS + [("patients", f"patient_{category}") for category in ["labs", "drugs", "radiology", "consultations"]])
 def view_items(patient_id, category):
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -195,12 +209,7 @@ def view_items(patient_id, category):
         return redirect(url_for('patients.view_items', patient_id=patient_id, category=category))
         
     items = items_handler.load_category_items(patient_id, category)
-    
-    # This is not ideal, but we need to get the item list for the form
-    class WebSettingsModule:
-        def __init__(self):
-            self.parent = None
-    all_items = ItemManagementHandler(WebSettingsModule()).load_items(category)
+    all_items = get_catalog().items(category)
     
     return render_template('items.html', items=items, all_items=all_items, patient_id=patient_id, category=category, patient_name=patient_name)
 
@@ -218,6 +227,7 @@ def delete_item(category, record_id):
     return redirect(url_for('patients.view_items', patient_id=patient_id, category=category))
 
 @patients_bp.route('/patients/<int:patient_id>/equipment', methods=['GET', 'POST'])
+@conditional_get(PATIENTS + CATALOG_EQUIPMENT + [("patients", "patient_equipment")])
 def view_equipment(patient_id):
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -231,9 +241,7 @@ def view_equipment(patient_id):
     if request.method == 'POST':
         equipment_id = request.form['equipment_id']
         
-        # Get the equipment details to fetch the price
-        all_equipment = equipment_handler.load_equipment()
-        daily_price = next((eq[2] for eq in all_equipment if eq[0] == int(equipment_id)), 0)
+        daily_price = get_catalog().equipment_price(equipment_id)
 
         from datetime import datetime, timedelta
         start_date = datetime.now().strftime('%Y-%m-%d')
@@ -263,6 +271,19 @@ def delete_equipment(record_id):
         flash("Error deleting equipment")
     return redirect(url_for('patients.view_equipment', patient_id=patient_id))
 
+@patients_bp.route('/patients/equipment/end/<int:record_id>', methods=['POST'])
+def end_equipment(record_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    equipment_handler = EquipmentHandler(WebPatientModule())
+    patient_id = request.args.get('patient_id')
+    if equipment_handler.end_equipment(record_id, request.form['end_date'], request.form.get('resume_date'), session['username']):
+        flash("Equipment rental ended successfully")
+    else:
+        flash("Error ending equipment rental. Please pick an end date after the start date and before the current end date.")
+    return redirect(url_for('patients.view_equipment', patient_id=patient_id))
+
 @patients_bp.route('/patients/delete/<int:patient_id>')
 def delete_patient(patient_id):
     if 'username' not in session:
@@ -276,23 +297,80 @@ def delete_patient(patient_id):
     return redirect(url_for('patients.list_patients'))
 
 @patients_bp.route('/patients/<int:patient_id>/costing')
+@conditional_get(BILL_SOURCES)
 def view_costing(patient_id):
     if 'username' not in session:
         return redirect(url_for('login'))
-    
-    patient_crud = PatientCRUD(WebPatientModule(), auth_module)
-    patient = patient_crud.get_patient(patient_id)
-    patient_name = patient[1] if patient else "Unknown"
-    
-    class MockPatientModule:
-        def __init__(self):
-            self.current_patient_id = patient_id
-            self.crud_handler = PatientCRUD(self, auth_module)
-            self.parent = None
-        def get_selected_patients(self):
-            return [self.current_patient_id]
-
-    costing_handler = CostingHandler(MockPatientModule())
-    cost_details = costing_handler.calculate_cost()
-    
-    return render_template('costing.html', cost_details=cost_details, patient_id=patient_id, patient_name=patient_name)
+
+    bill = PatientBillEngine().compute_bill(patient_id)
+    patient_name = bill['patient']['name'] if bill else "Unknown"
+
+    return render_template('costing.html', bill=bill, patient_id=patient_id, patient_name=patient_name)
+
+@patients_bp.route('/patients/<int:patient_id>/timeline')
+@conditional_get(BILL_SOURCES)
+def patient_timeline(patient_id):
+    """One page of a patient's merged history; follow 'next' for the following page"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    after = request.args.get('after')
+    if after:
+        try:
+            parse_cursor(after)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    page = timeline_page(
+        patient_id,
+        after=after,
+        limit=min(request.args.get('limit', 50, type=int), 500),
+        from_date=request.args.get('from'),
+        to_date=request.args.get('to'),
+    )
+    if page['next']:
+        args = {key: value for key, value in request.args.items() if key != 'after'}
+        page['next_url'] = url_for('patients.patient_timeline', patient_id=patient_id, after=page['next'], **args)
+    return jsonify(page)
+
+@patients_bp.route('/patients/equipment/compact', methods=['POST'])
+def compact_equipment():
+    """Start merging back-to-back equipment rental rows; poll the returned job for progress"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    queue = get_job_queue()
+    job = queue.get(queue.submit('compact_rentals', {}, created_by=session['username']))
+    return jsonify(job_status(job)), 202
+
+@patients_bp.route('/patients/orphans/sweep', methods=['POST'])
+def sweep_orphans():
+    """Start deleting rows left behind by deleted patients and staff; poll the returned job for progress"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    queue = get_job_queue()
+    job = queue.get(queue.submit('sweep_orphans', {}, created_by=session['username']))
+    return jsonify(job_status(job)), 202
+
+@patients_bp.route('/patients/batch_billing', methods=['GET', 'POST'])
+def batch_billing():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+
+    if request.method == 'POST':
+        params = {
+            'discharged_from': request.form.get('discharged_from') or None,
+            'discharged_to': request.form.get('discharged_to') or None,
+            'status': request.form.get('status') or None,
+            'formats': ['xlsx', 'pdf'] if request.form.get('pdf') else ['xlsx'],
+        }
+        job_id = get_job_queue().submit('batch_billing', params, created_by=session['username'])
+        return redirect(url_for('patients.batch_billing', job_id=job_id))
+
+    job = None
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = get_job_queue().get(job_id)
+
+    return render_template('batch_billing.html', job=job)
@@ -1,15 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import sys
-import os
-
-# Add the parent directory to the path to allow imports from the 'modules' directory
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
 from modules.auth import AuthModule
 from modules.settings.user_management import UserManagementHandler
 from modules.settings.care_level_management import CareLevelManagementHandler
 from modules.settings.equipment_management import EquipmentManagementHandler
 from modules.settings.item_management import ItemManagementHandler
+from ..http_cache import conditional_get, CATALOG_ITEMS, CATALOG_CARE_LEVELS, CATALOG_EQUIPMENT
 
 settings_bp = Blueprint('settings', __name__, template_folder='../templates/settings')
 
@@ -45,9 +41,10 @@ def add_care_level():
     if request.method == 'POST':
         name = request.form['name']
         rate = request.form['rate']
+        patients_per_nurse = request.form.get('patients_per_nurse')
         
         care_level_management_handler = CareLevelManagementHandler(WebSettingsModule())
-        if care_level_management_handler.add_care_level(name, rate):
+        if care_level_management_handler.add_care_level(name, rate, patients_per_nurse):
             flash(f"Care level {name} added successfully")
         else:
             flash(f"Error adding care level {name}")
@@ -65,7 +62,8 @@ def edit_care_level(care_level_id):
     if request.method == 'POST':
         name = request.form['name']
         rate = request.form['rate']
-        if care_level_management_handler.edit_care_level(care_level_id, name, rate):
+        patients_per_nurse = request.form.get('patients_per_nurse')
+        if care_level_management_handler.edit_care_level(care_level_id, name, rate, patients_per_nurse):
             flash(f"Care level {name} updated successfully")
         else:
             flash(f"Error updating care level {name}")
@@ -87,6 +85,7 @@ def delete_care_level(care_level_id):
     return redirect(url_for('settings.care_levels'))
 
 @settings_bp.route('/settings/care_levels')
+@conditional_get(CATALOG_CARE_LEVELS)
 def care_levels():
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -146,6 +145,7 @@ def delete_equipment(equipment_id):
     return redirect(url_for('settings.equipment'))
 
 @settings_bp.route('/settings/equipment')
+@conditional_get(CATALOG_EQUIPMENT)
 def equipment():
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -156,6 +156,7 @@ def equipment():
     return render_template('settings_equipment.html', equipment=equipment)
 
 @settings_bp.route('/settings/care_level_equipment', methods=['GET'])
+@conditional_get(CATALOG_CARE_LEVELS + CATALOG_EQUIPMENT)
 def manage_care_level_equipment():
     if 'username' not in session:
         return redirect(url_for('login'))
@@ -204,6 +205,7 @@ def unassign_equipment_from_care_level(care_level_id, equipment_id):
     return redirect(url_for('settings.manage_care_level_equipment', care_level_id=care_level_id))
 
 @settings_bp.route('/settings/items')
+@conditional_get(CATALOG_ITEMS)
 def items():
     if 'username' not in session:
         return redirect(url_for('login'))
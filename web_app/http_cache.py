@@ -0,0 +1,79 @@
+from functools import wraps
+import hashlib
+from flask import request, session, make_response
+
+from modules.utils import get_change_stamp
+
+# (database, table) pairs that each page is rendered from
+CATALOG_ITEMS = [("items", "items"), ("interventions", "interventions")]
+CATALOG_CARE_LEVELS = [("items", "care_levels")]
+CATALOG_EQUIPMENT = [("items", "equipment"), ("items", "care_level_equipment")]
+PATIENTS = [("patients", "patients")]
+PATIENT_BALANCES = PATIENTS + [("patients", "patient_balances")]
+REPORT_SOURCES = [
+    ("patients", "patients"), ("patients", "patient_stays"), ("patients", "patient_labs"),
+    ("patients", "patient_drugs"), ("patients", "patient_radiology"), ("patients", "patient_consultations"),
+    ("patients", "patient_equipment"),
+    ("doctors", "doctors"), ("doctors", "doctor_shifts"), ("doctors", "doctor_interventions"),
+    ("nurses", "nurses"), ("nurses", "nurse_levels"), ("nurses", "nurse_shifts"), ("nurses", "nurse_interventions"),
+    ("items", "care_levels"),
+    ("interventions", "interventions"),
+]
+STAFFING_SOURCES = [
+    ("doctors", "doctors"), ("doctors", "doctor_shifts"),
+    ("nurses", "nurses"), ("nurses", "nurse_shifts"),
+]
+RATIO_SOURCES = [
+    ("patients", "patients"), ("patients", "patient_stays"),
+    ("nurses", "nurses"), ("nurses", "nurse_shifts"),
+    ("items", "care_levels"),
+]
+# Bills also show item and equipment names
+BILL_SOURCES = REPORT_SOURCES + [("items", "items"), ("items", "equipment")]
+
+
+def compute_etag(sources, *extra):
+    """Build an ETag and Last-Modified time from the change counters of the given tables"""
+    stamp = get_change_stamp(sources)
+    parts = stamp["versions"] + [str(value) for value in extra]
+    etag = hashlib.sha1("|".join(parts).encode()).hexdigest()
+    return etag, stamp["last_changed"]
+
+
+def conditional_get(sources):
+    """Answer 304 Not Modified for GET requests when none of the source tables changed.
+
+    The ETag covers the table change counters, the logged in user and the full
+    request URL, so each user and each query string gets its own validator.
+    Requests with pending flash messages are always rendered in full, and
+    responses the view marks no-store are passed through without validators.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or 'username' not in session or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            etag, last_modified = compute_etag(sources, session['username'], request.full_path)
+
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since and last_modified:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.cache_control.no_store:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
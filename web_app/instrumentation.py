@@ -0,0 +1,249 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from flask import request, g, current_app, Response
+
+# Prometheus default latency buckets, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+SLOWEST_STATEMENTS = 10
+
+_original_connect = sqlite3.connect
+_state = threading.local()
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and literals so repeated statements group together"""
+    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = re.sub(r"'[^']*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    return sql[:200]
+
+
+class RequestRecorder:
+    """SQL activity recorded for the request running on the current thread"""
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.lock_errors = 0
+        self.statements = Counter()
+        self.timings = {}
+
+    def trace(self, sql):
+        self.query_count += 1
+        self.statements[normalize_sql(sql)] += 1
+
+    def add_time(self, sql, elapsed):
+        self.sql_time += elapsed
+        key = normalize_sql(sql)
+        self.timings[key] = self.timings.get(key, 0.0) + elapsed
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute and fetch calls against the active recorder.
+
+    SQLite steps through result rows lazily, so fetch time is charged to the
+    statement that produced the rows.
+    """
+    def _timed(self, sql, call, *args):
+        recorder = getattr(_state, 'recorder', None)
+        if recorder is None:
+            return call(*args)
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                recorder.lock_errors += 1
+            raise
+        finally:
+            recorder.add_time(sql, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        self._last_sql = sql
+        return self._timed(sql, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._last_sql = sql
+        return self._timed(sql, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._last_sql = sql_script
+        return self._timed(sql_script, super().executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed(getattr(self, '_last_sql', ''), super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed(getattr(self, '_last_sql', ''), super().fetchmany)
+        return self._timed(getattr(self, '_last_sql', ''), super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(getattr(self, '_last_sql', ''), super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind conn.execute, are instrumented"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        try:
+            return super().commit()
+        except sqlite3.OperationalError as e:
+            recorder = getattr(_state, 'recorder', None)
+            if recorder is not None and 'locked' in str(e):
+                recorder.lock_errors += 1
+            raise
+
+
+def _trace(sql):
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is not None:
+        recorder.trace(sql)
+
+
+def current_recorder():
+    """Return the RequestRecorder of the request running on this thread, or None"""
+    return getattr(_state, 'recorder', None)
+
+
+def instrumented_connect(*args, **kwargs):
+    kwargs.setdefault('factory', InstrumentedConnection)
+    return _original_connect(*args, **kwargs)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    """Per-process request and SQL metrics, rendered in Prometheus text format.
+
+    Each worker process of a multi-process server keeps its own metrics, so
+    the scraper sees one series per worker it happens to reach.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.lock_errors = Counter()
+        self.latency = {}
+        self.query_counts = {}
+        self.sql_seconds = {}
+        self.slowest = {}
+
+    def record(self, method, endpoint, status, duration, recorder):
+        with self._lock:
+            self.requests[(method, endpoint, status)] += 1
+            key = (method, endpoint)
+            self.lock_errors[key] += recorder.lock_errors
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.query_counts.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(recorder.query_count)
+            self.sql_seconds.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(recorder.sql_time)
+            for sql, elapsed in recorder.timings.items():
+                if elapsed > self.slowest.get(sql, 0.0):
+                    self.slowest[sql] = elapsed
+            if len(self.slowest) > SLOWEST_STATEMENTS:
+                keep = sorted(self.slowest.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_STATEMENTS]
+                self.slowest = dict(keep)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append("# HELP http_requests_total Requests handled, by method, endpoint and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+            lines.append("# HELP sql_lock_errors_total 'database is locked' errors raised while handling requests.")
+            lines.append("# TYPE sql_lock_errors_total counter")
+            for (method, endpoint), count in sorted(self.lock_errors.items()):
+                lines.append(f'sql_lock_errors_total{{method="{method}",endpoint="{endpoint}"}} {count}')
+            self._render_histograms(lines, "http_request_duration_seconds", "Request wall time.", self.latency)
+            self._render_histograms(lines, "http_request_sql_queries", "SQL statements run per request.", self.query_counts)
+            self._render_histograms(lines, "http_request_sql_seconds", "Time spent in SQL per request.", self.sql_seconds)
+            lines.append("# HELP sql_statement_slowest_seconds Slowest time seen per statement within one request.")
+            lines.append("# TYPE sql_statement_slowest_seconds gauge")
+            for sql, elapsed in sorted(self.slowest.items(), key=lambda item: item[1], reverse=True):
+                statement = sql.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'sql_statement_slowest_seconds{{statement="{statement}"}} {elapsed:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def _render_histograms(self, lines, name, help_text, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (method, endpoint), histogram in sorted(histograms.items()):
+            labels = f'method="{method}",endpoint="{endpoint}"'
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.total}')
+
+
+metrics = Metrics()
+
+
+def init_instrumentation(app, config):
+    """Install the sqlite3 hooks, the request timing middleware and the /metrics endpoint"""
+    if not config.getboolean('METRICS', 'enabled', fallback=True):
+        return
+    threshold = config.getint('METRICS', 'n_plus_one_threshold', fallback=50)
+
+    sqlite3.connect = instrumented_connect
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        _state.recorder = RequestRecorder()
+
+    @app.after_request
+    def record_request(response):
+        recorder = getattr(_state, 'recorder', None)
+        if recorder is None or 'request_start' not in g:
+            return response
+        duration = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint != 'metrics':
+            metrics.record(request.method, endpoint, response.status_code, duration, recorder)
+        if recorder.query_count > threshold:
+            repeated = ", ".join(f"{count}x {sql}" for sql, count in recorder.statements.most_common(3))
+            current_app.logger.warning(
+                f"Possible N+1: {request.method} {request.path} ran {recorder.query_count} queries "
+                f"({recorder.sql_time * 1000:.1f} ms SQL, {duration * 1000:.1f} ms total). Most repeated: {repeated}"
+            )
+        return response
+
+    @app.teardown_request
+    def clear_recorder(exc):
+        _state.recorder = None
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
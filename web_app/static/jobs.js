@@ -0,0 +1,15 @@
+// Poll a background job's status URL until it finishes or fails.
+function pollJob(statusUrl, handlers) {
+    fetch(statusUrl, {credentials: "same-origin"})
+        .then(function (response) { return response.json(); })
+        .then(function (status) {
+            if (status.status === "done") {
+                handlers.done(status);
+            } else if (status.status === "failed") {
+                handlers.failed(status);
+            } else {
+                handlers.progress(status);
+                setTimeout(function () { pollJob(statusUrl, handlers); }, 1000);
+            }
+        });
+}
@@ -0,0 +1,9 @@
+"""WSGI entry point.
+
+Run from the project root so the relative db/ and Config/ paths resolve, e.g.
+
+    gunicorn --preload --workers 4 web_app.wsgi:app
+"""
+from .app import create_app
+
+app = create_app()